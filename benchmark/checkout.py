@@ -0,0 +1,118 @@
+# -*- coding:utf-8 -*-
+"""
+Measures the wall time and the disk usage of CiVersionEntity.CheckOut with different checkout options, on a
+synthetic superproject with a long history and several submodules served over file://, no server is required.
+The "warm mirror" modes clone by "--reference" to a bare mirror of the superproject fetched beforehand, see
+GitMirrorCache.
+
+Usage:
+    python benchmark/checkout.py [commit_count] [submodule_count]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from smartci.vcs.git.git_mirror import GitMirrorCache
+from smartci.vcs.git.git_util import GitUtil
+
+MODES = [
+    ("full clone (before)", {"depth": None, "filter": None, "shallow_submodules": False, "jobs": None}),
+    ("default", GitUtil.DEFAULT_CHECKOUT_OPTIONS),
+    ("depth 1", dict(GitUtil.DEFAULT_CHECKOUT_OPTIONS, depth=1)),
+    ("tree:0", dict(GitUtil.DEFAULT_CHECKOUT_OPTIONS, filter="tree:0")),
+]
+MIRROR_MODES = [
+    ("full, warm mirror", MODES[0][1]),
+    ("default, warm mirror", GitUtil.DEFAULT_CHECKOUT_OPTIONS),
+]
+FILE_COUNT = 20
+FILE_SIZE = 64 * 1024
+
+# submodules over file:// are refused by default since git 2.38.1
+ENV = dict(os.environ, GIT_CONFIG_COUNT="1", GIT_CONFIG_KEY_0="protocol.file.allow", GIT_CONFIG_VALUE_0="always",
+           GIT_AUTHOR_NAME="ci", GIT_AUTHOR_EMAIL="ci@test.com", GIT_COMMITTER_NAME="ci",
+           GIT_COMMITTER_EMAIL="ci@test.com")
+
+
+def run(cmd, cwd=None):
+    subprocess.check_output(cmd, cwd=cwd, env=ENV, stderr=subprocess.STDOUT)
+
+
+def make_repo(root, name, commit_count, gitmodules=None):
+    """
+    Creates a bare repository with commit_count commits, each rewriting some files with random content.
+    """
+    work = os.path.join(root, name + ".work")
+    run(["git", "init", "-q", "-b", "master", work])
+    for i in range(commit_count):
+        for j in range(i % FILE_COUNT, FILE_COUNT, 4):
+            with open(os.path.join(work, f"file{j}.bin"), "wb") as f:
+                f.write(os.urandom(FILE_SIZE))
+        run(["git", "add", "-A"], cwd=work)
+        run(["git", "commit", "-q", "-m", f"commit {i}"], cwd=work)
+    if gitmodules is not None:
+        content = ""
+        for sub_name, sub_url in gitmodules.items():
+            sub_head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.join(
+                root, sub_name + ".work")).decode().strip()
+            run(["git", "update-index", "--add", "--cacheinfo", f"160000,{sub_head},{sub_name}"], cwd=work)
+            content += f"[submodule \"{sub_name}\"]\npath = {sub_name}\nurl = {sub_url}\nbranch = master\n\n"
+        with open(os.path.join(work, ".gitmodules"), "w") as f:
+            f.write(content)
+        run(["git", "add", ".gitmodules"], cwd=work)
+        run(["git", "commit", "-q", "-m", "add submodules"], cwd=work)
+    bare = os.path.join(root, name + ".git")
+    run(["git", "clone", "-q", "--bare", work, bare])
+    run(["git", "config", "uploadpack.allowFilter", "true"], cwd=bare)
+    run(["git", "config", "uploadpack.allowAnySHA1InWant", "true"], cwd=bare)
+    return "file://" + bare
+
+
+def disk_usage(path):
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+
+def main():
+    commit_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    submodule_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    root = tempfile.mkdtemp(prefix="smartci_checkout_")
+    try:
+        print(f"creating a superproject with {commit_count} commits and {submodule_count} submodules ...")
+        gitmodules = {}
+        for i in range(submodule_count):
+            gitmodules[f"sub{i}"] = make_repo(root, f"sub{i}", commit_count // 2)
+        url = make_repo(root, "super", commit_count, gitmodules)
+
+        cache = GitMirrorCache(os.path.join(root, "mirrors"))
+        with cache.Use(url, url, run):  # warm up, not measured
+            pass
+
+        print(f"{'mode':<22}{'seconds':>10}{'disk MB':>10}")
+        for name, options in MODES + MIRROR_MODES:
+            local_path = os.path.join(root, "checkout")
+            os.makedirs(local_path)
+            start = time.time()
+            with cache.Use(url, url, run) if (name, options) in MIRROR_MODES else nullcontext([]) as clone_args:
+                for cmd in GitUtil.MakeCheckOutCmds(url, "master", local_path, options, clone_args):
+                    run(cmd, cwd=local_path if cmd[1] == "submodule" else None)
+            seconds = time.time() - start
+            print(f"{name:<22}{seconds:>10.2f}{disk_usage(local_path) / 1024 / 1024:>10.1f}")
+            shutil.rmtree(local_path)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding:utf-8 -*-
+"""
+Measures the memory retained per repository after a scan, with synthetic GitLab project payloads, no server is
+required.
+
+Usage:
+    python benchmark/repo_memory.py [repo_count]
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from smartci.ci_repo import CiRepo
+from smartci.vcs.git.git_repo import GitRepo
+
+
+class FakeGit:
+    type = "git"
+    address = "http://gitlab.example.com"
+
+    def GetAddress(self):
+        return self.address
+
+
+def make_project(project_id):
+    """
+    Returns a project payload shaped like the response of GET /api/v4/projects.
+    """
+    path = f"repo{project_id}"
+    namespace = f"group{project_id % 50}"
+    web_url = f"{FakeGit.address}/{namespace}/{path}"
+    return {
+        "id": project_id, "description": f"description of {path}", "name": path, "name_with_namespace":
+            f"{namespace} / {path}", "path": path, "path_with_namespace": f"{namespace}/{path}",
+        "created_at": "2024-01-01T00:00:00.000Z", "default_branch": "master", "tag_list": [], "topics": [],
+        "ssh_url_to_repo": f"git@gitlab.example.com:{namespace}/{path}.git",
+        "http_url_to_repo": f"{web_url}.git", "web_url": web_url, "readme_url": f"{web_url}/-/blob/master/README.md",
+        "avatar_url": None, "forks_count": 0, "star_count": 0, "last_activity_at": "2024-06-01T00:00:00.000Z",
+        "namespace": {"id": project_id % 50, "name": namespace, "path": namespace, "kind": "group",
+                      "full_path": namespace, "parent_id": None, "avatar_url": None,
+                      "web_url": f"{FakeGit.address}/groups/{namespace}"},
+        "_links": {key: f"{FakeGit.address}/api/v4/projects/{project_id}/{key}"
+                   for key in ["self", "issues", "merge_requests", "repo_branches", "labels", "events", "members"]},
+        "packages_enabled": True, "empty_repo": False, "archived": False, "visibility": "private",
+        "resolve_outdated_diff_discussions": False, "container_registry_enabled": True,
+        "issues_enabled": True, "merge_requests_enabled": True, "wiki_enabled": True, "jobs_enabled": True,
+        "snippets_enabled": True, "service_desk_enabled": False, "can_create_merge_request_in": True,
+        "issues_access_level": "enabled", "repository_access_level": "enabled", "wiki_access_level": "enabled",
+        "merge_requests_access_level": "enabled", "builds_access_level": "enabled",
+        "snippets_access_level": "enabled", "pages_access_level": "private", "shared_runners_enabled": True,
+        "lfs_enabled": True, "creator_id": 1, "import_status": "none", "open_issues_count": 0,
+        "ci_default_git_depth": 50, "public_jobs": True, "build_timeout": 3600, "auto_cancel_pending_pipelines":
+            "enabled", "ci_config_path": None, "shared_with_groups": [], "only_allow_merge_if_pipeline_succeeds":
+            False, "request_access_enabled": True, "only_allow_merge_if_all_discussions_are_resolved": False,
+        "remove_source_branch_after_merge": True, "printing_merge_request_link_enabled": True,
+        "merge_method": "merge", "squash_option": "default_off", "auto_devops_enabled": False,
+        "permissions": {"project_access": {"access_level": 40, "notification_level": 3}, "group_access": None},
+    }
+
+
+def measure(repo_count, build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    retained = build(repo_count)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del retained
+    return size / repo_count
+
+
+def build_payloads(repo_count):
+    return [make_project(project_id) for project_id in range(1, repo_count + 1)]
+
+
+def build_repos(repo_count):
+    vcs = FakeGit()
+    settings_info = {"content": "group: Subsystem\n", "blob_id": "0" * 40}
+    repos = []
+    for project_id in range(1, repo_count + 1):
+        # the payload is dropped after the repository is built, like a page of the project listing
+        repos.append(CiRepo(None, GitRepo(vcs, make_project(project_id)), settings_info))
+    return repos
+
+
+def main():
+    repo_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"repositories: {repo_count}")
+    print(f"full gitlab project payload: {measure(repo_count, build_payloads):.0f} bytes per repo")
+    print(f"CiRepo + GitRepo:           {measure(repo_count, build_repos):.0f} bytes per repo")
+
+
+if __name__ == "__main__":
+    main()
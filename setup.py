@@ -7,4 +7,7 @@ setup(
     install_requires=[
         'PyYAML',
     ],
+    extras_require={
+        'async': ['httpx[http2]'],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,345 @@
+import asyncio
+
+from smartci.ci_repo import CiRepo
+from smartci.ci_repo_catalog import CiRepoCatalog
+from smartci.ci_vcs import CiVcs
+
+
+class AsyncCiVcs:
+    """
+    The asyncio counterpart of CiVcs for the git servers, so that one process can drive hundreds of repositories
+    concurrently. The requests to each server are bounded by its "async_concurrency" option.
+
+    Example:
+        async with AsyncCiVcs.Create() as ci_vcs:
+            repos = await ci_vcs.GetAllRepoWithBranch("2401_1_helloworld")
+    """
+
+    def __init__(self, vcs_list):
+        """
+        Initializes a new instance of the AsyncCiVcs class.
+
+        :param vcs_list: A list of AsyncGit objects.
+        """
+        self.vcs_list = vcs_list
+        self.catalog = None  # shared with CiVcs, created on first use
+        self.scan_errors = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.Close()
+
+    async def Close(self):
+        """
+        Closes the connections to all version control systems.
+        """
+        for vcs in self.vcs_list:
+            await vcs.Close()
+
+    async def GetAllRepo(self):
+        """
+        Retrieves all application repositories.
+
+        :return: A list of AsyncCiRepo objects.
+        """
+        return await self.GetAllRepoWithBranch(None)
+
+    async def GetAllRepoWithBranch(self, branch_name):
+        """
+        Retrieves all application repositories which has branch with the given branch name, all repositories of all
+        version control systems are checked concurrently. The repositories failed to be checked and the version
+        control systems failed to be listed are skipped, see GetScanErrors.
+
+        :param branch_name: The name of the branch, or None to retrieve all application repositories.
+        :return: A list of AsyncCiRepo objects, in the order of the version control systems and their repositories.
+        """
+        discovered_all = await self.__DiscoverAllVcs(branch_name)
+        return [ci_repo for vcs, discovered in discovered_all for _, ci_repo in discovered if ci_repo is not None]
+
+    def GetScanErrors(self):
+        """
+        Returns the errors of the last scan of the version control systems, see CiVcs.GetScanErrors.
+        """
+        return list(self.scan_errors)
+
+    async def __DiscoverAllVcs(self, branch_name=None):
+        errors = []
+        results = await asyncio.gather(*[self.__DiscoverRepos(vcs, branch_name, errors) for vcs in self.vcs_list],
+                                       return_exceptions=True)
+        discovered_all = []
+        for vcs, result in zip(self.vcs_list, results):
+            if isinstance(result, Exception):
+                errors.append({"vcs": vcs.GetAddress(), "url": None, "error": str(result)})
+                result = []
+            discovered_all.append((vcs, result))
+        self.scan_errors = errors
+        if len(errors) > 0:
+            print(f"{len(errors)} errors while scanning the repositories, see AsyncCiVcs.GetScanErrors()")
+        return discovered_all
+
+    async def __DiscoverRepos(self, primitive_vcs, branch_name, errors):
+        """
+        :return: A list of (primitive_repo, ci_repo), ci_repo is None if the repository does not support CI, has no
+            branch with the given branch name, or failed to be checked.
+        """
+        async def discover(primitive_repo):
+            ci_repo = await AsyncCiRepo.Discover(self, primitive_repo)
+            if ci_repo is not None and branch_name is not None and await primitive_repo.GetBranch(branch_name) is None:
+                return None
+            return ci_repo
+
+        primitive_repos = await primitive_vcs.GetRepos()
+        ci_repos = await asyncio.gather(*[discover(primitive_repo) for primitive_repo in primitive_repos],
+                                        return_exceptions=True)
+        result = []
+        for primitive_repo, ci_repo in zip(primitive_repos, ci_repos):
+            if isinstance(ci_repo, Exception):
+                errors.append({"vcs": primitive_vcs.GetAddress(), "url": primitive_repo.GetUrl(),
+                               "error": str(ci_repo)})
+                ci_repo = None
+            result.append((primitive_repo, ci_repo))
+        return result
+
+    async def GetRepo(self, group, name):
+        """
+        Returns the application repository with the given group and name. The repository is looked up in the catalog
+        shared with CiVcs first, all version control systems are only scanned when it is not found there.
+
+        :return: The AsyncCiRepo object, or None if not found.
+        """
+        record = self.GetCatalog().GetByName(group, name)
+        if record is not None:
+            ci_repo = await self.__GetCiRepoByRecord(record)
+            if ci_repo is not None and ci_repo.GetGroup() == group and ci_repo.GetName() == name:
+                return ci_repo
+
+        for ci_repo in await self.RefreshCatalog():
+            if ci_repo.GetGroup() == group and ci_repo.GetName() == name:
+                return ci_repo
+        return None
+
+    async def __GetCiRepoByRecord(self, record):
+        # the settings are read again, the record may be outdated
+        for vcs in self.vcs_list:
+            if f"{vcs.type}:{vcs.GetAddress()}" != record["backend"]:
+                continue
+            try:
+                primitive_repo = vcs.GetRepoFromRecord(record)
+                if primitive_repo is None:  # an older record, looked up on the server
+                    primitive_repo = await vcs.GetRepoByUrl(record["url"])
+                ci_repo = await AsyncCiRepo.Discover(self, primitive_repo) if primitive_repo is not None else None
+            except Exception as e:
+                print(f"refresh catalog entry {record['url']} failed: {e}")
+                return None
+            if primitive_repo is None:
+                self.GetCatalog().Remove(record["url"])
+                return None
+            settings_blob_id = ci_repo.GetSettingsBlobId() if ci_repo is not None else None
+            self.GetCatalog().Save(CiRepoCatalog.MakeRecord(primitive_repo, ci_repo, settings_blob_id))
+            return ci_repo
+        return None
+
+    async def RefreshCatalog(self):
+        """
+        Scans all version control systems and replaces the repository catalog with the result, see
+        CiVcs.RefreshCatalog.
+
+        :return: A list of AsyncCiRepo objects.
+        """
+        discovered_all = await self.__DiscoverAllVcs()
+        return self.GetCatalog().SaveScan(discovered_all, self.scan_errors)
+
+    def GetCatalog(self):
+        """
+        Returns the persistent repository catalog under CI_WORKSPACE, shared with CiVcs.
+
+        :return: The CiRepoCatalog object.
+        """
+        if self.catalog is None:
+            self.catalog = CiRepoCatalog()
+        return self.catalog
+
+    async def GetRepoByUrl(self, url):
+        """
+        Returns the application repository with the given url.
+
+        :return: The AsyncCiRepo object, or None if not found or the repository does not support CI.
+        """
+        for vcs in self.vcs_list:
+            if url.startswith(vcs.GetAddress()):
+                primitive_repo = await vcs.GetRepoByUrl(url)
+                if primitive_repo is None:
+                    return None
+                return await AsyncCiRepo.Discover(self, primitive_repo)
+        return None
+
+    async def AddBranches(self, ci_repos, branch_name, comment=None):
+        """
+        Adds a branch to each of the given repositories concurrently.
+
+        :return: A list in the order of ci_repos, each item is the new AsyncCiBranch, or the exception raised.
+        """
+        return await asyncio.gather(*[ci_repo.AddBranch(branch_name, comment) for ci_repo in ci_repos],
+                                    return_exceptions=True)
+
+    @staticmethod
+    def Create(cfg_str=None):
+        """
+        Creates a new AsyncCiVcs object based on the configuration in the "ci_vcs_cfg.yml" file.
+        Only the git servers are supported, svn servers are skipped.
+
+        :return: The new AsyncCiVcs object.
+        """
+        cfgs = CiVcs.LoadCfgs(cfg_str)
+
+        vcs_list = []
+        from smartci.util import encrypt
+        for cfg in cfgs["vcs"]:
+            if cfg["type"] == "git":
+                from smartci.vcs.git.git_async import AsyncGit
+                access_token = cfg["access_token"]
+                if "secret" in cfg:
+                    access_token = encrypt.XorDecrypt(access_token, cfg["secret"])
+                vcs_list.append(AsyncGit(cfg["url"], cfg["username"], access_token, cfg))
+            else:
+                print(f"{cfg['type']} is not supported by AsyncCiVcs, skip {cfg['url']}")
+        return AsyncCiVcs(vcs_list)
+
+
+class AsyncCiRepo:
+    """
+    The asyncio counterpart of CiRepo.
+    """
+
+    def __init__(self, ci_vcs, primitive_repo, settings_info):
+        """
+        Initializes a new instance of the AsyncCiRepo class.
+
+        :param ci_vcs: The AsyncCiVcs this repository belongs to.
+        :param primitive_repo: The AsyncGitRepo this repository is based on.
+        :param settings_info: The ".ci/settings.yml" fetched from the trunk, {"content": str, "blob_id": str}.
+        """
+        self.ci_vcs = ci_vcs
+        self.primitive_repo = primitive_repo
+        self.settings_blob_id = settings_info["blob_id"]
+        relative_path = self.GetUrl()[len(primitive_repo.vcs.GetAddress()) + 1:]
+        self.group, self.name = CiRepo.ParseSettings(settings_info["content"], relative_path)
+
+    def __str__(self):
+        return f"{self.GetGroup()}.{self.GetName()}"
+
+    def Id(self):
+        return f"{self}"
+
+    @staticmethod
+    async def Discover(ci_vcs, primitive_repo):
+        """
+        Creates the CI repository for the primitive repository with a single fetch of ".ci/settings.yml".
+
+        :return: The AsyncCiRepo object, or None if the primitive repository does not support CI.
+        """
+        settings_info = await primitive_repo.GetTrunk().GetFileInfo(CiRepo.SETTINGS_FILE)
+        if settings_info is None:
+            return None
+        return AsyncCiRepo(ci_vcs, primitive_repo, settings_info)
+
+    def GetName(self):
+        return self.name
+
+    def GetGroup(self):
+        return self.group
+
+    def GetSettingsBlobId(self):
+        return self.settings_blob_id
+
+    def GetUrl(self):
+        return self.primitive_repo.GetUrl()
+
+    def GetPrimitiveVcs(self):
+        return self.primitive_repo.vcs
+
+    def GetTrunk(self):
+        """
+        Returns the trunk branch, no request is sent.
+        """
+        return AsyncCiBranch(self, self.primitive_repo.GetTrunk())
+
+    async def GetBranch(self, branch_name):
+        """
+        Returns the CI branch with the given branch name, or None if no such branch exists.
+        """
+        primitive_branch = await self.primitive_repo.GetBranch(branch_name)
+        if primitive_branch is not None:
+            return AsyncCiBranch(self, primitive_branch)
+        return None
+
+    async def GetBranches(self, branch_name_pattern):
+        """
+        Returns the CI branches with the given branch name pattern.
+        """
+        primitive_branches = await self.primitive_repo.GetBranches(branch_name_pattern)
+        return [AsyncCiBranch(self, primitive_branch) for primitive_branch in primitive_branches]
+
+    async def AddBranch(self, branch_name, comment=None):
+        """
+        Adds a new branch with the given branch name from the trunk.
+
+        :return: The new AsyncCiBranch.
+        """
+        if comment is None:
+            comment = "create branch " + branch_name
+        branch = await self.primitive_repo.CreateBranch(branch_name, comment)
+        return AsyncCiBranch(self, branch)
+
+    async def DeleteBranch(self, branch_name, comment=None):
+        """
+        Deletes the branch with the given branch name.
+        """
+        if comment is None:
+            comment = "delete branch " + branch_name + " by smartci"
+        await self.primitive_repo.DeleteBranch(branch_name, comment)
+
+
+class AsyncCiBranch:
+    """
+    The asyncio counterpart of CiBranch, CiTrunk and CiTag, with the read-only operations.
+    """
+
+    def __init__(self, ci_repo, primitive_entity):
+        self.ci_repo = ci_repo
+        self.primitive_entity = primitive_entity
+
+    def __str__(self):
+        return f"{self.ci_repo}.{self.GetName()}"
+
+    def GetName(self):
+        return self.primitive_entity.GetName()
+
+    def GetType(self):
+        return self.primitive_entity.GetType()
+
+    def GetPrimitiveName(self):
+        return self.primitive_entity.GetPrimitiveName()
+
+    def GetPrimitiveEntity(self):
+        return self.primitive_entity
+
+    async def Refresh(self):
+        await self.primitive_entity.Refresh()
+
+    async def GetLastCommitId(self):
+        return await self.primitive_entity.GetLastCommitId()
+
+    async def GetLastCommitInfo(self):
+        return await self.primitive_entity.GetLastCommitInfo()
+
+    async def GetFileContent(self, file_rel_path):
+        return await self.primitive_entity.GetFileContent(file_rel_path)
+
+    async def FileExists(self, file_path):
+        return await self.primitive_entity.FileExists(file_path)
+
+    async def ContainsEntity(self, entity):
+        return await self.primitive_entity.ContainsEntity(entity.primitive_entity)
@@ -6,6 +6,8 @@ from datetime import datetime
 
 
 class CiVersionEntity:
+    __slots__ = ("primitive_entity", "ci_repo")
+
     def __init__(self, ci_repo, primitive_entity):
         """
         Initializes a new instance of the CiBranch class.
@@ -55,6 +57,23 @@ class CiVersionEntity:
         """
         return self.primitive_entity
 
+    def Refresh(self):
+        """
+        Re-reads the metadata of the primitive branch, e.g. the last commit and the protection, from the server.
+
+        The metadata returned by a branch listing is kept on the branch and used by GetLastCommitId,
+        GetLastCommitInfo, GetUrl and IsAllowedPush until refreshed.
+        """
+        self.primitive_entity.Refresh()
+
+    def GetInfoAge(self):
+        """
+        Returns the age of the metadata of the primitive branch in seconds.
+
+        :return: The seconds since the metadata was read, or None if no metadata is cached.
+        """
+        return self.primitive_entity.GetInfoAge()
+
     def GetLastCommitId(self):
         """
         Returns the last commit id of the primitive branch.
@@ -95,14 +114,17 @@ class CiVersionEntity:
         """
         return self.primitive_entity.GetCommitInfoOfLocalPath(local_path)
 
-    def CheckOut(self, local_path):
+    def CheckOut(self, local_path, options=None):
         """
         Checks out the primitive branch to the local path.
         :param local_path: The local path to check out the primitive branch to.
+        :param options: The checkout options of git, overriding the "checkout" options of the VCS, e.g.
+            {"depth": 1, "filter": "tree:0", "shallow_submodules": True, "jobs": 8}. Set "depth" and "filter" to
+            None for a full clone as before. Ignored by svn.
         """
         if not os.path.exists(local_path):
             os.makedirs(local_path)
-        self.primitive_entity.CheckOut(local_path)
+        self.primitive_entity.CheckOut(local_path, options)
         print("checkout " + str(self) + " to " + local_path + " done")
 
     def CheckOutDirectory(self, local_path, rel_path):
@@ -316,7 +338,7 @@ class CiVersionEntity:
             mount_rel_path = ref["mount_rel_path"]
             primitive_entity = ref["version_entity"]
             ci_repo = self.ci_repo.ci_vcs.CreateCiRepo(primitive_entity.repo)
-            version_entity = CiVersionEntity.Create(ci_repo, primitive_entity)
+            version_entity = self.ci_repo.ci_vcs.CreateCiVersionEntity(ci_repo, primitive_entity)
             result.append({"mount_rel_path": mount_rel_path, "version_entity": version_entity})
 
         return result
@@ -326,10 +348,27 @@ class CiVersionEntity:
         Refreshes the reference to the given CI branch in the primitive branch.
 
         :param ref_ci_branch: The CI branch to refresh the reference to.
+        :return: True if the reference has been changed, False if it is up to date.
         """
+        return self.UpdateRefEntities([ref_ci_branch])
+
+    def UpdateRefEntities(self, ref_ci_branches):
+        """
+        Refreshes the references to all the given CI branches in the primitive branch at once: one commit of
+        ".gitmodules" for git, one commit per directory with svn:externals for svn. Nothing is written if all the
+        references are up to date.
+
+        :param ref_ci_branches: The CI branches to refresh the references to.
+        :return: True if any reference has been changed, False otherwise.
+        """
+        if len(ref_ci_branches) == 0:
+            return False
         tmp_path = self._PrepareTmpWorkDirectory()
-        self.primitive_entity.UpdateRefEntity(tmp_path, ref_ci_branch.primitive_entity)
-        self._RemoveTmpWorkDirectory(tmp_path)
+        try:
+            return self.primitive_entity.UpdateRefEntities(
+                tmp_path, [ref_ci_branch.primitive_entity for ref_ci_branch in ref_ci_branches])
+        finally:
+            self._RemoveTmpWorkDirectory(tmp_path)
 
     def ExistRepoRef(self, ref_ci_repo):
         """
@@ -380,7 +419,7 @@ class CiVersionEntity:
         Returns True if the primitive branch is allowed to be pushed by developer, False otherwise.
         """
         re = self.primitive_entity.GetProtectedInfo()
-        if re["allowed_push"]:
+        if re is None or re["allowed_push"]:  # None represents not protected
             return True
         return False
 
@@ -519,6 +558,18 @@ class CiVersionEntity:
         """
         return self.primitive_entity.ContainsEntity(entity.primitive_entity)
 
+    def GetMergedEntities(self, entities):
+        """
+        Returns the given entities which have been merged into the current entity, checked in one pass.
+
+        :param entities: The entities to check.
+        :return: The merged entities, in the order of the given entities.
+        """
+        primitive_entities = [entity.primitive_entity for entity in entities]
+        merged = self.primitive_entity.GetMergedEntities(primitive_entities)
+        merged_ids = set(id(primitive_entity) for primitive_entity in merged)
+        return [entity for entity in entities if id(entity.primitive_entity) in merged_ids]
+
     def AddWebHook(self, webhook_url, secret_token):
         """
         Adds a webhook to the current entity.
@@ -541,6 +592,9 @@ class CiTrunk(CiVersionEntity):
     This class represents a Continuous Integration (CI) trunk in a CI repository.
     """
 
+    __slots__ = ()
+
+
     def __init__(self, ci_repo, primitive_trunk):
         """
         Initializes a new instance of the CiTrunk class.
@@ -559,6 +613,9 @@ class CiBranch(CiVersionEntity):
     This class represents a Continuous Integration (CI) branch in a CI repository.
     """
 
+    __slots__ = ()
+
+
     def __init__(self, ci_repo, primitive_branch):
         """
         Initializes a new instance of the CiBranch class.
@@ -584,43 +641,61 @@ class CiBranch(CiVersionEntity):
 
         This procedure ensures that all relevant branches across different repositories are synchronized with the most
         current changes.
+
+        The references in both directions are looked up in the reference index of the CI VCS, see CiVcs.GetRefIndex.
         """
+        ci_vcs = self.ci_repo.ci_vcs
         # 更新外部引用
         print("refresh external ref for current new branch")
-        ref_ci_repos = super().GetRefCiRepos()
-        for ref_ci_repo in ref_ci_repos:
+        ref_urls = []
+        for ref in ci_vcs.IndexEntity(self):
+            if ref["repo_url"] not in ref_urls:
+                ref_urls.append(ref["repo_url"])
+        ref_ci_branches = []
+        for ref_url in ref_urls:
+            ref_ci_repo = ci_vcs.GetCiRepoByUrl(ref_url)
+            if ref_ci_repo is None:
+                raise Exception("repo not found: " + ref_url)
             ref_ci_branch = ref_ci_repo.GetBranch(self.primitive_entity.GetName())
             if ref_ci_branch is not None:
-                super().UpdateRefEntity(ref_ci_branch)
+                ref_ci_branches.append(ref_ci_branch)
+        if super().UpdateRefEntities(ref_ci_branches):
+            ci_vcs.IndexEntity(self)
 
         # 如本项目有项目分支引用到本分支，也需要刷新外部引用
         print("refresh external ref for project branch which refer to current new branch")
-        ci_vcs = self.ci_repo.ci_vcs
-        # ref can only be in the same vcs
-        ci_repos = ci_vcs.GetAllRepoWithBranchInSingleVcs(self.ci_repo.GetPrimitiveVcs(), self.GetName())
-        for ci_repo in ci_repos:
-            tmp_feature_branches = ci_repo.GetBranches(f"{self.GetName()}.*")
-            print(f"tmp_feature_branche count: {len(tmp_feature_branches)}")
-            for tmp_feature_branch in tmp_feature_branches:
-                print(f"tmp_feature_branch: {tmp_feature_branch.GetName()}")
-                if tmp_feature_branch.ExistRepoRef(self.ci_repo):
-                    tmp_feature_branch.UpdateRefEntity(self)
+        # ref can only be in the same vcs, which the index lookup ensures by the url
+        referrers = self.__FindReferrers()
+        print(f"tmp_feature_branche count: {len(referrers)}")
+        for tmp_feature_branch in referrers:
+            print(f"tmp_feature_branch: {tmp_feature_branch.GetName()}")
+            if tmp_feature_branch.UpdateRefEntity(self):
+                ci_vcs.IndexEntity(tmp_feature_branch)
 
     def RefreshRefWhenDeleted(self):
         """
         Refreshes the external references of other branches when the current CI branch is deleted.
         """
         ci_vcs = self.ci_repo.ci_vcs
-        # ref can only be in the same vcs
-        ci_repos = ci_vcs.GetAllRepoWithBranchInSingleVcs(self.ci_repo.GetPrimitiveVcs(), self.primitive_entity.GetName())
-
         ci_trunk = self.ci_repo.GetTrunk()
+        for tmp_feature_branch in self.__FindReferrers():
+            if tmp_feature_branch.UpdateRefEntity(ci_trunk):
+                ci_vcs.IndexEntity(tmp_feature_branch)
 
-        for ci_repo in ci_repos:
-            tmp_feature_branches = ci_repo.GetBranches(f"{self.GetName()}.*")
-            for tmp_feature_branch in tmp_feature_branches:
-                if tmp_feature_branch.ExistRepoRef(self.ci_repo):
-                    tmp_feature_branch.UpdateRefEntity(ci_trunk)
+    def __FindReferrers(self):
+        """
+        Returns the branches named "{name}.*" referencing the repository of the current CI branch, in the
+        repositories which have a branch with the same name as the current CI branch.
+        """
+        has_branch = {}
+        result = []
+        for referrer in self.ci_repo.ci_vcs.FindReferrers(self.ci_repo, f"{self.GetName()}.*"):
+            url = referrer.ci_repo.GetUrl()
+            if url not in has_branch:
+                has_branch[url] = referrer.ci_repo.GetBranch(self.primitive_entity.GetName()) is not None
+            if has_branch[url]:
+                result.append(referrer)
+        return result
 
 
 class CiTag(CiVersionEntity):
@@ -628,6 +703,9 @@ class CiTag(CiVersionEntity):
     This class represents a Continuous Integration (CI) tag in a CI repository.
     """
 
+    __slots__ = ()
+
+
     def __init__(self, ci_repo, primitive_tag):
         """
         Initializes a new instance of the CiTag class.
@@ -643,6 +721,9 @@ class CiTag(CiVersionEntity):
     def UpdateRefEntity(self, ref_ci_branch):
         raise Exception("tag can not be updated")
 
+    def UpdateRefEntities(self, ref_ci_branches):
+        raise Exception("tag can not be updated")
+
     def Commit(self, comment):
         raise Exception("tag can not be committed")
 
@@ -0,0 +1,161 @@
+import time
+
+from smartci.util.sqlite_db import SqliteDb
+
+
+class CiRefIndex:
+    """
+    This class represents a persistent index of the references between the branches of the application repositories,
+    i.e. the git submodules and the svn externals.
+
+    The index is a SQLite database under CI_WORKSPACE which can be shared by all CI jobs on the same host. It keeps
+    for each indexed version entity its head (the last commit id) and the references read at that head, so that the
+    references of an entity are only read again when its head changes:
+        - forward: entity -> the referenced repositories and entities with their mount paths, see GetRefs.
+        - reverse: repository -> the entities referencing it, see GetReferrers.
+    An entity is identified by the url of its repository and its primitive name, e.g. "master" or "trunk".
+    """
+
+    def __init__(self, db_path=None):
+        """
+        Initializes a new instance of the CiRefIndex class.
+
+        :param db_path: The path of the database file. If None, "ci_ref_index.db" under CI_WORKSPACE is used.
+        """
+        self.db = SqliteDb(db_path, "ci_ref_index.db", [
+            """
+            CREATE TABLE IF NOT EXISTS entity (
+                repo_url TEXT NOT NULL,
+                name TEXT NOT NULL,
+                head TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (repo_url, name)
+            )""",
+            """
+            CREATE TABLE IF NOT EXISTS ref (
+                repo_url TEXT NOT NULL,
+                name TEXT NOT NULL,
+                mount_rel_path TEXT NOT NULL,
+                ref_repo_url TEXT NOT NULL,
+                ref_name TEXT,
+                PRIMARY KEY (repo_url, name, mount_rel_path)
+            )""",
+            "CREATE INDEX IF NOT EXISTS ref_target ON ref (ref_repo_url, ref_name)",
+            """
+            CREATE TABLE IF NOT EXISTS scan (
+                backend TEXT PRIMARY KEY,
+                scanned_at REAL NOT NULL
+            )""",
+        ])
+        self.db_path = self.db.db_path
+
+    def GetHeads(self, repo_url):
+        """
+        Returns the heads of the indexed entities of the repository, {name: head}.
+        """
+        rows = self.db.Query("SELECT name, head FROM entity WHERE repo_url = ?", (repo_url,))
+        return {row["name"]: row["head"] for row in rows}
+
+    def GetHead(self, repo_url, name):
+        """
+        Returns the head the references of the entity are indexed at, or None if the entity is not indexed.
+        """
+        rows = self.db.Query("SELECT head FROM entity WHERE repo_url = ? AND name = ?", (repo_url, name))
+        return rows[0]["head"] if len(rows) > 0 else None
+
+    def GetRefs(self, repo_url, name):
+        """
+        Returns the references of the entity.
+
+        :return: A list of {"mount_rel_path": str, "repo_url": str, "name": str}, "name" is the primitive name of the
+            referenced entity.
+        """
+        rows = self.db.Query("SELECT mount_rel_path, ref_repo_url, ref_name FROM ref WHERE repo_url = ? AND name = ? "
+                            "ORDER BY mount_rel_path", (repo_url, name))
+        return [{"mount_rel_path": row["mount_rel_path"], "repo_url": row["ref_repo_url"], "name": row["ref_name"]}
+                for row in rows]
+
+    def GetReferrers(self, ref_repo_url, ref_name=None):
+        """
+        Returns the entities referencing the repository.
+
+        :param ref_repo_url: The url of the referenced repository.
+        :param ref_name: The primitive name of the referenced entity, or None for any entity of the repository.
+        :return: A list of {"repo_url": str, "name": str, "head": str, "mount_rel_path": str, "ref_name": str}.
+        """
+        sql = ("SELECT ref.repo_url, ref.name, entity.head, ref.mount_rel_path, ref.ref_name FROM ref "
+               "JOIN entity ON entity.repo_url = ref.repo_url AND entity.name = ref.name WHERE ref.ref_repo_url = ?")
+        args = (ref_repo_url,)
+        if ref_name is not None:
+            sql += " AND ref.ref_name = ?"
+            args = (ref_repo_url, ref_name)
+        rows = self.db.Query(sql + " ORDER BY ref.repo_url, ref.name", args)
+        return [dict(row) for row in rows]
+
+    def SaveEntity(self, repo_url, name, head, refs):
+        """
+        Adds or replaces the references of a single entity.
+        """
+        self.SaveRepo(repo_url, {name: {"head": head, "refs": refs}})
+
+    def SaveRepo(self, repo_url, entities, removed_names=None):
+        """
+        Adds or replaces the references of several entities of a repository in one transaction.
+
+        :param repo_url: The url of the repository.
+        :param entities: {name: {"head": str, "refs": list}}, see GetRefs for the items of "refs".
+        :param removed_names: The names of the entities which no longer exist.
+        """
+        now = time.time()
+        with self.db.Transaction() as conn:
+            for name in list(entities.keys()) + list(removed_names or []):
+                conn.execute("DELETE FROM entity WHERE repo_url = ? AND name = ?", (repo_url, name))
+                conn.execute("DELETE FROM ref WHERE repo_url = ? AND name = ?", (repo_url, name))
+            for name, entity in entities.items():
+                conn.execute("INSERT INTO entity (repo_url, name, head, updated_at) VALUES (?, ?, ?, ?)",
+                             (repo_url, name, entity["head"], now))
+                for ref in entity["refs"]:
+                    conn.execute("INSERT OR REPLACE INTO ref (repo_url, name, mount_rel_path, ref_repo_url, ref_name) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 (repo_url, name, ref["mount_rel_path"], ref["repo_url"], ref["name"]))
+
+    def RemoveEntity(self, repo_url, name):
+        """
+        Removes the entity and its references.
+        """
+        self.SaveRepo(repo_url, {}, [name])
+
+    def RemoveReposExcept(self, address, repo_urls):
+        """
+        Removes the repositories of the version control system at the address which are not in repo_urls, e.g. the
+        deleted repositories.
+        """
+        keep = set(repo_urls)
+        with self.db.Transaction() as conn:
+            rows = conn.execute("SELECT DISTINCT repo_url FROM entity WHERE substr(repo_url, 1, ?) = ?",
+                                (len(address) + 1, address + "/")).fetchall()
+            for row in rows:
+                if row["repo_url"] not in keep:
+                    conn.execute("DELETE FROM entity WHERE repo_url = ?", (row["repo_url"],))
+                    conn.execute("DELETE FROM ref WHERE repo_url = ?", (row["repo_url"],))
+
+    def Lock(self):
+        """
+        Returns an inter-process lock which serializes the refreshes of the index, so that jobs finding the index
+        outdated at the same time do not all scan the version control systems.
+        """
+        return self.db.Lock()
+
+    def SetScannedAt(self, backend, scanned_at):
+        """
+        Records the start time of the last complete scan of the version control system.
+        """
+        with self.db.Transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO scan (backend, scanned_at) VALUES (?, ?)", (backend, scanned_at))
+
+    def GetScannedAt(self, backend):
+        """
+        Returns the start time of the last complete scan of the version control system, None if never scanned.
+        """
+        rows = self.db.Query("SELECT scanned_at FROM scan WHERE backend = ?", (backend,))
+        return rows[0]["scanned_at"] if len(rows) > 0 else None
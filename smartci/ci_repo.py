@@ -1,8 +1,10 @@
 import os
+import time
 
 import yaml
 
 from smartci.ci_branch import CiBranch, CiTag
+from smartci.ci_repo_catalog import CiRepoCatalog
 
 
 class CiRepo:
@@ -10,16 +12,26 @@ class CiRepo:
     This class represents a Continuous Integration (CI) repository.
     """
 
-    def __init__(self, ci_vcs, primitive_repo):
+    SETTINGS_FILE = ".ci/settings.yml"
+
+    __slots__ = ("ci_vcs", "primitive_repo", "settings_blob_id", "group", "name")
+
+    def __init__(self, ci_vcs, primitive_repo, settings_info=None):
         """
         Initializes a new instance of the CiRepo class.
 
         :param ci_vcs: The CI version control system this repository belongs to.
         :param primitive_repo: The primitive repository this CI repository is based on.
+        :param settings_info: The ".ci/settings.yml" already fetched from the trunk, {"content": str, "blob_id": str},
+            or None to read it when the group or the name is needed for the first time.
         """
         self.ci_vcs = ci_vcs
         self.primitive_repo = primitive_repo
-        self.__Init()
+        self.settings_blob_id = None
+        self.group = None
+        self.name = None
+        if settings_info is not None:
+            self.__Init(settings_info)
 
     def __str__(self):
         return f"{self.GetGroup()}.{self.GetName()}"
@@ -35,26 +47,75 @@ class CiRepo:
     def GetNameFromId(repo_id):
         return repo_id.split(".")[1]
 
-    def __Init(self):
+    def __Init(self, settings_info):
         """
         Initializes the CiRepo instance.
 
-        This method retrieves the trunk branch from the primitive repository, reads the CI settings from the ".ci/settings.yml" file in the trunk branch, and sets the group and name of the CI repository based on these settings.
+        This method sets the group and name of the CI repository based on the CI settings from the ".ci/settings.yml" file in the trunk branch.
         """
-        branch = self.primitive_repo.GetTrunk()
-        setting_str = branch.GetFileContent(".ci/settings.yml")
-        setting = yaml.safe_load(setting_str)
+        self.settings_blob_id = settings_info["blob_id"]
         relative_path = self.GetUrl()[len(self.primitive_repo.vcs.GetAddress())+1:]
+        self.group, self.name = CiRepo.ParseSettings(settings_info["content"], relative_path)
+
+    def __LoadSettings(self):
+        """
+        Reads the group and name on first use. The values recorded in the catalog are reused if ".ci/settings.yml"
+        has not changed since, which only costs a check of its version (blob id for git, last changed revision for
+        svn); otherwise the file is fetched and the catalog is updated.
+        """
+        if self.name is not None:
+            return
+        trunk = self.primitive_repo.GetTrunk()
+        catalog = self.ci_vcs.FindCatalog() if self.ci_vcs is not None else None
+        record = catalog.GetByUrl(self.GetUrl()) if catalog is not None else None
+        if record is not None and record["support_ci"] and record["settings_blob_id"] is not None:
+            version = trunk.GetFileVersion(CiRepo.SETTINGS_FILE)
+            if version == record["settings_blob_id"]:
+                self.settings_blob_id = version
+                self.group = record["group"]
+                self.name = record["name"]
+                return
+
+        settings_info = trunk.GetFileInfo(CiRepo.SETTINGS_FILE)
+        if settings_info is None:
+            raise Exception(f"{CiRepo.SETTINGS_FILE} not found in {self.GetUrl()}")
+        self.__Init(settings_info)
+        if record is not None:
+            catalog.Save(CiRepoCatalog.MakeRecord(self.primitive_repo, self, self.settings_blob_id))
+
+    @staticmethod
+    def ParseSettings(content, relative_path):
+        """
+        Reads the group and the name of the CI repository from the content of ".ci/settings.yml".
+
+        :param content: The content of ".ci/settings.yml".
+        :param relative_path: The path of the repository relative to the VCS address, used as the default.
+        :return: A tuple of the group and the name.
+        """
+        setting = yaml.safe_load(content)
         if setting is not None and 'group' in setting and setting['group'] != "":
-            self.group = setting['group']
+            group = setting['group']
         else:
-            self.group = relative_path[:relative_path.rfind('/')]
+            group = relative_path[:relative_path.rfind('/')]
         if setting is not None and 'name' in setting and setting['name'] != "":
-            self.name = setting['name']
+            name = setting['name']
         else:
-            self.name = relative_path[relative_path.rfind('/') + 1:]
-        self.group = self.group.replace('/', '_')
-        self.name = self.name.replace('/', '_')
+            name = relative_path[relative_path.rfind('/') + 1:]
+        return group.replace('/', '_'), name.replace('/', '_')
+
+    @staticmethod
+    def Discover(ci_vcs, primitive_repo):
+        """
+        Creates the CI repository for the primitive repository with a single fetch of ".ci/settings.yml".
+
+        :param ci_vcs: The CI version control system the repository belongs to.
+        :param primitive_repo: The primitive repository.
+        :return: The CI repository, or None if the primitive repository does not support CI.
+        """
+        settings_info = primitive_repo.GetTrunk().GetFileInfo(CiRepo.SETTINGS_FILE)
+        if settings_info is None:
+            return None
+        return CiRepo(ci_vcs, primitive_repo, settings_info)
 
     @staticmethod
     def SupportCi(primitive_repo):
@@ -65,7 +126,7 @@ class CiRepo:
         :return: True if the primitive repository supports CI, False otherwise.
         """
         branch = primitive_repo.GetTrunk()
-        if branch.FileExists(".ci/settings.yml"):
+        if branch.FileExists(CiRepo.SETTINGS_FILE):
             return True
         return False
 
@@ -75,6 +136,7 @@ class CiRepo:
 
         :return: The name of the CI repository.
         """
+        self.__LoadSettings()
         return self.name
 
     def GetGroup(self):
@@ -83,8 +145,16 @@ class CiRepo:
 
         :return: The group of the CI repository.
         """
+        self.__LoadSettings()
         return self.group
 
+    def GetSettingsBlobId(self):
+        """
+        Returns the version of ".ci/settings.yml" the group and name are read from, None if unknown.
+        """
+        self.__LoadSettings()
+        return self.settings_blob_id
+
     def GetUrl(self):
         """
         Returns the URL of the primitive repository.
@@ -157,6 +227,53 @@ class CiRepo:
             comment = "delete branch " + branch_name + " by smartci"
         self.primitive_repo.DeleteBranch(branch_name, comment)
 
+    def GetMergedBranches(self, branch_name_pattern=".*", include_unchanged=False):
+        """
+        Returns the CI branches which have been merged into the trunk, checked in one pass.
+
+        :param branch_name_pattern: The pattern of the branch name to check.
+        :param include_unchanged: True to include the branches without any commit of their own, e.g. the project
+            branches just created from the trunk, which are excluded by default.
+        :return: The merged CI branches.
+        """
+        primitive_branches = self.primitive_repo.GetMergedBranches(branch_name_pattern, include_unchanged)
+        return [CiBranch(self, primitive_branch) for primitive_branch in primitive_branches]
+
+    def DeleteMergedBranches(self, branch_name_pattern=".*", comment=None, dry_run=False, include_unchanged=False):
+        """
+        Deletes the branches which have been merged into the trunk in bulk. Protected git branches are kept.
+
+        :param branch_name_pattern: The pattern of the branch name to delete.
+        :param comment: The comment of the deletion.
+        :param dry_run: True to report the merged branches without deleting them.
+        :param include_unchanged: True to delete the branches without any commit of their own as well.
+        :return: A dictionary containing the report:
+            - 'merged': The names of the merged branches.
+            - 'deleted': The names of the deleted branches.
+            - 'list_seconds': The time spent finding the merged branches.
+            - 'delete_seconds': The time spent deleting the branches.
+        """
+        if comment is None:
+            comment = "delete merged branches by smartci"
+        start = time.time()
+        merged = self.primitive_repo.GetMergedBranches(branch_name_pattern, include_unchanged)
+        list_seconds = time.time() - start
+
+        start = time.time()
+        deleted = []
+        if not dry_run:
+            deleted = self.primitive_repo.DeleteBranches(merged, comment)
+        delete_seconds = time.time() - start
+
+        print(f"{self.Id()}: {len(merged)} merged branches found in {list_seconds:.2f}s, "
+              f"{len(deleted)} deleted in {delete_seconds:.2f}s")
+        return {
+            "merged": [branch.GetPrimitiveName() for branch in merged],
+            "deleted": [branch.GetPrimitiveName() for branch in deleted],
+            "list_seconds": list_seconds,
+            "delete_seconds": delete_seconds,
+        }
+
     def GetTag(self, tag_name):
         """
         Returns the CI tag with the given name.
@@ -0,0 +1,204 @@
+import json
+import time
+
+from smartci.util.sqlite_db import SqliteDb
+
+
+class CiRepoCatalog:
+    """
+    This class represents a persistent catalog of the repositories found on the version control systems.
+
+    The catalog is a SQLite database under CI_WORKSPACE which can be shared by all CI jobs on the same host. Each
+    record describes one primitive repository:
+        - 'url': The url of the repository.
+        - 'backend': The version control system of the repository, e.g. "git:http://127.0.0.1:8890".
+        - 'repo_id': The project id for git, or the relative path for svn.
+        - 'trunk': The name of the trunk, e.g. "master" for git or "trunk" for svn.
+        - 'group': The group of the application repository, None if the repository does not support CI.
+        - 'name': The name of the application repository, None if the repository does not support CI.
+        - 'settings_blob_id': The version of ".ci/settings.yml", None if unknown.
+        - 'support_ci': False for a repository without ".ci/settings.yml" (negative entry).
+        - 'repo_info': The fields of the primitive repository needed to restore it without any request, e.g. the
+          project name and the clone url for git, see GetRecordInfo of the primitive repository. Empty for the
+          records saved by an older version.
+        - 'updated_at': The timestamp when the record was refreshed.
+    """
+
+    FIELDS = ["url", "backend", "repo_id", "trunk", "group", "name", "settings_blob_id", "support_ci", "repo_info",
+              "updated_at"]
+
+    def __init__(self, db_path=None):
+        """
+        Initializes a new instance of the CiRepoCatalog class.
+
+        :param db_path: The path of the database file. If None, "ci_repo_catalog.db" under CI_WORKSPACE is used.
+        """
+        self.db = SqliteDb(db_path, "ci_repo_catalog.db", [
+            """
+            CREATE TABLE IF NOT EXISTS repo (
+                url TEXT PRIMARY KEY,
+                backend TEXT NOT NULL,
+                repo_id TEXT NOT NULL,
+                trunk TEXT,
+                grp TEXT,
+                name TEXT,
+                settings_blob_id TEXT,
+                support_ci INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )""",
+            "CREATE INDEX IF NOT EXISTS repo_group_name ON repo (grp, name)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS repo_backend_id ON repo (backend, repo_id)",
+        ])
+        self.db.AddColumns("repo", {"repo_info": "TEXT"})
+        self.db_path = self.db.db_path
+
+    @staticmethod
+    def __ToRecord(row):
+        if row is None:
+            return None
+        return {
+            "url": row["url"],
+            "backend": row["backend"],
+            "repo_id": row["repo_id"],
+            "trunk": row["trunk"],
+            "group": row["grp"],
+            "name": row["name"],
+            "settings_blob_id": row["settings_blob_id"],
+            "support_ci": row["support_ci"] != 0,
+            "repo_info": json.loads(row["repo_info"]) if row["repo_info"] else {},
+            "updated_at": row["updated_at"],
+        }
+
+    def __QueryOne(self, sql, args):
+        rows = self.db.Query(sql, args)
+        return CiRepoCatalog.__ToRecord(rows[0] if len(rows) > 0 else None)
+
+    def GetByName(self, group, name):
+        """
+        Returns the record of the application repository with the given group and name, or None if not found.
+        """
+        return self.__QueryOne("SELECT * FROM repo WHERE grp = ? AND name = ? AND support_ci = 1", (group, name))
+
+    def GetByUrl(self, url):
+        """
+        Returns the record of the repository with the given url, or None if not found.
+        """
+        return self.__QueryOne("SELECT * FROM repo WHERE url = ?", (url,))
+
+    def GetByRepoId(self, backend, repo_id):
+        """
+        Returns the record of the repository with the given project id (git) or relative path (svn).
+        """
+        return self.__QueryOne("SELECT * FROM repo WHERE backend = ? AND repo_id = ?", (backend, str(repo_id)))
+
+    def GetAll(self, support_ci=True):
+        """
+        Returns all records.
+
+        :param support_ci: True to return the application repositories only, False to return all repositories.
+        """
+        sql = "SELECT * FROM repo"
+        if support_ci:
+            sql += " WHERE support_ci = 1"
+        rows = self.db.Query(sql + " ORDER BY backend, repo_id")
+        return [CiRepoCatalog.__ToRecord(row) for row in rows]
+
+    def Save(self, record):
+        """
+        Adds or replaces the record of a single repository.
+        """
+        self.SaveAll([record])
+
+    def SaveAll(self, records, replaced_backends=None):
+        """
+        Adds or replaces the records of several repositories in one transaction.
+
+        :param records: The records to save.
+        :param replaced_backends: The backends which have been scanned completely. Records of these backends which
+            are not in records are removed.
+        """
+        now = time.time()
+        with self.db.Transaction() as conn:
+            if replaced_backends is not None:
+                for backend in replaced_backends:
+                    conn.execute("DELETE FROM repo WHERE backend = ?", (backend,))
+            for record in records:
+                # the (backend, repo_id) of a moved repository points to a new url
+                conn.execute("DELETE FROM repo WHERE backend = ? AND repo_id = ? AND url != ?",
+                             (record["backend"], str(record["repo_id"]), record["url"]))
+                conn.execute("INSERT OR REPLACE INTO repo "
+                             "(url, backend, repo_id, trunk, grp, name, settings_blob_id, support_ci, repo_info, "
+                             "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (record["url"], record["backend"], str(record["repo_id"]), record.get("trunk"),
+                              record.get("group"), record.get("name"), record.get("settings_blob_id"),
+                              1 if record.get("support_ci", True) else 0, json.dumps(record.get("repo_info") or {}),
+                              now))
+
+    def SaveScan(self, discovered_all, scan_errors):
+        """
+        Replaces the records of the scanned version control systems with the result of a full scan. The records of a
+        version control system which could not be listed, and of the repositories which failed to be checked, are
+        kept.
+
+        :param discovered_all: A list of (vcs, [(primitive_repo, ci_repo)]), ci_repo is None if the repository does
+            not support CI.
+        :param scan_errors: The errors of the scan, see CiVcs.GetScanErrors.
+        :return: A list of all application repositories found.
+        """
+        result = []
+        records = []
+        backends = []
+        failed_urls = set(error["url"] for error in scan_errors)
+        failed_vcs = set(error["vcs"] for error in scan_errors if error["url"] is None)
+        for vcs, discovered in discovered_all:
+            if vcs.GetAddress() in failed_vcs:  # keep the records of a vcs which could not be listed
+                continue
+            backends.append(f"{vcs.type}:{vcs.GetAddress()}")
+            for primitive_repo, ci_repo in discovered:
+                if primitive_repo.GetUrl() in failed_urls:  # keep the record of a repository failed to be checked
+                    record = self.GetByUrl(primitive_repo.GetUrl())
+                    if record is not None:
+                        records.append(record)
+                    continue
+                settings_blob_id = ci_repo.GetSettingsBlobId() if ci_repo is not None else None
+                records.append(CiRepoCatalog.MakeRecord(primitive_repo, ci_repo, settings_blob_id))
+                if ci_repo is not None:
+                    result.append(ci_repo)
+        self.SaveAll(records, backends)
+        return result
+
+    def Remove(self, url):
+        """
+        Removes the record of the repository with the given url.
+        """
+        with self.db.Transaction() as conn:
+            conn.execute("DELETE FROM repo WHERE url = ?", (url,))
+
+    def Lock(self):
+        """
+        Returns an inter-process lock which serializes full refreshes of the catalog, so that jobs missing the
+        catalog at the same time do not all scan the version control systems.
+        """
+        return self.db.Lock()
+
+    @staticmethod
+    def MakeRecord(primitive_repo, ci_repo=None, settings_blob_id=None):
+        """
+        Creates a record for the given primitive repository.
+
+        :param primitive_repo: The primitive repository.
+        :param ci_repo: The application repository based on the primitive repository, None if it does not support CI.
+        :param settings_blob_id: The version of ".ci/settings.yml".
+        """
+        vcs = primitive_repo.vcs
+        return {
+            "url": primitive_repo.GetUrl(),
+            "backend": f"{vcs.type}:{vcs.GetAddress()}",
+            "repo_id": primitive_repo.GetRepoId(),
+            "trunk": primitive_repo.GetTrunkName(),
+            "group": ci_repo.GetGroup() if ci_repo is not None else None,
+            "name": ci_repo.GetName() if ci_repo is not None else None,
+            "settings_blob_id": settings_blob_id,
+            "support_ci": ci_repo is not None,
+            "repo_info": primitive_repo.GetRecordInfo(),
+        }
@@ -1,23 +1,50 @@
-import json
 import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 
 from smartci.ci_branch import CiBranch, CiVersionEntity, CiTag, CiTrunk
+from smartci.ci_ref_index import CiRefIndex
 from smartci.ci_repo import CiRepo
+from smartci.ci_repo_catalog import CiRepoCatalog
+from smartci.util.identity_map import IdentityMap
 
 class CiVcs:
     """
     This class represents a Continuous Integration (CI) version control system (VCS).
     """
 
-    def __init__(self, vcs_list):
+    DEFAULT_REF_INDEX_MAX_AGE = 600
+    DEFAULT_REF_INDEX_REFRESH_INTERVAL = 300
+
+    def __init__(self, vcs_list, cache=None, ref_index=None):
         """
         Initializes a new instance of the CiVcs class.
 
         :param vcs_list: The list of version control systems this CI VCS belongs to.
+        :param cache: The options of the identity map of repositories and version entities, a dict with the keys
+            'max_size' (default 1024, 0 to disable) and 'ttl' (seconds, default 300).
+        :param ref_index: The options of the reference index, a dict with the keys 'max_age' (seconds, default 600)
+            and 'refresh_interval' (seconds, default 300).
         """
         self.vcs_list = vcs_list
+        self.catalog = None
+        self.ref_index = None
+        if ref_index is None:
+            ref_index = {}
+        self.ref_index_max_age = ref_index.get("max_age", CiVcs.DEFAULT_REF_INDEX_MAX_AGE)
+        self.ref_index_refresh_interval = ref_index.get("refresh_interval", CiVcs.DEFAULT_REF_INDEX_REFRESH_INTERVAL)
+        self.ref_index_refresher = None
+        self.ref_index_refresher_stop = threading.Event()
+        self.scan_errors = []
+        if cache is None:
+            cache = {}
+        self.identity_map = IdentityMap(cache.get("max_size", IdentityMap.DEFAULT_MAX_SIZE),
+                                        cache.get("ttl", IdentityMap.DEFAULT_TTL))
 
     def GetAllRepo(self):
         """
@@ -31,15 +58,134 @@ class CiVcs:
         """
         Retrieves all application repositories which has branch with the given branch name.
 
+        All version control systems are scanned at the same time, each on a worker pool bounded by its
+        "concurrency" option. A repository which fails to be checked is skipped and reported by GetScanErrors().
+
         :param branch_name: The name of the branch to retrieve the repositories for, or None to retrieve all application repositories.
-        :return: A list of all application repositories which has branch with the given branch name.
+        :return: A list of all application repositories which has branch with the given branch name, in the order of
+            the version control systems and their repositories.
         """
         result = []
-        for vcs in self.vcs_list:
-            re = self.GetAllRepoWithBranchInSingleVcs(vcs, branch_name)
-            result.extend(re)
+        for vcs, discovered in self.__DiscoverAllVcs(branch_name):
+            for primitive_repo, ci_repo in discovered:
+                if ci_repo is not None:
+                    result.append(ci_repo)
         return result
 
+    def IterAllRepo(self):
+        """
+        Iterates all application repositories, see IterAllRepoWithBranch.
+        """
+        return self.IterAllRepoWithBranch(None)
+
+    def IterAllRepoWithBranch(self, branch_name):
+        """
+        Iterates the application repositories which has branch with the given branch name, yielding each repository
+        as soon as it is resolved, so that the first repositories can be processed while the rest are discovered.
+
+        All version control systems are scanned at the same time, the repositories of each are listed page by page and
+        checked on a worker pool bounded by its "concurrency" option. A repository which fails to be checked is
+        skipped and reported by GetScanErrors() when the iteration ends.
+
+        :param branch_name: The name of the branch, or None to iterate all application repositories.
+        :return: A generator of the application repositories, in the order they are resolved.
+        """
+        results = queue.Queue()
+        stop = threading.Event()
+        errors = []
+        done = object()
+
+        def produce(vcs):
+            batch_size = vcs.GetBatchLoadSize() if vcs.IsSupportBatchLoad() else 1
+            window = threading.Semaphore(vcs.concurrency * 2)  # batches listed ahead of the workers
+            executor = ThreadPoolExecutor(max_workers=vcs.concurrency)
+
+            def discover(batch):
+                try:
+                    for primitive_repo, ci_repo in self.__DiscoverBatch(vcs, batch, branch_name, errors):
+                        if ci_repo is not None:
+                            results.put(ci_repo)
+                finally:
+                    window.release()
+
+            try:
+                batch = []
+                for primitive_repo in vcs.IterRepos():
+                    batch.append(primitive_repo)
+                    if len(batch) < batch_size:
+                        continue
+                    window.acquire()
+                    if stop.is_set():
+                        break
+                    executor.submit(discover, batch)
+                    batch = []
+                if len(batch) > 0 and not stop.is_set():
+                    window.acquire()
+                    executor.submit(discover, batch)
+            except Exception as e:
+                errors.append({"vcs": vcs.GetAddress(), "url": None, "error": str(e)})
+            finally:
+                executor.shutdown(wait=True, cancel_futures=stop.is_set())
+                results.put(done)
+
+        producers = [threading.Thread(target=produce, args=(vcs,), daemon=True) for vcs in self.vcs_list]
+        for producer in producers:
+            producer.start()
+        remaining = len(producers)
+        try:
+            while remaining > 0:
+                item = results.get()
+                if item is done:
+                    remaining -= 1
+                    continue
+                yield item
+        finally:
+            stop.set()
+            self.scan_errors = errors
+
+    def __DiscoverBatch(self, primitive_vcs, primitive_repos, branch_name, errors):
+        if len(primitive_repos) > 1:
+            try:
+                return self.__BatchDiscoverRepos(primitive_vcs, primitive_repos, branch_name)
+            except Exception as e:
+                print(f"batch load repos failed, fallback to load one by one: {e}")
+        return [self.__DiscoverRepo(primitive_vcs, primitive_repo, branch_name, errors)
+                for primitive_repo in primitive_repos]
+
+    def GetScanErrors(self):
+        """
+        Returns the errors of the last scan of the version control systems.
+
+        :return: A list of dictionaries containing:
+            - 'vcs': The address of the version control system.
+            - 'url': The url of the repository, or None if the repositories could not be listed.
+            - 'error': The error message.
+        """
+        return list(self.scan_errors)
+
+    def __DiscoverAllVcs(self, branch_name=None):
+        """
+        Discovers the application repositories of all version control systems concurrently.
+
+        :return: A list of (vcs, discovered) in the order of vcs_list, discovered is the result of __DiscoverRepos,
+            or None if the repositories of the vcs could not be listed.
+        """
+        errors = []
+
+        def discover(vcs):
+            try:
+                return vcs, self.__DiscoverRepos(vcs, branch_name, errors)
+            except Exception as e:
+                errors.append({"vcs": vcs.GetAddress(), "url": None, "error": str(e)})
+                return vcs, None
+
+        with ThreadPoolExecutor(max_workers=max(len(self.vcs_list), 1)) as executor:
+            result = list(executor.map(discover, self.vcs_list))
+        self.scan_errors = errors
+        if len(errors) > 0:
+            print(f"{len(errors)} errors while scanning the repositories, see CiVcs.GetScanErrors()")
+        return [(vcs, discovered if discovered is not None else []) for vcs, discovered in result]
+
     def GetAllRepoInSingleVcs(self, primitive_vcs):
         """
         Retrieves all application repositories in a single VCS.
@@ -57,17 +203,55 @@ class CiVcs:
         :param branch_name: The name of the branch to retrieve the repositories for, or None to retrieve all application repositories.
         :return: A list of all application repositories in the given VCS which has branch with the given branch name.
         """
+        errors = []
         result = []
-        primitive_repos = primitive_vcs.GetRepos()
-        for primitive_repo in primitive_repos:
-            if not CiRepo.SupportCi(primitive_repo):
-                continue
-            ci_repo = CiRepo(self, primitive_repo)
-            if branch_name is not None:
-                if ci_repo.GetBranch(branch_name) is not None:
-                    result.append(ci_repo)
-            else:
+        for primitive_repo, ci_repo in self.__DiscoverRepos(primitive_vcs, branch_name, errors):
+            if ci_repo is not None:
                 result.append(ci_repo)
+        self.scan_errors = errors
+        return result
+
+    def __DiscoverRepos(self, primitive_vcs, branch_name=None, errors=None):
+        """
+        Discovers the application repositories of a single VCS on a bounded worker pool.
+
+        :param errors: The list to append the errors of the repositories to, the errors are raised if None.
+        :return: A list of (primitive_repo, ci_repo) in the order of primitive_vcs.GetRepos(), ci_repo is None if the
+            repository does not support CI, has no branch with the given branch name, or failed to be checked.
+        """
+        def discover(primitive_repo):
+            return self.__DiscoverRepo(primitive_vcs, primitive_repo, branch_name, errors)
+
+        primitive_repos = primitive_vcs.GetRepos()
+        if primitive_vcs.IsSupportBatchLoad():
+            try:
+                return self.__BatchDiscoverRepos(primitive_vcs, primitive_repos, branch_name)
+            except Exception as e:
+                print(f"batch load repos failed, fallback to load one by one: {e}")
+        with ThreadPoolExecutor(max_workers=primitive_vcs.concurrency) as executor:
+            return list(executor.map(discover, primitive_repos))
+
+    def __DiscoverRepo(self, primitive_vcs, primitive_repo, branch_name, errors):
+        try:
+            ci_repo = self.__Remember(CiRepo.Discover(self, primitive_repo))
+            if ci_repo is not None and branch_name is not None and ci_repo.GetBranch(branch_name) is None:
+                ci_repo = None
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.append({"vcs": primitive_vcs.GetAddress(), "url": primitive_repo.GetUrl(), "error": str(e)})
+            ci_repo = None
+        return primitive_repo, ci_repo
+
+    def __BatchDiscoverRepos(self, primitive_vcs, primitive_repos, branch_name):
+        result = []
+        infos = primitive_vcs.BatchLoadRepos(primitive_repos, CiRepo.SETTINGS_FILE, branch_name)
+        for primitive_repo, info in zip(primitive_repos, infos):
+            ci_repo = None
+            if info is not None and info["file"] is not None:
+                if branch_name is None or info["branch_sha"] is not None:
+                    ci_repo = self.__Remember(CiRepo(self, primitive_repo, info["file"]))
+            result.append((primitive_repo, ci_repo))
         return result
 
     def GetRepo(self, group, name):
@@ -78,37 +262,375 @@ class CiVcs:
         :param name: The name of the repository to retrieve.
         :return: The application repository with the given group and name, or None if no such repository exists.
         """
-        cache_file = os.path.join(os.getenv("CI_WORKSPACE"), "ci_repo_cache.json")
-        if os.path.exists(cache_file):
-            with open(cache_file, "r", encoding="utf8") as f:
-                cache = json.load(f)
-                if group in cache and name in cache[group]:
-                    try:
-                        url = cache[group][name]
-                        return self.GetCiRepoByUrl(url)
-                    except:
-                        pass
-            f.close()
+        catalog = self.GetCatalog()
+        record = catalog.GetByName(group, name)
+        if record is not None:
+            ci_repo = self.__GetCiRepoByRecord(record, group, name)
+            if ci_repo is not None:
+                return ci_repo
+
+        wait_start = time.time()
+        with catalog.Lock():
+            # another job may have refreshed the catalog while waiting for the lock
+            record = catalog.GetByName(group, name)
+            if record is not None and record["updated_at"] >= wait_start:
+                return self.__GetCiRepoByRecord(record, group, name)
+            for ci_repo in self.RefreshCatalog():
+                if ci_repo.GetGroup() == group and ci_repo.GetName() == name:
+                    return ci_repo
+        return None
+
+    def __GetCiRepoByRecord(self, record, group, name):
+        try:
+            ci_repo = self.RefreshCatalogEntry(record["url"])
+        except Exception as e:
+            print(f"refresh catalog entry {record['url']} failed: {e}")
+            return None
+        if ci_repo is None or ci_repo.GetGroup() != group or ci_repo.GetName() != name:
+            return None
+        return ci_repo
+
+    def GetCatalog(self):
+        """
+        Returns the persistent repository catalog under CI_WORKSPACE.
+
+        :return: The CiRepoCatalog object.
+        """
+        if self.catalog is None:
+            self.catalog = CiRepoCatalog()
+        return self.catalog
+
+    def FindCatalog(self):
+        """
+        Returns the repository catalog if available, for the lookups which can do without it.
+
+        :return: The CiRepoCatalog object, or None if CI_WORKSPACE is not set.
+        """
+        if self.catalog is None and not os.environ.get("CI_WORKSPACE"):
+            return None
+        return self.GetCatalog()
+
+    def RefreshCatalog(self):
+        """
+        Scans all version control systems and replaces the repository catalog with the result.
 
-        ci_repos = self.GetAllRepo()
-        cache = {}
-        re = None
-        for ci_repo in ci_repos:
-            if ci_repo.GetGroup() not in cache:
-                cache[ci_repo.GetGroup()] = {}
-            cache[ci_repo.GetGroup()][ci_repo.GetName()] = ci_repo.GetUrl()
+        :return: A list of all application repositories.
+        """
+        discovered_all = self.__DiscoverAllVcs()
+        return self.GetCatalog().SaveScan(discovered_all, self.scan_errors)
+
+    def RefreshCatalogEntry(self, url):
+        """
+        Refreshes the catalog record of a single repository.
+
+        :param url: The url of the repository.
+        :return: The application repository with the given url, or None if the repository does not exist or does
+            not support CI.
+        """
+        catalog = self.GetCatalog()
+        record = catalog.GetByUrl(url)
+        vcs_list = self.vcs_list
+        if record is not None:
+            vcs_list = [vcs for vcs in self.vcs_list if f"{vcs.type}:{vcs.GetAddress()}" == record["backend"]]
+        for vcs in vcs_list:
+            if not url.startswith(vcs.GetAddress()):
+                continue
+            primitive_repo = vcs.GetRepoByUrl(url)
+            if primitive_repo is None:
+                continue
+            ci_repo = self.__Remember(CiRepo.Discover(self, primitive_repo))
+            settings_blob_id = ci_repo.GetSettingsBlobId() if ci_repo is not None else None
+            catalog.Save(CiRepoCatalog.MakeRecord(primitive_repo, ci_repo, settings_blob_id))
+            return ci_repo
+        if record is not None:
+            catalog.Remove(url)
+        return None
+
+    def GetRefIndex(self):
+        """
+        Returns the persistent reference index under CI_WORKSPACE.
+
+        :return: The CiRefIndex object.
+        """
+        if self.ref_index is None:
+            self.ref_index = CiRefIndex()
+        return self.ref_index
+
+    def RefreshRefIndex(self, primitive_vcs=None):
+        """
+        Updates the reference index with the trunk and the branches of all application repositories, each version
+        control system on a worker pool bounded by its "concurrency" option. The references of an entity are only
+        read again if its head has changed since it was indexed. The index of a repository is only removed when the
+        repository is no longer listed, not when it fails to be read. The scan time is recorded even if some
+        repositories failed, their errors are returned in the statistics.
+
+        :param primitive_vcs: The version control system to index, or None for all.
+        :return: The statistics, {"repos": int, "entities": int, "updated": int, "errors": list}.
+        """
+        index = self.GetRefIndex()
+        stats = {"repos": 0, "entities": 0, "updated": 0, "errors": []}
+        for vcs in self.vcs_list if primitive_vcs is None else [primitive_vcs]:
+            start = time.time()
+            ci_repos, listed_urls = self.__GetIndexedRepos(vcs, stats["errors"])
 
-            if ci_repo.GetGroup() == group and ci_repo.GetName() == name:
-                re = ci_repo
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2)
-        return re
+            def index_repo(ci_repo):
+                try:
+                    return self.__IndexRepo(ci_repo)
+                except Exception as e:
+                    stats["errors"].append({"vcs": vcs.GetAddress(), "url": ci_repo.GetUrl(), "error": str(e)})
+                    return 0, 0
+
+            with ThreadPoolExecutor(max_workers=vcs.concurrency) as executor:
+                for entities, updated in executor.map(index_repo, ci_repos):
+                    stats["entities"] += entities
+                    stats["updated"] += updated
+            stats["repos"] += len(ci_repos)
+            if listed_urls is not None:
+                index.RemoveReposExcept(vcs.GetAddress(), listed_urls)
+            index.SetScannedAt(f"{vcs.type}:{vcs.GetAddress()}", start)
+        print(f"ref index refreshed: {stats['repos']} repos, {stats['entities']} entities, "
+              f"{stats['updated']} updated, {len(stats['errors'])} errors")
+        return stats
+
+    def __GetIndexedRepos(self, vcs, errors):
+        """
+        Returns the application repositories of a single VCS to index, and the urls of all its listed repositories, None
+        if they could not be listed. The repositories known by the catalog are not checked again, the repositories
+        added since the last RefreshCatalog are discovered and added to the catalog.
+
+        :param errors: The list to append the errors of the vcs and of the repositories to.
+        """
+        catalog = self.GetCatalog()
+        backend = f"{vcs.type}:{vcs.GetAddress()}"
+        records = {record["url"]: record for record in catalog.GetAll(support_ci=False) if record["backend"] == backend}
+        try:
+            primitive_repos = vcs.GetRepos()
+        except Exception as e:
+            # the repositories of the catalog are still indexed, but none is known to be deleted
+            errors.append({"vcs": vcs.GetAddress(), "url": None, "error": str(e)})
+            return self.__GetCatalogRepos(vcs, records.values(), errors), None
+
+        def discover(primitive_repo):
+            record = records.get(primitive_repo.GetUrl())
+            if record is not None:
+                return self.CreateCiRepo(primitive_repo) if record["support_ci"] else None
+            try:
+                ci_repo = self.__Remember(CiRepo.Discover(self, primitive_repo))
+                settings_blob_id = ci_repo.GetSettingsBlobId() if ci_repo is not None else None
+                catalog.Save(CiRepoCatalog.MakeRecord(primitive_repo, ci_repo, settings_blob_id))
+                return ci_repo
+            except Exception as e:
+                errors.append({"vcs": vcs.GetAddress(), "url": primitive_repo.GetUrl(), "error": str(e)})
+                return None
+
+        with ThreadPoolExecutor(max_workers=vcs.concurrency) as executor:
+            ci_repos = [ci_repo for ci_repo in executor.map(discover, primitive_repos) if ci_repo is not None]
+        return ci_repos, [primitive_repo.GetUrl() for primitive_repo in primitive_repos]
+
+    def __GetCatalogRepos(self, vcs, records, errors):
+        repos = []
+        for record in records:
+            if not record["support_ci"]:
+                continue
+            try:
+                primitive_repo = vcs.GetRepoFromRecord(record)
+                if primitive_repo is None:  # an older record, looked up on the server
+                    primitive_repo = vcs.GetRepoByUrl(record["url"])
+            except Exception as e:
+                errors.append({"vcs": vcs.GetAddress(), "url": record["url"], "error": str(e)})
+                continue
+            if primitive_repo is not None:
+                repos.append(self.CreateCiRepo(primitive_repo))
+        return repos
+
+    def __IndexRepo(self, ci_repo):
+        index = self.GetRefIndex()
+        url = ci_repo.GetUrl()
+        known_heads = index.GetHeads(url)
+        entities = [ci_repo.GetTrunk()] + ci_repo.GetBranches(".*")
+        changed = {}
+        for entity in entities:
+            name = entity.GetPrimitiveName()
+            head = entity.GetLastCommitId()
+            if known_heads.get(name) != head:
+                changed[name] = {"head": head, "refs": entity.GetPrimitiveEntity().GetRefs()}
+        removed = set(known_heads.keys()) - set(entity.GetPrimitiveName() for entity in entities)
+        if len(changed) > 0 or len(removed) > 0:
+            index.SaveRepo(url, changed, removed)
+        return len(entities), len(changed)
+
+    def IndexEntity(self, ci_version_entity):
+        """
+        Brings the reference index of a single entity up to date, e.g. after its references have been changed.
+
+        :param ci_version_entity: The CI branch or trunk.
+        :return: The references of the entity, see CiRefIndex.GetRefs.
+        """
+        index = self.GetRefIndex()
+        url = ci_version_entity.ci_repo.GetUrl()
+        name = ci_version_entity.GetPrimitiveName()
+        head = ci_version_entity.GetLastCommitId()
+        if index.GetHead(url, name) == head:
+            return index.GetRefs(url, name)
+        refs = ci_version_entity.GetPrimitiveEntity().GetRefs()
+        index.SaveEntity(url, name, head, refs)
+        return refs
+
+    def GetRefIndexAge(self, primitive_vcs=None):
+        """
+        Returns how old the reference index is, i.e. the seconds since the start of the last complete scan.
+
+        :param primitive_vcs: The version control system, or None for the oldest of all.
+        :return: The age in seconds, or None if a version control system has never been scanned.
+        """
+        index = self.GetRefIndex()
+        now = time.time()
+        age = 0
+        for vcs in self.vcs_list if primitive_vcs is None else [primitive_vcs]:
+            scanned_at = index.GetScannedAt(f"{vcs.type}:{vcs.GetAddress()}")
+            if scanned_at is None:
+                return None
+            age = max(age, now - scanned_at)
+        return age
+
+    def GetReferrers(self, url, branch_name=None, max_age=None):
+        """
+        Answers which branches in which repositories reference the repository, optionally at the given branch, from
+        the reference index. No request is sent unless the index is older than max_age, in which case the version
+        control system of the repository is indexed incrementally first.
+
+        Example:
+            result = ci_vcs.GetReferrers("http://127.0.0.1:8890/root/lib", "master")
+            for referrer in result["referrers"]:
+                print(referrer["repo_url"], referrer["name"], referrer["mount_rel_path"])
+
+        :param url: The url of the referenced repository.
+        :param branch_name: The primitive name of the referenced branch, e.g. "master", or None for any.
+        :param max_age: The max age in seconds of the index, None to use the "max_age" option.
+        :return: {"referrers": list, "index_age": float}, each referrer is {"repo_url": str, "name": str,
+            "head": str, "mount_rel_path": str, "ref_name": str}, "name" and "head" are the primitive name and the
+            indexed head of the referencing entity, "index_age" is the age of the index answering the query.
+        """
+        vcs = self.__GetVcsOfUrl(url)
+        if max_age is None:
+            max_age = self.ref_index_max_age
+        index = self.GetRefIndex()
+        age = self.GetRefIndexAge(vcs)
+        if age is None or age > max_age:
+            with index.Lock():
+                # another job may have refreshed the index while waiting for the lock
+                age = self.GetRefIndexAge(vcs)
+                if age is None or age > max_age:
+                    self.RefreshRefIndex(vcs)
+                    age = self.GetRefIndexAge(vcs)
+        return {"referrers": index.GetReferrers(url, branch_name), "index_age": age}
+
+    def __GetVcsOfUrl(self, url):
+        for vcs in self.vcs_list:
+            if url.startswith(vcs.GetAddress() + "/"):
+                return vcs
+        raise Exception(f"no vcs found for {url}")
+
+    def StartRefIndexRefresher(self, interval=None):
+        """
+        Starts a daemon thread refreshing the reference index incrementally at the given interval, so that the
+        queries of a long-running service are answered by an up to date index without waiting for a scan.
+
+        :param interval: The seconds between two scans, None to use the "refresh_interval" option.
+        """
+        if self.ref_index_refresher is not None:
+            return
+        if interval is None:
+            interval = self.ref_index_refresh_interval
+        self.ref_index_refresher_stop.clear()
+
+        def refresh():
+            while not self.ref_index_refresher_stop.is_set():
+                try:
+                    with self.GetRefIndex().Lock():
+                        self.RefreshRefIndex()
+                except Exception as e:
+                    print(f"refresh ref index failed: {e}")
+                self.ref_index_refresher_stop.wait(interval)
+
+        self.ref_index_refresher = threading.Thread(target=refresh, name="ref-index-refresher", daemon=True)
+        self.ref_index_refresher.start()
+
+    def StopRefIndexRefresher(self):
+        """
+        Stops the thread started by StartRefIndexRefresher and waits for the running scan to finish.
+        """
+        if self.ref_index_refresher is None:
+            return
+        self.ref_index_refresher_stop.set()
+        self.ref_index_refresher.join()
+        self.ref_index_refresher = None
+
+    def FindReferrers(self, ci_repo, branch_name_pattern=".*"):
+        """
+        Returns the branches referencing the repository. The repositories referencing it on any entity are looked up
+        by GetReferrers, and their branches matching the pattern are listed, so that a branch created after the last
+        scan, e.g. from a referencing trunk, is found too. The branches whose head is not the indexed one are
+        indexed again, the others are answered by the index.
+
+        :param ci_repo: The referenced CI repository.
+        :param branch_name_pattern: The pattern of the names of the referencing branches.
+        :return: A list of CiBranch objects.
+        """
+        index = self.GetRefIndex()
+        url = ci_repo.GetUrl()
+        referrer_urls = []
+        for referrer in self.GetReferrers(url)["referrers"]:
+            if referrer["repo_url"] not in referrer_urls:
+                referrer_urls.append(referrer["repo_url"])
+
+        result = []
+        for referrer_url in referrer_urls:
+            referrer_repo = self.GetCiRepoByUrl(referrer_url)
+            if referrer_repo is None:
+                continue
+            known_heads = index.GetHeads(referrer_url)
+            branches = referrer_repo.GetBranches(branch_name_pattern)
+            for branch in branches:
+                name = branch.GetPrimitiveName()
+                if known_heads.get(name) == branch.GetLastCommitId():
+                    refs = index.GetRefs(referrer_url, name)
+                else:
+                    refs = self.IndexEntity(branch)
+                if any(ref["repo_url"] == url for ref in refs):
+                    result.append(branch)
+            # the indexed branches matching the pattern which are no longer listed have been deleted
+            listed = set(branch.GetPrimitiveName() for branch in branches)
+            for name in known_heads:
+                if (name not in listed and name != referrer_repo.primitive_repo.GetTrunkName()
+                        and re.match(branch_name_pattern, name) is not None):
+                    index.RemoveEntity(referrer_url, name)
+        return result
 
     def GetCiRepoByUrl(self, url):
+        """
+        Returns the application repository with the given url. A repository found in the identity map or the catalog
+        is returned without any request, its group and name are read when needed for the first time.
+
+        :param url: The url of the repository.
+        :return: The application repository, or None if the repository does not exist.
+        """
+        for vcs in self.vcs_list:
+            ci_repo = self.identity_map.Get(CiVcs.__RepoKey(vcs, url))
+            if ci_repo is not None:
+                return ci_repo
+        catalog = self.FindCatalog()
+        record = catalog.GetByUrl(url) if catalog is not None else None
+        if record is not None and record["support_ci"]:
+            for vcs in self.vcs_list:
+                if f"{vcs.type}:{vcs.GetAddress()}" == record["backend"]:
+                    primitive_repo = vcs.GetRepoFromRecord(record)
+                    if primitive_repo is not None:  # None for an older record, looked up on the server below
+                        return self.CreateCiRepo(primitive_repo)
         for vcs in self.vcs_list:
             primitive_repo = vcs.GetRepoByUrl(url)
             if primitive_repo is not None:
-                return CiRepo(self, primitive_repo)
+                return self.CreateCiRepo(primitive_repo)
         return None
 
     def GetCiRepoById(self, id):
@@ -125,12 +647,46 @@ class CiVcs:
 
     def CreateCiRepo(self, primitive_repo):
         """
-        Creates a new CiRepo object.
+        Returns the CiRepo object of the primitive repository. The same object is returned for the same repository
+        until it expires from the identity map, so ".ci/settings.yml" is not read again.
+
+        :param primitive_repo: The primitive repository to base the CiRepo object on.
+        :return: The CiRepo object.
+        """
+        key = CiVcs.__RepoKey(primitive_repo.vcs, primitive_repo.GetUrl())
+        return self.identity_map.GetOrCreate(key, lambda: CiRepo(self, primitive_repo))
+
+    def CreateCiVersionEntity(self, ci_repo, primitive_entity):
+        """
+        Returns the CI version entity of the primitive entity. The same object is returned for the same branch, tag or
+        trunk until it expires from the identity map, it then takes the given primitive entity, whose branch or tag
+        info (e.g. the head commit) has just been read.
+
+        :param ci_repo: The CI repository the entity belongs to.
+        :param primitive_entity: The primitive entity to base the CI version entity on.
+        :return: The CiBranch, CiTag or CiTrunk object.
+        """
+        key = (CiVcs.__RepoKey(ci_repo.GetPrimitiveVcs(), ci_repo.GetUrl())
+               + f"|{primitive_entity.GetType()}:{primitive_entity.GetPrimitiveName()}")
+        ci_entity = self.identity_map.GetOrCreate(key, lambda: CiVersionEntity.Create(ci_repo, primitive_entity))
+        if ci_entity is not None and ci_entity.primitive_entity is not primitive_entity:
+            ci_entity.primitive_entity = primitive_entity
+        return ci_entity
 
-        :param primitive_repo: The primitive repository to base the new CiRepo object on.
-        :return: The new CiRepo object.
+    def ClearIdentityMap(self):
+        """
+        Drops all repositories and version entities kept by the identity map, e.g. after their settings changed.
         """
-        return CiRepo(self, primitive_repo)
+        self.identity_map.Clear()
+
+    @staticmethod
+    def __RepoKey(vcs, url):
+        return f"{vcs.type}:{vcs.GetAddress()}|{url}"
+
+    def __Remember(self, ci_repo):
+        if ci_repo is not None:
+            self.identity_map.Put(CiVcs.__RepoKey(ci_repo.GetPrimitiveVcs(), ci_repo.GetUrl()), ci_repo)
+        return ci_repo
 
     def GetVersionEntityFromLocalPath(self, local_path):
         """
@@ -142,24 +698,15 @@ class CiVcs:
         for vcs in self.vcs_list:
             primitive_entity = vcs.GetVersionEntityFromLocalPath(local_path)
             if primitive_entity is not None:
-                ci_repo = CiRepo(self, primitive_entity.repo)
-                if primitive_entity.GetType() == "branch":
-                    ci_entity = CiBranch(ci_repo, primitive_entity)
-                elif primitive_entity.GetType() == "tag":
-                    ci_entity = CiTag(ci_repo, primitive_entity)
-                elif primitive_entity.GetType() == "trunk":
-                    ci_entity = CiTrunk(ci_repo, primitive_entity)
-                else:
-                    raise Exception("invalid version entity type " + primitive_entity.GetType())
+                ci_repo = self.CreateCiRepo(primitive_entity.repo)
+                ci_entity = self.CreateCiVersionEntity(ci_repo, primitive_entity)
                 return ci_entity
         return None
 
     @staticmethod
-    def Create(cfg_str=None):
+    def LoadCfgs(cfg_str=None):
         """
-        Creates a new CiVcs object based on the configuration in the "ci_vcs_cfg.yml" file.
-
-        :return: The new CiVcs object.
+        Loads the configuration from the given string, or from the "ci_vcs_cfg.yml" file in CI_WORKSPACE if None.
         """
         if cfg_str is None:
             yaml_cfg_file = os.path.join(os.getenv("CI_WORKSPACE"), "ci_vcs_cfg.yml")
@@ -168,6 +715,19 @@ class CiVcs:
             f.close()
         else:
             cfgs = yaml.safe_load(cfg_str)
+        return cfgs
+
+    @staticmethod
+    def Create(cfg_str=None):
+        """
+        Creates a new CiVcs object based on the configuration in the "ci_vcs_cfg.yml" file.
+
+        :return: The new CiVcs object.
+        """
+        cfgs = CiVcs.LoadCfgs(cfg_str)
+        if "cmd_concurrency" in cfgs:
+            from smartci.util.cmd_runner import CmdRunner
+            CmdRunner.SetConcurrency(cfgs["cmd_concurrency"])
 
         vcs_list = []
         from smartci.util import encrypt
@@ -182,15 +742,15 @@ class CiVcs:
                     password = cfg["password"]
                     if "secret" in cfg:
                         password = encrypt.XorDecrypt(password, cfg["secret"])
-                vcs = Svn(cfg["url"], username, password, cfg["repository"])
+                vcs = Svn(cfg["url"], username, password, cfg["repository"], cfg)
                 vcs_list.append(vcs)
             elif cfg["type"] == "git":
                 from smartci.vcs.git.git_vcs import Git
                 access_token = cfg["access_token"]
                 if "secret" in cfg:
                     access_token = encrypt.XorDecrypt(access_token, cfg["secret"])
-                vcs = Git(cfg["url"], cfg["username"], access_token)
+                vcs = Git(cfg["url"], cfg["username"], access_token, cfg)
                 vcs_list.append(vcs)
             else:
                 pass
-        return CiVcs(vcs_list)
+        return CiVcs(vcs_list, cfgs.get("cache"), cfgs.get("ref_index"))
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CmdError(Exception):
+    """
+    Raised when a command fails or times out. The message is the output of the command with the secrets redacted.
+    """
+
+    def __init__(self, message, returncode=None):
+        super().__init__(message)
+        self.returncode = returncode  # None if the command timed out
+
+
+class CmdRunner:
+    """
+    Runs git and svn commands as asyncio subprocesses.
+
+    All runners of the process share one limit of the commands running at the same time, whether they are called
+    from threads or from event loops, so that multi-repo checkouts and svn queries can overlap without flooding the
+    host or the server.
+
+    Usage:
+        runner = CmdRunner(secrets=[password], timeout=600)
+        output = runner.Run(["svn", "info", url])               # from sync code
+        output = await runner.RunAsync(["svn", "info", url])    # from async code
+    """
+
+    DEFAULT_CONCURRENCY = 8
+    MAX_LINE_SIZE = 16 * 1024 * 1024  # e.g. "svn propget --xml" may print a long line
+
+    __semaphore = threading.BoundedSemaphore(DEFAULT_CONCURRENCY)
+    __stats_lock = threading.Lock()
+    __stats = {"commands": 0, "failures": 0, "timeouts": 0, "seconds": 0.0}
+
+    def __init__(self, secrets=None, timeout=None, on_output=None):
+        """
+        :param secrets: The strings to replace by "******" in the output, e.g. passwords and access tokens.
+        :param timeout: The default timeout in seconds of each command, None for no timeout.
+        :param on_output: The default callback receiving each line of the output as soon as it is printed.
+        """
+        self.secrets = [secret for secret in (secrets or []) if secret]
+        self.timeout = timeout
+        self.on_output = on_output
+
+    @staticmethod
+    def SetConcurrency(concurrency):
+        """
+        Sets the max number of commands running at the same time in the process.
+        """
+        CmdRunner.__semaphore = threading.BoundedSemaphore(concurrency)
+
+    @staticmethod
+    def GetStats():
+        """
+        Returns the statistics of all commands run in the process, e.g. {"commands": 10, "seconds": 12.5, ...}.
+        """
+        with CmdRunner.__stats_lock:
+            return dict(CmdRunner.__stats)
+
+    @staticmethod
+    def __Count(seconds, failed=False, timed_out=False):
+        with CmdRunner.__stats_lock:
+            CmdRunner.__stats["commands"] += 1
+            CmdRunner.__stats["seconds"] += seconds
+            if failed:
+                CmdRunner.__stats["failures"] += 1
+            if timed_out:
+                CmdRunner.__stats["timeouts"] += 1
+
+    def Redact(self, text):
+        for secret in self.secrets:
+            text = text.replace(secret, "******")
+        return text
+
+    def Run(self, cmd, cwd=None, timeout=None, disable_stderr=False, on_output=None):
+        """
+        Runs the command and waits for it, see RunAsync.
+        """
+        coroutine = self.RunAsync(cmd, cwd, timeout, disable_stderr, on_output)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        # called by sync code running inside an event loop, which can not be nested
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+    async def RunAsync(self, cmd, cwd=None, timeout=None, disable_stderr=False, on_output=None):
+        """
+        Runs the command.
+
+        :param cmd: The command and its arguments.
+        :param cwd: The working directory of the command.
+        :param timeout: The timeout in seconds, the default timeout of the runner if None.
+        :param disable_stderr: True to discard stderr, otherwise stderr is merged into the output.
+        :param on_output: The callback receiving each line of the output, the default callback of the runner if None.
+        :return: The output of the command, not redacted.
+        :raises CmdError: If the command exits with a non-zero code or times out.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if on_output is None:
+            on_output = self.on_output
+        semaphore = CmdRunner.__semaphore
+        if not semaphore.acquire(blocking=False):
+            acquiring = asyncio.ensure_future(asyncio.to_thread(semaphore.acquire))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                acquiring.add_done_callback(lambda future: semaphore.release())
+                raise
+        start = time.time()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, cwd=cwd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL if disable_stderr else asyncio.subprocess.STDOUT,
+                limit=CmdRunner.MAX_LINE_SIZE)
+            lines = []
+            try:
+                await asyncio.wait_for(self.__ReadOutput(process, lines, on_output), timeout)
+            except asyncio.TimeoutError:
+                await CmdRunner.__Kill(process)
+                CmdRunner.__Count(time.time() - start, timed_out=True)
+                raise CmdError(f"{self.Redact(' '.join(cmd[:2]))} timed out after {timeout}s\n"
+                               + self.Redact("".join(lines)))
+            except asyncio.CancelledError:
+                # the slot of the semaphore is only released once the process is gone
+                await CmdRunner.__Kill(process)
+                raise
+        finally:
+            semaphore.release()
+
+        output = "".join(lines)
+        if process.returncode != 0:
+            CmdRunner.__Count(time.time() - start, failed=True)
+            raise CmdError(self.Redact(output), process.returncode)
+        CmdRunner.__Count(time.time() - start)
+        return output
+
+    @staticmethod
+    async def __Kill(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:  # exited in the meantime
+                pass
+        await process.wait()
+
+    async def __ReadOutput(self, process, lines, on_output):
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            line = line.decode("utf-8")
+            lines.append(line)
+            if on_output is not None:
+                on_output(self.Redact(line))
+        await process.wait()
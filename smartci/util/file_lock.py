@@ -0,0 +1,64 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, the lock degrades to a no-op
+    fcntl = None
+
+
+class FileLock:
+    """
+    An inter-process lock based on flock, used to serialize jobs running on the same host.
+
+    Usage:
+        with FileLock(path):
+            ...
+    """
+
+    def __init__(self, path, shared=False):
+        """
+        :param path: The path of the lock file, created if not exists.
+        :param shared: True for a shared (read) lock, False for an exclusive lock.
+        """
+        self.path = path
+        self.shared = shared
+        self.fd = None
+
+    def Acquire(self, blocking=True):
+        """
+        Acquires the lock.
+
+        :param blocking: If False, returns immediately when the lock is held by others.
+        :return: True if the lock is acquired, False otherwise.
+        """
+        dir_path = os.path.dirname(self.path)
+        if dir_path != "" and not os.path.exists(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        if fcntl is None:
+            return True
+        flags = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.fd, flags)
+        except BlockingIOError:
+            os.close(self.fd)
+            self.fd = None
+            return False
+        return True
+
+    def Release(self):
+        if self.fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        self.Acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.Release()
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdentityMap:
+    """
+    A bounded map returning the same object for the same key during its lifetime, so that objects which are
+    expensive to build, e.g. a CiRepo reading ".ci/settings.yml", are built once. The least recently used object is
+    evicted when the map is full. It is safe to use from several threads.
+    """
+
+    DEFAULT_MAX_SIZE = 1024
+    DEFAULT_TTL = 300
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        """
+        :param max_size: The max number of objects kept, 0 to disable the map.
+        :param ttl: The lifetime in seconds of an object, None to keep the objects until they are evicted.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.items = OrderedDict()  # key -> (object, expire time)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def Get(self, key):
+        """
+        Returns the object of the key, or None if not found or expired.
+        """
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            obj, expire_time = item
+            if expire_time is not None and expire_time <= time.monotonic():
+                del self.items[key]
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return obj
+
+    def Put(self, key, obj):
+        """
+        Adds or replaces the object of the key.
+        """
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.__Insert(key, obj)
+
+    def __Insert(self, key, obj):
+        # called with the lock held
+        expire_time = time.monotonic() + self.ttl if self.ttl is not None else None
+        self.items[key] = (obj, expire_time)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def GetOrCreate(self, key, create):
+        """
+        Returns the object of the key, the object is created by calling create() if not found.
+        create() is called without holding the lock, if several threads create the object at the same time, the
+        first one added is returned to all of them.
+        """
+        obj = self.Get(key)
+        if obj is not None:
+            return obj
+        obj = create()
+        if obj is None or self.max_size <= 0:
+            return obj
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and (item[1] is None or item[1] > time.monotonic()):
+                self.items.move_to_end(key)
+                return item[0]
+            self.__Insert(key, obj)
+        return obj
+
+    def Remove(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def Clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def GetStats(self):
+        with self.lock:
+            return {"size": len(self.items), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from smartci.util.file_lock import FileLock
+
+
+class SqliteDb:
+    """
+    A SQLite database file which can be shared by all CI jobs on the same host, e.g. under CI_WORKSPACE.
+
+    The database is in WAL mode, so that readers are not blocked by a writer, and each write transaction starts with
+    "BEGIN IMMEDIATE", so that concurrent writers wait for each other instead of failing.
+
+    Usage:
+        db = SqliteDb(db_path, "ci_repo_catalog.db", ["CREATE TABLE IF NOT EXISTS ..."])
+        rows = db.Query("SELECT ...", args)
+        with db.Transaction() as conn:
+            conn.execute("INSERT ...", args)
+    """
+
+    def __init__(self, db_path, default_name, schema):
+        """
+        :param db_path: The path of the database file. If None, default_name under CI_WORKSPACE is used.
+        :param default_name: The file name of the database under CI_WORKSPACE.
+        :param schema: The statements creating the tables and the indexes if they do not exist.
+        """
+        if db_path is None:
+            ci_workspace = os.environ.get('CI_WORKSPACE')
+            if ci_workspace is None:
+                raise Exception("env CI_WORKSPACE not set")
+            db_path = os.path.join(ci_workspace, default_name)
+        self.db_path = db_path
+        conn = self.Connect()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")  # readers are not blocked by a writer
+            conn.execute("BEGIN IMMEDIATE")
+            for statement in schema:
+                conn.execute(statement)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def AddColumns(self, table, columns):
+        """
+        Adds the columns missing from a table created by an older version, e.g. {"repo_info": "TEXT"}.
+        """
+        with self.Transaction() as conn:
+            existing = set(row["name"] for row in conn.execute(f"PRAGMA table_info({table})").fetchall())
+            for name, column_type in columns.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def Connect(self):
+        # autocommit mode, write transactions are started explicitly with "BEGIN IMMEDIATE"
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout = 60000")
+        return conn
+
+    def Query(self, sql, args=()):
+        """
+        Returns all rows of the query.
+        """
+        conn = self.Connect()
+        try:
+            return conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def Transaction(self):
+        """
+        Yields a connection in a write transaction, committed at the end of the block or rolled back on error.
+        """
+        conn = self.Connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def Lock(self):
+        """
+        Returns an inter-process lock next to the database file, e.g. to serialize the refreshes of its content.
+        """
+        return FileLock(self.db_path + ".lock")
@@ -0,0 +1,391 @@
+# -*- coding:utf-8 -*-
+import asyncio
+import base64
+import re
+import time
+from collections import deque
+from urllib.parse import quote
+
+from smartci.vcs.git.git_repo import GitRepo
+from smartci.vcs.git.git_util import GitUtil
+
+try:
+    import httpx
+except ImportError:  # optional, only required by the asyncio client
+    httpx = None
+
+
+class AsyncGitUtil:
+    """
+    The asyncio counterpart of GitUtil for the gitlab rest api, based on httpx.
+    All requests share one client, multiplexed over HTTP/2 when the "h2" package is installed, and a semaphore bounds
+    the requests in flight.
+    """
+
+    DEFAULT_CONCURRENCY = 32
+
+    def __init__(self, address, username, access_token, options=None) -> None:
+        if httpx is None:
+            raise Exception("httpx is required by the asyncio gitlab client, install it by: pip install httpx[http2]")
+        self.address = address
+        self.username = username
+        self.access_token = access_token
+        self.options = options if options is not None else {}
+        self.headers = {
+            'PRIVATE-TOKEN': self.access_token,
+        }
+        self.url = self.address + "/api/v4/projects"
+        self.concurrency = self.options.get("async_concurrency", AsyncGitUtil.DEFAULT_CONCURRENCY)
+        self.http2 = self.options.get("http2", True)
+        self.page_workers = self.options.get("http_page_workers", GitUtil.DEFAULT_PAGE_WORKERS)
+        self.client = None
+        self.semaphore = None
+        self.request_count = 0
+
+    def __GetClient(self):
+        # created on first use, so that the client and the semaphore belong to the running event loop
+        if self.client is None:
+            limits = httpx.Limits(max_connections=self.concurrency)
+            try:
+                self.client = httpx.AsyncClient(http2=self.http2, limits=limits, headers=self.headers, timeout=60)
+            except ImportError:  # the "h2" package is not installed, fall back to HTTP/1.1
+                self.client = httpx.AsyncClient(limits=limits, headers=self.headers, timeout=60)
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.client
+
+    async def Close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def Request(self, method, url, **kwargs):
+        client = self.__GetClient()
+        async with self.semaphore:
+            self.request_count += 1
+            return await client.request(method, url, **kwargs)
+
+    def GetStats(self):
+        return {
+            "concurrency": self.concurrency,
+            "requests": self.request_count,
+        }
+
+    async def IterPages(self, url, params=None, action="list"):
+        """
+        Iterates the items of a paginated gitlab api, see GitUtil.IterPages. At most "http_page_workers" pages are
+        fetched ahead of the consumer.
+        """
+        params = dict(params) if params is not None else {}
+        params["per_page"] = GitUtil.PER_PAGE
+        params["page"] = 1
+        response = await self.__GetPage(url, params, action)
+        items = response.json()
+        for item in items:
+            yield item
+
+        total_pages = response.headers.get("X-Total-Pages", "")
+        if total_pages.isdigit():
+            async for item in self.__IterPagesConcurrently(url, params, action, range(2, int(total_pages) + 1)):
+                yield item
+            return
+
+        while True:
+            next_page = response.headers.get("X-Next-Page")
+            if next_page is None:  # no pagination headers, stop at the first page which is not full
+                if len(items) < GitUtil.PER_PAGE:
+                    break
+                params["page"] += 1
+            elif next_page.isdigit():
+                params["page"] = int(next_page)
+            else:
+                break
+            response = await self.__GetPage(url, params, action)
+            items = response.json()
+            for item in items:
+                yield item
+
+    async def __IterPagesConcurrently(self, url, params, action, pages):
+        tasks = deque()
+        pages = iter(pages)
+        try:
+            # keep a bounded window of pages in flight, so a consumer which stops early does not fetch everything
+            for page in pages:
+                tasks.append(asyncio.ensure_future(self.__GetPage(url, dict(params, page=page), action)))
+                if len(tasks) >= self.page_workers:
+                    break
+            while len(tasks) > 0:
+                response = await tasks.popleft()
+                for page in pages:
+                    tasks.append(asyncio.ensure_future(self.__GetPage(url, dict(params, page=page), action)))
+                    break
+                for item in response.json():
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __GetPage(self, url, params, action):
+        response = await self.Request("GET", url, params=params)
+        if response.status_code != 200:
+            raise Exception(
+                f"{action} failed! url: {url} page: {params['page']} "
+                f"status_code: {response.status_code} reason: {response.reason_phrase}")
+        return response
+
+    async def ListProjects(self, scope=None):
+        urls, params = GitUtil.MakeProjectQuery(self.address, scope)
+        projects = []
+        project_ids = set()
+        for url in urls:
+            async for proj in self.IterPages(url, params, "get projects"):
+                if "default_branch" not in proj:  # without default_branch represents no permission
+                    continue
+                if proj["id"] in project_ids:
+                    continue
+                project_ids.add(proj["id"])
+                projects.append(proj)
+        return projects
+
+    async def GetProjectByUrl(self, web_url):
+        if web_url.endswith(".git"):
+            web_url = web_url[:-4]
+        if web_url.startswith(self.address + "/"):
+            # resolve the namespaced path directly, e.g. /projects/group%2Fsubgroup%2Fproject
+            path = web_url[len(self.address) + 1:]
+            url = f"{self.url}/{quote(path, safe='')}"
+            response = await self.Request("GET", url)
+            if response.status_code == 200:
+                project = response.json()
+                if "default_branch" in project and project["web_url"] == web_url:
+                    return project
+                return None  # no permission or the project has been moved
+            if response.status_code == 404:
+                return None
+
+        # fallback to scan all projects
+        for project in await self.ListProjects():
+            if project["web_url"] == web_url:
+                return project
+        return None
+
+    async def ListBranches(self, project_id, regex):
+        url = f"{self.url}/{project_id}/repository/branches"
+        result = []
+        async for branch in self.IterPages(url, {"regex": regex}, "get branches"):
+            if re.match(regex, branch["name"]) is not None:
+                result.append(branch)
+        return result
+
+    async def GetBranch(self, project_id, branch_name):
+        url = f"{self.url}/{project_id}/repository/branches/{quote(branch_name, safe='')}"
+        response = await self.Request("GET", url)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception("get branch failed! url: " + url + " reason: " + response.reason_phrase)
+        return response.json()
+
+    async def GetTag(self, project_id, tag_name):
+        url = f"{self.url}/{project_id}/repository/tags/{quote(tag_name, safe='')}"
+        response = await self.Request("GET", url)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception("get tag failed! url: " + url + " reason: " + response.reason_phrase)
+        return response.json()
+
+    async def AddBranch(self, project_id, branch_name, ref):
+        url = f"{self.url}/{project_id}/repository/branches"
+        response = await self.Request("POST", url, json={"branch": branch_name, "ref": ref})
+        if response.status_code != 201:
+            raise Exception("add branch failed! url: " + url + " reason: " + response.reason_phrase)
+        return response.json()
+
+    async def DeleteBranch(self, project_id, branch_name):
+        url = f"{self.url}/{project_id}/repository/branches/{quote(branch_name, safe='')}"
+        response = await self.Request("DELETE", url)
+        if response.status_code != 204 and response.status_code != 404:
+            raise Exception("delete branch failed! url: " + url + " reason: " + response.reason_phrase)
+
+    async def GetFileInfo(self, project_id, branch_name, file_path):
+        url = f"{self.url}/{project_id}/repository/files/{quote(file_path, safe='')}"
+        response = await self.Request("GET", url, params={"ref": branch_name})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception(
+                f"get file {file_path} failed! url: {url} "
+                f"status_code: {response.status_code} reason: {response.reason_phrase}")
+        info = response.json()
+        return {"content": base64.b64decode(info["content"]).decode("utf-8"), "blob_id": info["blob_id"]}
+
+    async def GetMergeBase(self, project_id, refs):
+        url = f"{self.url}/{project_id}/repository/merge_base"
+        response = await self.Request("GET", url, params={"refs[]": refs})
+        if response.status_code == 400 or response.status_code == 404:  # no common ancestor or ref not found
+            return None
+        if response.status_code != 200:
+            raise Exception("get merge base failed! url: " + url + " reason: " + response.reason_phrase)
+        return response.json()["id"]
+
+
+class AsyncGit:
+    """
+    The asyncio counterpart of Git, created with the same options.
+    """
+
+    def __init__(self, address, username, access_token, options=None) -> None:
+        if options is None:
+            options = {}
+        self.util = AsyncGitUtil(address, username, access_token, options)
+        self.type = "git"
+        self.address = address
+        self.scope = options.get("scope")
+
+    def GetAddress(self):
+        return self.address
+
+    async def Close(self):
+        await self.util.Close()
+
+    async def GetRepos(self):
+        projects = await self.util.ListProjects(self.scope)
+        return [AsyncGitRepo(self, project) for project in projects]
+
+    def GetRepoFromRecord(self, record):
+        """
+        Builds the repository from its catalog record without any request, see Git.GetRepoFromRecord.
+        """
+        project = GitRepo.MakeProjectFromRecord(record)
+        if project is None:
+            return None
+        return AsyncGitRepo(self, project)
+
+    async def GetRepoByUrl(self, web_url):
+        if not web_url.startswith(self.address):
+            raise Exception(f"Invalid repo url: {web_url}")
+        project = await self.util.GetProjectByUrl(web_url)
+        if project is None:
+            return None
+        return AsyncGitRepo(self, project)
+
+
+class AsyncGitRepo:
+    __slots__ = ("vcs", "project")
+
+    def __init__(self, vcs, project) -> None:
+        self.vcs = vcs  # AsyncGit
+        self.project = {key: project.get(key) for key in GitRepo.FIELDS}
+
+    def GetUrl(self):
+        return self.project['web_url']
+
+    def GetProjectID(self):
+        return self.project['id']
+
+    def GetRepoId(self):
+        return self.project['id']
+
+    def GetTrunkName(self):
+        return self.project['default_branch']
+
+    def GetRecordInfo(self):
+        return {"name": self.project['name'], "http_url_to_repo": self.project['http_url_to_repo']}
+
+    def GetProjectName(self):
+        return self.project['name']
+
+    def IsTrunkName(self, entity_name):
+        return entity_name == self.project['default_branch']
+
+    def GetTrunk(self):
+        return AsyncGitVersionEntity(self.vcs, self, self.project['default_branch'], "trunk")
+
+    async def GetBranch(self, branch_name):
+        info = await self.vcs.util.GetBranch(self.project['id'], branch_name)
+        if info is not None:
+            return AsyncGitVersionEntity(self.vcs, self, branch_name, "branch", info)
+        return None
+
+    async def GetBranches(self, branch_name_pattern):
+        branches = []
+        for branch in await self.vcs.util.ListBranches(self.project['id'], branch_name_pattern):
+            if branch['name'] == self.project['default_branch']:
+                continue
+            branches.append(AsyncGitVersionEntity(self.vcs, self, branch['name'], "branch", branch))
+        return branches
+
+    async def GetAllBranches(self):
+        return await self.GetBranches(".*")
+
+    async def GetTag(self, tag_name):
+        info = await self.vcs.util.GetTag(self.project['id'], tag_name)
+        if info is not None:
+            return AsyncGitVersionEntity(self.vcs, self, tag_name, "tag", info)
+        return None
+
+    async def CreateBranch(self, branch_name, comment):
+        print(f"Create branch {branch_name} for {self.project['name']}")
+        info = await self.vcs.util.AddBranch(self.project['id'], branch_name, self.project['default_branch'])
+        return AsyncGitVersionEntity(self.vcs, self, branch_name, "branch", info)
+
+    async def DeleteBranch(self, branch_name, comment):
+        await self.vcs.util.DeleteBranch(self.project['id'], branch_name)
+
+
+class AsyncGitVersionEntity:
+    __slots__ = ("vcs", "repo", "name", "type", "info", "info_time")
+
+    def __init__(self, vcs, repo, name, type, info=None) -> None:
+        self.vcs = vcs  # AsyncGit
+        self.repo = repo
+        self.name = name
+        self.type = type  # "trunk", "branch" or "tag"
+        self.info = info  # branch or tag info returned by gitlab api, loaded on first use if unknown
+        self.info_time = time.time() if info is not None else None
+
+    def GetName(self):
+        if self.type == "trunk":
+            return "trunk"
+        return self.name
+
+    def GetType(self):
+        return self.type
+
+    def GetPrimitiveName(self):
+        return self.name
+
+    async def Refresh(self):
+        if self.type == "tag":
+            info = await self.vcs.util.GetTag(self.repo.GetProjectID(), self.name)
+        else:
+            info = await self.vcs.util.GetBranch(self.repo.GetProjectID(), self.name)
+        if info is None:
+            raise Exception(f"{self.type} {self.name} not found in {self.repo.GetUrl()}")
+        self.info = info
+        self.info_time = time.time()
+
+    async def GetLastCommitInfo(self):
+        if self.info is None:
+            await self.Refresh()
+        return GitUtil.ToCommitInfo(self.info["commit"])
+
+    async def GetLastCommitId(self):
+        return (await self.GetLastCommitInfo())["commit_id"]
+
+    async def GetFileInfo(self, file_path):
+        return await self.vcs.util.GetFileInfo(self.repo.GetProjectID(), self.name, file_path)
+
+    async def GetFileContent(self, file_path):
+        info = await self.GetFileInfo(file_path)
+        if info is None:
+            raise Exception(f"{file_path} not found in {self.name} of {self.repo.GetUrl()}")
+        return info["content"]
+
+    async def FileExists(self, file_path):
+        return await self.GetFileInfo(file_path) is not None
+
+    async def ContainsEntity(self, entity):
+        source_commit_id = await entity.GetLastCommitId()
+        merge_base = await self.vcs.util.GetMergeBase(self.repo.GetProjectID(), [self.name, source_commit_id])
+        return merge_base == source_commit_id
@@ -0,0 +1,78 @@
+# -*- coding:utf-8 -*-
+
+
+class GitGraphQL:
+    """
+    Loads the data of many gitlab projects with a few GraphQL queries instead of several REST calls per project.
+    """
+
+    BATCH_SIZE = 100  # max nodes of a connection returned by gitlab
+
+    QUERY = """
+    query($ids: [ID!], $paths: [String!]!, $withBranch: Boolean!, $branch: String!) {
+      projects(ids: $ids, first: 100) {
+        nodes {
+          id
+          repository {
+            rootRef
+            blobs(paths: $paths) {
+              nodes { path oid rawBlob }
+            }
+            branch: tree(ref: $branch) @include(if: $withBranch) {
+              lastCommit { sha }
+            }
+          }
+        }
+      }
+    }
+    """
+
+    def __init__(self, util) -> None:
+        self.util = util  # GitUtil
+        self.url = util.address + "/api/graphql"
+
+    def Query(self, query, variables):
+        response = self.util.session.post(self.url, headers=self.util.headers,
+                                          json={"query": query, "variables": variables})
+        if response.status_code != 200:
+            raise Exception(f"graphql query failed! url: {self.url} "
+                            f"status_code: {response.status_code} reason: {response.reason}")
+        result = response.json()
+        if "errors" in result and len(result["errors"]) > 0:
+            raise Exception(f"graphql query failed! url: {self.url} errors: {result['errors']}")
+        return result["data"]
+
+    def LoadProjects(self, project_ids, file_path, branch_name=None):
+        """
+        Loads a file of the default branch, the default branch and the head of a branch for each project.
+
+        :param project_ids: The ids of the projects, at most BATCH_SIZE.
+        :param file_path: The path of the file to load from the default branch, e.g. ".ci/settings.yml".
+        :param branch_name: The name of the branch to check, or None.
+        :return: A dict of project id to {"file": {"content": str, "blob_id": str} or None,
+            "default_branch": str, "branch_sha": str or None}. Projects without read permission are absent.
+        """
+        if len(project_ids) > GitGraphQL.BATCH_SIZE:
+            raise Exception(f"too many projects in a batch: {len(project_ids)}")
+        variables = {
+            "ids": [f"gid://gitlab/Project/{project_id}" for project_id in project_ids],
+            "paths": [file_path],
+            "withBranch": branch_name is not None,
+            "branch": branch_name if branch_name is not None else "",
+        }
+        data = self.Query(GitGraphQL.QUERY, variables)
+        result = {}
+        for node in data["projects"]["nodes"]:
+            project_id = int(node["id"].split("/")[-1])
+            repository = node["repository"]
+            if repository is None:  # no permission to read the repository
+                continue
+            info = {"file": None, "default_branch": repository["rootRef"], "branch_sha": None}
+            for blob in repository["blobs"]["nodes"]:
+                if blob["path"] == file_path:
+                    info["file"] = {"content": blob["rawBlob"], "blob_id": blob["oid"]}
+            branch = repository.get("branch")
+            if branch is not None and branch["lastCommit"] is not None:
+                info["branch_sha"] = branch["lastCommit"]["sha"]
+            result[project_id] = info
+        return result
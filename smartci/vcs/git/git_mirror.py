@@ -0,0 +1,142 @@
+# -*- coding:utf-8 -*-
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+
+from smartci.util.file_lock import FileLock
+
+
+class GitMirrorCache:
+    """
+    A cache of bare mirrors of the git repositories under CI_WORKSPACE, shared by all CI jobs on the same host.
+
+    Clones borrow the objects of the mirror by "--reference", so that only the commits pushed since the last fetch
+    of the mirror are downloaded from the server. Each mirror has two lock files:
+        - "<mirror>.use": held shared by the jobs using the mirror, from before its fetch until their clone is done,
+          and exclusive by the eviction, which skips the mirrors in use. Its mtime is the last use.
+        - "<mirror>.lock": held exclusive while the mirror is fetched, so that concurrent fetches are serialized.
+    When the mirrors outgrow max_size, the least recently used ones which are not in use are evicted.
+
+    By default a clone keeps reading the objects of the mirror through .git/objects/info/alternates, so it takes
+    almost no disk but is broken if the mirror is evicted. With "dissociate", a clone copies the objects it borrowed
+    and outlives the mirror, but the copy is the whole history of the mirror, more than a partial clone downloads.
+    """
+
+    DEFAULT_MAX_SIZE_MB = 10240
+
+    def __init__(self, root, max_size_mb=DEFAULT_MAX_SIZE_MB, dissociate=False):
+        """
+        :param root: The directory of the mirrors.
+        :param max_size_mb: The max total size of the mirrors in MB.
+        :param dissociate: True to copy the borrowed objects into each clone, so that it does not depend on the mirror.
+        """
+        self.root = root
+        self.max_size = max_size_mb * 1024 * 1024
+        self.dissociate = dissociate
+
+    @staticmethod
+    def Create(options):
+        """
+        Creates the cache from the "mirror_cache" options of a git server, None if disabled.
+        """
+        if not options or not options.get("enabled", True):
+            return None
+        root = options.get("path")
+        if root is None:
+            ci_workspace = os.environ.get('CI_WORKSPACE')
+            if ci_workspace is None:
+                raise Exception("env CI_WORKSPACE not set")
+            root = os.path.join(ci_workspace, "git_mirrors")
+        return GitMirrorCache(root, options.get("max_size_mb", GitMirrorCache.DEFAULT_MAX_SIZE_MB),
+                              options.get("dissociate", False))
+
+    def GetMirrorPath(self, clone_url):
+        name = clone_url.rstrip("/").split("/")[-1]
+        md5 = hashlib.md5(clone_url.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, f"{md5}-{name}")
+
+    @contextmanager
+    def Use(self, clone_url, auth_clone_url, run_git_cmd, dissociate=None):
+        """
+        Brings the mirror of the repository up to date and keeps it from being evicted while in use.
+
+        Usage:
+            with cache.Use(clone_url, auth_clone_url, run_git_cmd) as clone_args:
+                run_git_cmd(["git", "clone"] + clone_args + [auth_clone_url, local_path])
+
+        :param clone_url: The clone url of the repository, without credentials.
+        :param auth_clone_url: The clone url with credentials, which is not saved in the mirror.
+        :param run_git_cmd: The function running a git command, run_git_cmd(cmd, cwd=None).
+        :param dissociate: Overrides the "dissociate" of the cache, e.g. False for a clone removed before Use returns.
+        :return: The arguments of "git clone" to borrow the objects of the mirror.
+        """
+        if dissociate is None:
+            dissociate = self.dissociate
+        path = self.GetMirrorPath(clone_url)
+        # held until the clone is done, the eviction can not take the mirror between its fetch and the clone
+        with FileLock(path + ".use", shared=True):
+            with FileLock(path + ".lock"):
+                if not os.path.exists(os.path.join(path, "HEAD")):
+                    shutil.rmtree(path, ignore_errors=True)  # left by an interrupted clone
+                    run_git_cmd(["git", "init", "--bare", "-q", path])
+                run_git_cmd(["git", "fetch", "--prune", "--quiet", auth_clone_url,
+                             "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"], cwd=path)
+            os.utime(path + ".use")  # the last use, for the eviction
+            self.Evict()
+            yield ["--reference", path] + (["--dissociate"] if dissociate else [])
+
+    def GetMirrors(self):
+        """
+        Returns the mirrors from the least to the most recently used, [{"path": str, "size": int, "used_at": float}].
+        """
+        mirrors = []
+        if not os.path.exists(self.root):
+            return mirrors
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            use_path = path + ".use"
+            used_at = os.path.getmtime(use_path) if os.path.exists(use_path) else 0
+            mirrors.append({"path": path, "size": GitMirrorCache.__GetSize(path), "used_at": used_at})
+        mirrors.sort(key=lambda mirror: mirror["used_at"])
+        return mirrors
+
+    def Evict(self):
+        """
+        Removes the least recently used mirrors until the total size is within max_size. The mirrors in use, including
+        the ones used by the calling job, are skipped.
+
+        :return: The paths of the removed mirrors.
+        """
+        mirrors = self.GetMirrors()
+        total = sum(mirror["size"] for mirror in mirrors)
+        removed = []
+        for mirror in mirrors:
+            if total <= self.max_size:
+                break
+            lock = FileLock(mirror["path"] + ".use")
+            if not lock.Acquire(blocking=False):
+                continue
+            try:
+                shutil.rmtree(mirror["path"])
+            finally:
+                lock.Release()
+            total -= mirror["size"]
+            removed.append(mirror["path"])
+            print(f"evict git mirror {mirror['path']}")
+        return removed
+
+    @staticmethod
+    def __GetSize(path):
+        size = 0
+        for dir_path, dir_names, file_names in os.walk(path):
+            for file_name in file_names:
+                file_path = os.path.join(dir_path, file_name)
+                try:
+                    if not os.path.islink(file_path):
+                        size += os.path.getsize(file_path)
+                except OSError:
+                    pass  # removed by a concurrent fetch or gc
+        return size
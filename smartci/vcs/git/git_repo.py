@@ -1,18 +1,27 @@
 # -*- coding:utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+
 from smartci.vcs.git.git_version_entity import GitVersionEntity
 
 
 class GitRepo:
+    # the fields of the project used by smartci, the rest of the gitlab payload is dropped to save memory
+    FIELDS = ("id", "name", "web_url", "http_url_to_repo", "default_branch")
+
+    __slots__ = ("vcs", "project")
+
     def __init__(self, vcs, project) -> None:
         self.vcs = vcs  # Git
-        self.project = project # 通过api接口获得的项目信息，json格式
+        self.project = {key: project.get(key) for key in GitRepo.FIELDS}  # 通过api接口获得的项目信息，json格式
 
     def GetUrl(self):
         return self.project['web_url']
 
     def GetBranch(self, branch_name):
-        if self.vcs.util.BranchExists(self.project['id'], branch_name):
-            return GitVersionEntity(self.vcs, self, branch_name)
+        info = self.vcs.util.GetBranch(self.project['id'], branch_name)
+        if info is not None:
+            entity_type = "trunk" if self.IsTrunkName(branch_name) else "branch"
+            return GitVersionEntity(self.vcs, self, branch_name, entity_type, info)
         return None
 
     def GetBranches(self, branch_name_pattern):
@@ -21,7 +30,7 @@ class GitRepo:
         for branch in self.vcs.util.ListBranches(self.project['id'], branch_name_pattern):
             if branch['name'] == self.project['default_branch']:
                 continue
-            branches.append(GitVersionEntity(self.vcs, self, branch['name']))
+            branches.append(GitVersionEntity(self.vcs, self, branch['name'], "branch", branch))
         return branches
 
     def GetAllBranches(self):
@@ -30,13 +39,33 @@ class GitRepo:
     def DeleteBranch(self, branch_name, comment):
         self.vcs.util.DeleteBranch(self.project['id'], branch_name)
 
+    def GetMergedBranches(self, branch_name_pattern, include_unchanged=False):
+        # the branch listing tells whether each branch is merged into the default branch, which is also true for a
+        # branch without any commit of its own, e.g. just created from the default branch: its head is the trunk head
+        branches = [branch for branch in self.GetBranches(branch_name_pattern) if branch.info["merged"]]
+        if include_unchanged or len(branches) == 0:
+            return branches
+        trunk_head = self.GetTrunk().GetLastCommitId()
+        return [branch for branch in branches if branch.GetLastCommitId() != trunk_head]
+
+    def DeleteBranches(self, branches, comment):
+        branches = [branch for branch in branches if not branch.info["protected"]]
+
+        def delete(branch):
+            self.vcs.util.DeleteBranch(self.project['id'], branch.GetPrimitiveName())
+
+        with ThreadPoolExecutor(max_workers=self.vcs.concurrency) as executor:
+            list(executor.map(delete, branches))
+        return branches
+
     def GetTrunk(self):
-        git_branch = GitVersionEntity(self.vcs, self, self.project['default_branch'])
+        git_branch = GitVersionEntity(self.vcs, self, self.project['default_branch'], "trunk")
         return git_branch
 
     def GetTag(self, tag_name):
-        if self.vcs.util.TagExists(self.project['id'], tag_name):
-            return GitVersionEntity(self.vcs, self, tag_name)
+        info = self.vcs.util.GetTag(self.project['id'], tag_name)
+        if info is not None:
+            return GitVersionEntity(self.vcs, self, tag_name, "tag", info)
         return None
 
     def DeleteTag(self, tag_name, comment):
@@ -44,12 +73,18 @@ class GitRepo:
 
     def CreateBranch(self, branch_name, comment):
         print(f"Create branch {branch_name} for {self.project['name']}")
-        self.vcs.util.AddBranch(self.project['id'], branch_name, self.project['default_branch'])
-        return self.GetBranch(branch_name)
+        info = self.vcs.util.AddBranch(self.project['id'], branch_name, self.project['default_branch'])
+        return GitVersionEntity(self.vcs, self, branch_name, "branch", info)
 
     def GetProjectID(self):
         return self.project['id']
 
+    def GetRepoId(self):
+        return self.project['id']
+
+    def GetTrunkName(self):
+        return self.project['default_branch']
+
     def GetProjectName(self):
         return self.project['name']
 
@@ -57,6 +92,30 @@ class GitRepo:
         url = self.project['http_url_to_repo']
         return url
 
+    def GetRecordInfo(self):
+        # the fields of the project which can not be derived from the url, see MakeProjectFromRecord
+        return {"name": self.project['name'], "http_url_to_repo": self.project['http_url_to_repo']}
+
+    @staticmethod
+    def MakeProjectFromRecord(record):
+        """
+        Returns the project restored from its catalog record, or None if the record lacks the fields of the project,
+        e.g. saved by an older version.
+        """
+        repo_info = record.get("repo_info") or {}
+        if "name" not in repo_info or "http_url_to_repo" not in repo_info:
+            return None
+        return {
+            "id": int(record["repo_id"]),
+            "name": repo_info["name"],
+            "web_url": record["url"],
+            "http_url_to_repo": repo_info["http_url_to_repo"],
+            "default_branch": record["trunk"],
+        }
+
+    def IsTrunkName(self, entity_name):
+        return entity_name == self.project['default_branch']
+
     def GetVersionEntityType(self, entity_name):
         if entity_name == self.project['default_branch']:
             return "trunk"
@@ -2,45 +2,228 @@
 import base64
 import os
 import re
-import subprocess
+import threading
 import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 import requests
+from requests.adapters import HTTPAdapter
+
+from smartci.util.cmd_runner import CmdRunner
+from smartci.vcs.git.git_mirror import GitMirrorCache
+
+
+class PooledSession(requests.Session):
+    """
+    A keep-alive session shared by all GitUtil instances of the same GitLab server.
+    The underlying connection pool is thread-safe and bounded by pool_size.
+    """
+
+    def __init__(self, pool_size):
+        super().__init__()
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.mount("http://", self.adapter)
+        self.mount("https://", self.adapter)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.counters = {}  # other metrics, e.g. verify_polls
+
+    def request(self, *args, **kwargs):
+        with self.lock:
+            self.request_count += 1
+        return super().request(*args, **kwargs)
+
+    def Count(self, name, count=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def GetStats(self):
+        connection_count = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connection_count += pool.num_connections
+        with self.lock:
+            request_count = self.request_count
+            counters = dict(self.counters)
+        reused_count = max(request_count - connection_count, 0)
+        stats = {
+            "pool_size": self.pool_size,
+            "requests": request_count,
+            "connections": connection_count,
+            "reused": reused_count,
+            "reuse_rate": reused_count / request_count if request_count > 0 else 0.0,
+            "verify_polls": 0,
+        }
+        stats.update(counters)
+        return stats
 
 
 class GitUtil:
-    def __init__(self, address, username, access_token) -> None:
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_PAGE_WORKERS = 4
+    DEFAULT_VERIFY_TIMEOUT = 30
+    PER_PAGE = 100  # max page size supported by gitlab
+    # full commit history without the blobs of old revisions, submodules at depth 1 fetched in parallel
+    DEFAULT_CHECKOUT_OPTIONS = {"depth": None, "filter": "blob:none", "shallow_submodules": True, "jobs": 4}
+
+    __sessions = {}  # address -> PooledSession
+    __sessions_lock = threading.Lock()
+
+    def __init__(self, address, username, access_token, options=None) -> None:
         self.address = address
         self.username = username
         self.access_token = access_token
+        self.options = options if options is not None else {}
         self.headers = {
             'PRIVATE-TOKEN': self.access_token,
         }
         self.url = self.address + "/api/v4/projects"
+        self.session = GitUtil.__GetSession(address, self.options.get("http_pool_size", GitUtil.DEFAULT_POOL_SIZE))
+        self.page_workers = self.options.get("http_page_workers", GitUtil.DEFAULT_PAGE_WORKERS)
+        # poll until a created branch or tag is readable, only needed for servers with replication lag
+        self.verify_ref_creation = self.options.get("verify_ref_creation", False)
+        self.verify_ref_timeout = self.options.get("verify_ref_timeout", GitUtil.DEFAULT_VERIFY_TIMEOUT)
+        self.cmd_runner = CmdRunner([self.access_token], self.options.get("cmd_timeout"))
+        self.checkout_options = dict(GitUtil.DEFAULT_CHECKOUT_OPTIONS, **self.options.get("checkout", {}))
+        # clones borrow the objects of local bare mirrors shared by the jobs on the host, disabled by default
+        self.mirror_cache = GitMirrorCache.Create(self.options.get("mirror_cache"))
+
+    @staticmethod
+    def __GetSession(address, pool_size):
+        with GitUtil.__sessions_lock:
+            session = GitUtil.__sessions.get(address)
+            if session is None:
+                session = PooledSession(pool_size)
+                GitUtil.__sessions[address] = session
+            return session
+
+    def GetStats(self):
+        """
+        Returns the usage statistics of the shared connection pool, e.g. how many requests reused a connection.
+        """
+        return self.session.GetStats()
+
+    def IterPages(self, url, params=None, action="list"):
+        """
+        Iterates the items of a paginated gitlab api.
+
+        The first page tells the total page count by the X-Total-Pages header, the remaining pages are then fetched
+        concurrently and the items are yielded in page order. GitLab omits X-Total-Pages for very large collections,
+        in which case the pages are followed one by one by the X-Next-Page header.
+
+        :param url: The url of the api.
+        :param params: The query parameters of the api.
+        :param action: The action description used in the error message.
+        """
+        params = dict(params) if params is not None else {}
+        params["per_page"] = GitUtil.PER_PAGE
+        params["page"] = 1
+        response = self.__GetPage(url, params, action)
+        items = response.json()
+        yield from items
+
+        total_pages = response.headers.get("X-Total-Pages", "")
+        if total_pages.isdigit():
+            yield from self.__IterPagesConcurrently(url, params, action, range(2, int(total_pages) + 1))
+            return
 
-    def ListProjects(self):
-        per_page = 20
-        page = 1
-        re = []
         while True:
-            url = f"{self.url}?per_page={per_page}&page={page}"
-            response = requests.get(url, headers=self.headers)
-            if response.status_code != 200:
-                raise Exception(
-                    f"get projects failed! url: {self.url} "
-                    f"status_code: {response.status_code} reason: {response.reason}")
-            projects = response.json()
-            for proj in projects:
-                if "default_branch" in proj: # without default_branch represents no permission
-                    re.append(proj)
-            if len(projects) < per_page:
+            next_page = response.headers.get("X-Next-Page")
+            if next_page is None:  # no pagination headers, stop at the first page which is not full
+                if len(items) < GitUtil.PER_PAGE:
+                    break
+                params["page"] += 1
+            elif next_page.isdigit():
+                params["page"] = int(next_page)
+            else:
                 break
-            page += 1
-        return re
+            response = self.__GetPage(url, params, action)
+            items = response.json()
+            yield from items
+
+    def __IterPagesConcurrently(self, url, params, action, pages):
+        executor = ThreadPoolExecutor(max_workers=max(self.page_workers, 1))
+        futures = deque()
+        pages = iter(pages)
+        try:
+            # keep a bounded window of pages in flight, so a consumer which stops early does not fetch everything
+            for page in pages:
+                futures.append(executor.submit(self.__GetPage, url, dict(params, page=page), action))
+                if len(futures) >= self.page_workers:
+                    break
+            while len(futures) > 0:
+                response = futures.popleft().result()
+                for page in pages:
+                    futures.append(executor.submit(self.__GetPage, url, dict(params, page=page), action))
+                    break
+                yield from response.json()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __GetPage(self, url, params, action):
+        response = self.session.get(url, headers=self.headers, params=params)
+        if response.status_code != 200:
+            raise Exception(
+                f"{action} failed! url: {url} page: {params['page']} "
+                f"status_code: {response.status_code} reason: {response.reason}")
+        return response
+
+    def IterProjects(self, scope=None):
+        """
+        Iterates the projects visible to the user.
+
+        :param scope: Optional filters pushed to the gitlab api, a dict with the following keys:
+            - 'groups': The ids or full paths of the groups to list the projects of, instead of all projects.
+            - 'include_subgroups': Whether to include the projects of subgroups, only valid with 'groups'.
+            - 'membership': Only list the projects the user is a member of.
+            - 'archived': Whether to list archived projects.
+            - 'simple': Only return the basic fields of each project.
+            - 'last_activity_after': Only list the projects with activity after this time, e.g. "2024-01-01T00:00:00Z".
+        """
+        urls, params = GitUtil.MakeProjectQuery(self.address, scope)
+        project_ids = set()
+        for url in urls:
+            for proj in self.IterPages(url, params, "get projects"):
+                if "default_branch" not in proj:  # without default_branch represents no permission
+                    continue
+                if proj["id"] in project_ids:  # a project can be shared with several groups
+                    continue
+                project_ids.add(proj["id"])
+                yield proj
+
+    @staticmethod
+    def MakeProjectQuery(address, scope):
+        """
+        Returns the urls and the query parameters listing the projects of the scope, see IterProjects.
+        """
+        if scope is None:
+            scope = {}
+        params = {}
+        for key in ["include_subgroups", "membership", "archived", "simple", "last_activity_after"]:
+            if key not in scope or scope[key] is None:
+                continue
+            value = scope[key]
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            params[key] = value
+        if "groups" not in scope:
+            params.pop("include_subgroups", None)
+            urls = [address + "/api/v4/projects"]
+        else:
+            urls = [f"{address}/api/v4/groups/{quote(str(group), safe='')}/projects" for group in scope["groups"]]
+        return urls, params
+
+    def ListProjects(self, scope=None):
+        return list(self.IterProjects(scope))
 
     def GetProjectUrl(self, project_id):
         url = f"{self.url}/{project_id}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception(f"get project url failed! project_id: {project_id} "
                             f"status_code: {response.status_code} reason: {response.reason}")
@@ -49,52 +232,74 @@ class GitUtil:
     def GetProjectByUrl(self, web_url):
         if web_url.endswith(".git"):
             web_url = web_url[:-4]
-        projects = self.ListProjects()
-        for project in projects:
+        if web_url.startswith(self.address + "/"):
+            # resolve the namespaced path directly, e.g. /projects/group%2Fsubgroup%2Fproject
+            path = web_url[len(self.address) + 1:]
+            url = f"{self.url}/{quote(path, safe='')}"
+            response = self.session.get(url, headers=self.headers)
+            if response.status_code == 200:
+                project = response.json()
+                if "default_branch" in project and project["web_url"] == web_url:
+                    return project
+                return None  # no permission or the project has been moved
+            if response.status_code == 404:
+                return None
+
+        # fallback to scan all projects
+        for project in self.IterProjects():
             if project["web_url"] == web_url:
                 return project
         return None
 
     def ListBranches(self, project_id, regex):
-        per_page = 20
-        page = 1
+        url = f"{self.url}/{project_id}/repository/branches"
         result = []
-        while True:
-            url = f"{self.url}/{project_id}/repository/branches?regex={regex}&per_page={per_page}&page={page}"
-            response = requests.get(url, headers=self.headers)
-            if response.status_code != 200:
-                raise Exception(
-                    f"get branches failed! url: {url} "
-                    f"status_code: {response.status_code} reason: {response.reason}")
-            branches = response.json()
-            result += branches
-            if len(branches) < per_page:
-                break
-            page += 1
-
-        # some git version not support regex query, so filter by python
-        filtered_result = []
-        for branch in result:
+        for branch in self.IterPages(url, {"regex": regex}, "get branches"):
+            # some git version not support regex query, so filter by python
             if re.match(regex, branch["name"]) is not None:
-                filtered_result.append(branch)
-        return filtered_result
-
+                result.append(branch)
+        return result
 
     def GetFileContent(self, project_id, branch_name, file_path):
         encoded_file_path = quote(file_path, safe='')
         url = f"{self.url}/{project_id}/repository/files/{encoded_file_path}/raw?ref={branch_name}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != requests.codes.ok:
             raise Exception(
                 f"get file {file_path} failed! url: {url} "
                 f"status_code: {response.status_code} reason: {response.reason}")
         return response.text
 
+    def GetFileInfo(self, project_id, branch_name, file_path):
+        encoded_file_path = quote(file_path, safe='')
+        url = f"{self.url}/{project_id}/repository/files/{encoded_file_path}?ref={branch_name}"
+        response = self.session.get(url, headers=self.headers)
+        if response.status_code == 404:
+            return None
+        if response.status_code != requests.codes.ok:
+            raise Exception(
+                f"get file {file_path} failed! url: {url} "
+                f"status_code: {response.status_code} reason: {response.reason}")
+        info = response.json()
+        return {"content": base64.b64decode(info["content"]).decode("utf-8"), "blob_id": info["blob_id"]}
+
+
+    def GetFileBlobId(self, project_id, branch_name, file_path):
+        # HEAD returns the metadata of the file in the headers without the content
+        url = f"{self.url}/{project_id}/repository/files/{quote(file_path, safe='')}?ref={branch_name}"
+        response = self.session.head(url, headers=self.headers)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception(
+                f"get file {file_path} failed! url: {url} "
+                f"status_code: {response.status_code} reason: {response.reason}")
+        return response.headers.get("X-Gitlab-Blob-Id")
 
     def PathExists(self, project_id, branch_name, path):
         encoded_path = quote(path, safe='')
         url = f"{self.url}/{project_id}/repository/tree?ref={branch_name}&path={encoded_path}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code == 200:
             return len(response.json()) > 0
         if response.status_code == 404:
@@ -106,7 +311,7 @@ class GitUtil:
     def FileExists(self, project_id, branch_name, file_path):
         encoded_path = quote(file_path, safe='')
         url = f"{self.url}/{project_id}/repository/files/{encoded_path}?ref={branch_name}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code == 200:
             return True
         if response.status_code == 404:
@@ -123,7 +328,7 @@ class GitUtil:
             "content": content,
             "commit_message": comment
         }
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.session.post(url, headers=self.headers, json=data)
         if response.status_code != 201:
             raise Exception(
                 f"add file {file_path} failed! url: {url} "
@@ -136,7 +341,7 @@ class GitUtil:
             "branch": branch_name,
             "commit_message": comment
         }
-        response = requests.delete(url, headers=self.headers, json=data)
+        response = self.session.delete(url, headers=self.headers, json=data)
         if response.status_code != 204:
             raise Exception(
                 f"remove file {file_path} failed! url: {url} "
@@ -150,7 +355,7 @@ class GitUtil:
             "content": content,
             "commit_message": comment
         }
-        response = requests.put(url, headers=self.headers, json=data)
+        response = self.session.put(url, headers=self.headers, json=data)
         if response.status_code != 200:
             raise Exception(
                 f"update file {file_path} failed! url: {url} "
@@ -180,7 +385,10 @@ class GitUtil:
             with open(os.path.join(local_path, ".gitmodules"), "r") as f:
                 gitmodule_content = f.read()
                 f.close()
+        return GitUtil.ParseSubModules(gitmodule_content)
 
+    @staticmethod
+    def ParseSubModules(gitmodule_content):
         submodules = {}
         for line in gitmodule_content.split("\n"):
             if line.strip() == "":
@@ -193,69 +401,112 @@ class GitUtil:
                 submodules[anchor][key.strip()] = value.strip()
         return submodules
 
-    def AddSubModule(self, work_dir, project_id, branch_name, ref_repo_url, ref_branch_name, mount_rel_path):
-        cmd = ["git", "submodule", "add", ref_repo_url, mount_rel_path]
-        self.__RunGitCmd(cmd, cwd=work_dir)
-        self.Commit(work_dir, f"add submodule {mount_rel_path} from {ref_repo_url} {ref_branch_name}")
-        self.UpdateSubModule(project_id, branch_name, ref_repo_url, ref_branch_name)
-
-        """
-        submodules = self.GetSubModules(project_id, branch_name)
-        if mount_rel_path in submodules:
-            raise Exception(f"submodule {mount_rel_path} already exists! project_id: {project_id} branch_name: {branch_name}")
-        submodules[mount_rel_path] = {
-            "url": ref_repo_url,
-            "branch": ref_branch_name
-        }
-        if self.FileExists(project_id, branch_name, ".gitmodules"):
-            self.UpdateFile(project_id, branch_name, ".gitmodules", self.SubModulesToString(submodules),
-                            f"add submodule {mount_rel_path} from {ref_repo_url} {ref_branch_name}")
-        else:
-            self.AddFile(project_id, branch_name, ".gitmodules", self.SubModulesToString(submodules),
-                         f"add submodule {mount_rel_path} from {ref_repo_url} {ref_branch_name}")
-        """
+    def AddSubModule(self, work_dir, project_id, branch_name, clone_url, ref_repo_url, ref_branch_name,
+                     ref_commit_id, mount_rel_path):
+        # the commits api can not create a gitlink, which is written into the index of a clone without any blob
+        def add(submodules):
+            if mount_rel_path in submodules:
+                raise Exception(f"submodule {mount_rel_path} already exists! project_id: {project_id} branch_name: {branch_name}")
+            submodules[mount_rel_path] = {
+                "url": ref_repo_url,
+                "branch": ref_branch_name
+            }
+            return submodules
+
+        self.__CommitIndex(work_dir, clone_url, branch_name, add,
+                           ["--add", "--cacheinfo", f"160000,{ref_commit_id},{mount_rel_path}"],
+                           f"add submodule {mount_rel_path} from {ref_repo_url} {ref_branch_name}")
         print(f"add submodule {mount_rel_path} from {ref_repo_url} {ref_branch_name}")
 
-    def RemoveSubModuleByMountRelPath(self, work_dir, project_id, branch_name, mount_rel_path):
+    def RemoveSubModuleByMountRelPath(self, work_dir, project_id, branch_name, clone_url, mount_rel_path):
         submodules = self.GetSubModules(project_id, branch_name)
         if mount_rel_path not in submodules:
             return
         del submodules[mount_rel_path]
-        with open(os.path.join(work_dir, ".gitmodules"), "w") as f:
-            f.write(self.SubModulesToString(submodules))
-            f.close()
-
-        cmd = ["git", "submodule", "sync"]
-        self.__RunGitCmd(cmd, cwd=work_dir)
-        cmd = ["git", "submodule", "deinit", "-f", mount_rel_path]
-        self.__RunGitCmd(cmd, cwd=work_dir)
-        self.AddToControl(work_dir, ".gitmodules")
-        cmd = ["git", "rm", "-f", mount_rel_path]
-        self.__RunGitCmd(cmd, cwd=work_dir)
-        cmd = ["rm", "-rf", os.path.join(work_dir, mount_rel_path)]
-        self.__RunGitCmd(cmd)
-        self.Commit(work_dir, f"remove submodule {mount_rel_path}")
-
+        comment = f"remove submodule {mount_rel_path}"
+        try:
+            # deleting the gitlink by the commits api saves the clone, but is not accepted by all gitlab versions
+            self.CommitActions(project_id, branch_name, [
+                {"action": "update", "file_path": ".gitmodules", "content": self.SubModulesToString(submodules)},
+                {"action": "delete", "file_path": mount_rel_path},
+            ], comment)
+        except Exception as e:
+            print(f"{comment} by commits api failed, fall back to a clone: {e}")
+
+            def remove(submodules):
+                submodules.pop(mount_rel_path, None)
+                return submodules
+
+            self.__CommitIndex(work_dir, clone_url, branch_name, remove, ["--force-remove", mount_rel_path], comment)
+        print(comment)
+
+    def __CommitIndex(self, work_dir, clone_url, branch_name, update_submodules, update_index_args, comment):
         """
-        self.UpdateFile(project_id, branch_name, ".gitmodules", self.SubModulesToString(submodules),
-                        f"remove submodule {mount_rel_path}")
+        Commits .gitmodules and a gitlink change from a shallow blobless clone without checkout, so that neither
+        the files of the branch nor its submodules are downloaded.
+
+        :param update_submodules: The function changing the submodules read from the HEAD of the clone, so that the
+            commits pushed before the clone are kept, update_submodules(submodules) -> submodules.
         """
-        print(f"remove submodule {mount_rel_path}")
+        tmp_clone_url = clone_url.replace("://", f"://{self.username}:{self.access_token}@")
+        # the clone is only used until the push, it can keep reading the objects of the mirror
+        with self.__UseMirror(clone_url, tmp_clone_url, dissociate=False) as mirror_args:
+            cmd = ["git", "clone", "--depth", "1", "--filter=blob:none", "--no-checkout", "--single-branch",
+                   "-b", branch_name] + mirror_args + [tmp_clone_url, work_dir]
+            self.__RunGitCmd(cmd)
+            # the index of a clone without checkout is empty, read it from the trees which have been fetched
+            self.__RunGitCmd(["git", "read-tree", "HEAD"], cwd=work_dir)
+            submodules = {}
+            if self.__RunGitCmd(["git", "ls-tree", "--name-only", "HEAD", ".gitmodules"], cwd=work_dir).strip():
+                submodules = GitUtil.ParseSubModules(
+                    self.__RunGitCmd(["git", "show", "HEAD:.gitmodules"], cwd=work_dir, disable_stderr=True))
+            with open(os.path.join(work_dir, ".gitmodules"), "w") as f:
+                f.write(self.SubModulesToString(update_submodules(submodules)))
+            self.__RunGitCmd(["git", "update-index", "--add", ".gitmodules"], cwd=work_dir)
+            self.__RunGitCmd(["git", "update-index"] + update_index_args, cwd=work_dir)
+            # no "-a", the other files are missing from the work tree
+            self.__RunGitCmd(["git", "commit", "-m", comment], cwd=work_dir)
+            self.__RunGitCmd(["git", "push", "origin", f"HEAD:{branch_name}"], cwd=work_dir)
 
     def UpdateSubModule(self, project_id, branch_name, ref_repo_url, ref_branch_name):
+        return self.UpdateSubModules(project_id, branch_name, {ref_repo_url: ref_branch_name})
+
+    def UpdateSubModules(self, project_id, branch_name, ref_branches):
+        # ref_branches: {ref_repo_url: ref_branch_name}, all written to .gitmodules in one commit
         submodules = self.GetSubModules(project_id, branch_name)
-        changed = False
+        changed = []
         for path, submodule in submodules.items():
-            if submodule["url"] == ref_repo_url:
+            ref_branch_name = ref_branches.get(submodule["url"])
+            if ref_branch_name is not None and submodule.get("branch") != ref_branch_name:
                 submodule["branch"] = ref_branch_name
-                changed = True
+                changed.append(f"{submodule['url']} {ref_branch_name}")
 
-        if not changed:
-            return
+        if len(changed) == 0:
+            return False
 
-        self.UpdateFile(project_id, branch_name, ".gitmodules", self.SubModulesToString(submodules),
-                        f"update submodule to {ref_repo_url} {ref_branch_name}")
-        print(f"update submodule to {ref_repo_url} {ref_branch_name}")
+        comment = "update submodule to " + ", ".join(changed)
+        self.CommitActions(project_id, branch_name, [{
+            "action": "update",
+            "file_path": ".gitmodules",
+            "content": self.SubModulesToString(submodules),
+        }], comment)
+        print(comment)
+        return True
+
+    def CommitActions(self, project_id, branch_name, actions, comment):
+        # several file changes in a single commit, see the "actions" of the gitlab commits api
+        url = f"{self.url}/{project_id}/repository/commits"
+        data = {
+            "branch": branch_name,
+            "commit_message": comment,
+            "actions": actions,
+        }
+        response = self.session.post(url, headers=self.headers, json=data)
+        if response.status_code != 201:
+            raise Exception(
+                f"commit failed! url: {url} "
+                f"status_code: {response.status_code} reason: {response.reason}")
+        return response.json()
 
     @staticmethod
     def SubModulesToString(submodules):
@@ -275,13 +526,13 @@ class GitUtil:
             "branch": branch_name,
             "ref": ref
         }
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.session.post(url, headers=self.headers, json=data)
         if response.status_code != 201:
             raise Exception("add branch failed! url: " + url + " reason: " + response.reason)
 
-        time.sleep(1)
-        while not self.BranchExists(project_id, branch_name):
-            time.sleep(1)
+        if self.verify_ref_creation:
+            self.__WaitUntil(lambda: self.BranchExists(project_id, branch_name), f"branch {branch_name}")
+        return response.json()
 
     def AddTag(self, project_id, tag_name, commit_id):
         url = f"{self.url}/{project_id}/repository/tags"
@@ -289,27 +540,43 @@ class GitUtil:
             "tag_name": tag_name,
             "ref": commit_id
         }
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.session.post(url, headers=self.headers, json=data)
         if response.status_code != 201:
             raise Exception("add tag failed! url: " + url + " reason: " + response.reason)
 
-        time.sleep(1)
-        while not self.TagExists(project_id, tag_name):
-            time.sleep(1)
+        if self.verify_ref_creation:
+            self.__WaitUntil(lambda: self.TagExists(project_id, tag_name), f"tag {tag_name}")
+        return response.json()
+
+    def __WaitUntil(self, exists, description):
+        delay = 0.05
+        deadline = time.time() + self.verify_ref_timeout
+        while True:
+            self.session.Count("verify_polls")
+            if exists():
+                return
+            if time.time() + delay > deadline:
+                raise Exception(f"{description} is not readable after {self.verify_ref_timeout} seconds")
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
 
     def GetLastCommitIdOfBranch(self, project_id, branch_name):
         return self.GetLastCommitInfoOfBranch(project_id, branch_name)["commit_id"]
 
     def GetLastCommitInfoOfBranch(self, project_id, branch_name):
-        url = f"{self.url}/{project_id}/repository/commits?ref_name={branch_name}"
-        response = requests.get(url, headers=self.headers)
+        url = f"{self.url}/{project_id}/repository/commits?ref_name={branch_name}&per_page=1"
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception("get last commit id failed! url: " + url + " reason: " + response.reason)
+        return GitUtil.ToCommitInfo(response.json()[0])
+
+    @staticmethod
+    def ToCommitInfo(commit):
         info = {}
-        info["commit_id"] = response.json()[0]["id"]
-        info["author"] = response.json()[0]["committer_email"].split("@")[0]
-        info["date"] = response.json()[0]["created_at"]
-        info["message"] = response.json()[0]["message"].strip()
+        info["commit_id"] = commit["id"]
+        info["author"] = commit["committer_email"].split("@")[0]
+        info["date"] = commit["created_at"]
+        info["message"] = commit["message"].strip()
         return info
 
     def GetCommitIdOfLocalPath(self, local_path):
@@ -331,35 +598,54 @@ class GitUtil:
 
 
 
+    def GetBranch(self, project_id, branch_name):
+        url = f"{self.url}/{project_id}/repository/branches/{quote(branch_name, safe='')}"
+        response = self.session.get(url, headers=self.headers)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception("get branch failed! url: " + url + " reason: " + response.reason)
+        return response.json()
+
+    def GetTag(self, project_id, tag_name):
+        url = f"{self.url}/{project_id}/repository/tags/{quote(tag_name, safe='')}"
+        response = self.session.get(url, headers=self.headers)
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception("get tag failed! url: " + url + " reason: " + response.reason)
+        return response.json()
+
     def BranchExists(self, project_id, branch_name):
         url = f"{self.url}/{project_id}/repository/branches/{branch_name}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code == 200:
             return True
         return False
 
     def TagExists(self, project_id, tag_name):
         url = f"{self.url}/{project_id}/repository/tags/{tag_name}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code == 200:
             return True
         return False
 
     def GetBranchUrl(self, project_id, branch_name):
         url = f"{self.url}/{project_id}/repository/branches/{branch_name}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception("get branch url failed! url: " + url + " reason: " + response.reason)
         return response.json()["web_url"]
 
     def GetTagUrl(self, project_id, tag_name):
         url = f"{self.url}/{project_id}/repository/tags/{tag_name}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception("get tag url failed! url: " + url + " reason: " + response.reason)
         return response.json()["web_url"]
 
-    def CheckOut(self, local_path, clone_url, branch_name):
+    def CheckOut(self, local_path, clone_url, branch_name, options=None):
+        options = dict(self.checkout_options, **(options or {}))
         tmp_path = os.path.join(local_path, ".git")
         if os.path.exists(tmp_path):
             cmd = ["git", "status"]
@@ -367,73 +653,111 @@ class GitUtil:
             if output.find(branch_name) != -1:
                 cmd = ["git", "pull"]
                 self.__RunGitCmd(cmd, cwd=local_path)
-                cmd = ["git", "submodule", "update", "--init", "--recursive"]
+                cmd = ["git", "submodule", "update", "--init", "--recursive"] + GitUtil.__SubModuleArgs(options)
                 self.__RunGitCmd(cmd, cwd=local_path)
                 return
             else:
                 raise Exception(f"local path {local_path} is not empty!")
 
         tmp_clone_url = clone_url.replace("://", f"://{self.username}:{self.access_token}@")
+        with self.__UseMirror(clone_url, tmp_clone_url, partial=bool(options.get("filter"))) as mirror_args:
+            cmds = GitUtil.MakeCheckOutCmds(tmp_clone_url, branch_name, local_path, options, mirror_args)
+            for cmd in cmds:
+                self.__RunGitCmd(cmd, cwd=local_path if cmd[1] == "submodule" else None)
 
-        cmd = ["git", "clone", "--single-branch", "-b", branch_name, tmp_clone_url, local_path]
-        self.__RunGitCmd(cmd)
-        cmd = ["git", "submodule", "update", "--init", "--recursive"]
-        self.__RunGitCmd(cmd, cwd=local_path)
-        cmd = ["git", "submodule", "update", "--init", "--remote"]
-        self.__RunGitCmd(cmd, cwd=local_path)
+    @staticmethod
+    def MakeCheckOutCmds(clone_url, branch_name, local_path, options, clone_args=None):
+        """
+        Returns the commands of a checkout, the "git submodule" ones run in local_path.
+
+        :param options: The checkout options:
+            - 'depth': The number of commits of the branch history to fetch, None or 0 for all.
+            - 'filter': The partial clone filter, e.g. "blob:none" or "tree:0", None for a full clone.
+            - 'shallow_submodules': True to fetch the submodules at depth 1.
+            - 'jobs': The number of submodules fetched in parallel, None for git's default.
+        :param clone_args: The extra arguments of "git clone", e.g. the "--reference" of a mirror.
+        """
+        cmd = ["git", "clone", "--single-branch", "-b", branch_name] + (clone_args or [])
+        if options.get("depth"):
+            cmd += ["--depth", str(options["depth"])]
+        if options.get("filter"):
+            cmd.append(f"--filter={options['filter']}")
+        submodule_args = GitUtil.__SubModuleArgs(options)
+        return [
+            cmd + [clone_url, local_path],
+            ["git", "submodule", "update", "--init", "--recursive"] + submodule_args,
+            ["git", "submodule", "update", "--init", "--remote"] + submodule_args,
+        ]
+
+    @contextmanager
+    def __UseMirror(self, clone_url, tmp_clone_url, dissociate=None, partial=False):
+        """
+        Yields the arguments of "git clone" to borrow the objects of the mirror of the repository, empty if the
+        mirror cache is disabled. The mirror is not evicted until the block ends, see GitMirrorCache.Use.
+
+        :param partial: True for a partial clone, which does not use the mirror if it dissociates: copying the whole
+            history of the mirror takes more than downloading the partial clone.
+        """
+        if dissociate is None and self.mirror_cache is not None:
+            dissociate = self.mirror_cache.dissociate
+        if self.mirror_cache is None or (partial and dissociate):
+            yield []
+            return
+        with self.mirror_cache.Use(clone_url, tmp_clone_url, self.__RunGitCmd, dissociate) as mirror_args:
+            yield mirror_args
+
+    @staticmethod
+    def __SubModuleArgs(options):
+        args = []
+        if options.get("shallow_submodules"):
+            args += ["--depth", "1"]
+        if options.get("jobs"):
+            args += ["--jobs", str(options["jobs"])]
+        return args
 
     def CheckOutDirectory(self, local_path, clone_url, branch_name, rel_path):
         tmp_clone_url = clone_url.replace("://", f"://{self.username}:{self.access_token}@")
-        cmd = ["git", "clone", "--no-checkout", tmp_clone_url, local_path]
-        self.__RunGitCmd(cmd)
-        cmd = ["git", "config", "core.sparseCheckout", "true"]
-        self.__RunGitCmd(cmd, cwd=local_path)
-        with open(os.path.join(local_path, ".git/info/sparse-checkout"), "w") as f:
-            f.write(f"{rel_path}/*")
-            f.close()
-        cmd = ["git", "checkout", branch_name]
-        self.__RunGitCmd(cmd, cwd=local_path)
+        with self.__UseMirror(clone_url, tmp_clone_url) as mirror_args:
+            cmd = ["git", "clone", "--no-checkout"] + mirror_args + [tmp_clone_url, local_path]
+            self.__RunGitCmd(cmd)
+            cmd = ["git", "config", "core.sparseCheckout", "true"]
+            self.__RunGitCmd(cmd, cwd=local_path)
+            with open(os.path.join(local_path, ".git/info/sparse-checkout"), "w") as f:
+                f.write(f"{rel_path}/*")
+                f.close()
+            cmd = ["git", "checkout", branch_name]
+            self.__RunGitCmd(cmd, cwd=local_path)
 
     def CheckOutFile(self, local_path, clone_url, branch_name, file_rel_path):
         tmp_clone_url = clone_url.replace("://", f"://{self.username}:{self.access_token}@")
-        cmd = ["git", "clone", "--no-checkout", tmp_clone_url, local_path]
-        self.__RunGitCmd(cmd)
-        cmd = ["git", "config", "core.sparseCheckout", "true"]
-        self.__RunGitCmd(cmd, cwd=local_path)
-        with open(os.path.join(local_path, ".git/info/sparse-checkout"), "w") as f:
-            f.write(f"{file_rel_path}")
-            f.close()
-        cmd = ["git", "checkout", branch_name]
-        self.__RunGitCmd(cmd, cwd=local_path)
+        with self.__UseMirror(clone_url, tmp_clone_url) as mirror_args:
+            cmd = ["git", "clone", "--no-checkout"] + mirror_args + [tmp_clone_url, local_path]
+            self.__RunGitCmd(cmd)
+            cmd = ["git", "config", "core.sparseCheckout", "true"]
+            self.__RunGitCmd(cmd, cwd=local_path)
+            with open(os.path.join(local_path, ".git/info/sparse-checkout"), "w") as f:
+                f.write(f"{file_rel_path}")
+                f.close()
+            cmd = ["git", "checkout", branch_name]
+            self.__RunGitCmd(cmd, cwd=local_path)
 
-    @staticmethod
-    def AddToControl(local_path, target_path):
+    def AddToControl(self, local_path, target_path):
         cmd = ["git", "add", target_path]
-        subprocess.check_output(cmd, cwd=local_path)
+        self.__RunGitCmd(cmd, cwd=local_path)
 
-    @staticmethod
-    def Commit(local_path, comment):
+    def Commit(self, local_path, comment):
         cmd = ["git", "commit", "-a", "-m", comment]
-        subprocess.check_output(cmd, cwd=local_path)
+        self.__RunGitCmd(cmd, cwd=local_path)
         cmd = ["git", "push"]
-        subprocess.check_output(cmd, cwd=local_path)
+        self.__RunGitCmd(cmd, cwd=local_path)
 
     def GetBranchProtectedInfo(self, project_id, branch_name):
-        per_page = 20
-        page = 1
-        while True:
-            url = f"{self.url}/{project_id}/protected_branches?per_page={per_page}&page={page}"
-            response = requests.get(url, headers=self.headers)
-            if response.status_code != 200:
-                raise Exception("get protected branch failed! url: " + url + " reason: " + response.reason)
-            for item in response.json():
-                if item["name"] == branch_name:
-                    return {"allowed_merge": item["merge_access_levels"][0]["access_level"] == 30,
-                            "allowed_push": item["push_access_levels"][0]["access_level"] == 30
-                            }
-            if len(response.json()) < per_page:
-                break
-            page += 1
+        url = f"{self.url}/{project_id}/protected_branches"
+        for item in self.IterPages(url, action="get protected branch"):
+            if item["name"] == branch_name:
+                return {"allowed_merge": item["merge_access_levels"][0]["access_level"] == 30,
+                        "allowed_push": item["push_access_levels"][0]["access_level"] == 30
+                        }
         return None
 
     def SetBranchProtected(self, project_id, branch_name, allowed_merge, allowed_push):
@@ -445,7 +769,7 @@ class GitUtil:
         merge_access_level = 30 if allowed_merge else 40
 
         if self.GetBranchProtectedInfo(project_id, branch_name) is not None:
-            response = requests.delete(url + "/" + branch_name, headers=self.headers)
+            response = self.session.delete(url + "/" + branch_name, headers=self.headers)
             if response.status_code != 204:
                 raise Exception("delete protected branch failed! url: " + url + " reason: " + response.reason)
         data = {
@@ -453,26 +777,31 @@ class GitUtil:
             "push_access_level": push_access_level,
             "merge_access_level": merge_access_level
         }
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.session.post(url, headers=self.headers, json=data)
         if response.status_code != 201:
             raise Exception("add protected branch failed! url: " + url + " reason: " + response.reason)
 
     def DeleteBranch(self, project_id, branch_name):
-        url = f"{self.url}/{project_id}/repository/branches/{branch_name}"
-        response = requests.delete(url, headers=self.headers)
-        if response.status_code != 204 and response.status_code != 404:
+        url = f"{self.url}/{project_id}/repository/branches/{quote(branch_name, safe='')}"
+        response = self.session.delete(url, headers=self.headers)
+        # a 404 is also returned without the permission, it is fine only if the branch is gone
+        if response.status_code == 404 and self.GetBranch(project_id, branch_name) is None:
+            return
+        if response.status_code != 204:
             raise Exception("delete branch failed! url: " + url + " reason: " + response.reason)
 
     def DeleteTag(self, project_id, tag_name):
-        url = f"{self.url}/{project_id}/repository/tags/{tag_name}"
-        response = requests.delete(url, headers=self.headers)
-        if response.status_code != 204 and response.status_code != 404:
+        url = f"{self.url}/{project_id}/repository/tags/{quote(tag_name, safe='')}"
+        response = self.session.delete(url, headers=self.headers)
+        if response.status_code == 404 and self.GetTag(project_id, tag_name) is None:
+            return
+        if response.status_code != 204:
             raise Exception("delete tag failed! url: " + url + " reason: " + response.reason)
 
     def GetDiffFiles(self, project_id, from_branch, to_branch):
         files = []
         url = f"{self.url}/{project_id}/repository/compare?from={from_branch}&to={to_branch}&straight=true"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception("compare branch failed! url: " + url + " reason: " + response.reason)
         return response.json()["diffs"]
@@ -491,14 +820,14 @@ class GitUtil:
 
     def GetBranchDiffCommit(self, project_id, from_branch, to_branch):
         url = f"{self.url}/{project_id}/repository/compare?from={from_branch}&to={to_branch}&straight=true"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception("compare branch failed! url: " + url + " reason: " + response.reason)
         return response.json()["diffs"]
 
     def GetMergeRequest(self, project_id, source_branch, target_branch):
         url = f"{self.url}/{project_id}/merge_requests?source_branch={source_branch}&target_branch={target_branch}"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code == requests.codes.not_found:
             return None
         if response.status_code != requests.codes.ok:
@@ -520,7 +849,7 @@ class GitUtil:
 
         iid = found_mr["iid"]
         url = f"{self.url}/{project_id}/merge_requests/{iid}/approvals"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception("get merge request failed! url: " + url + " reason: " + response.reason)
         re["approvals"] = response.json()
@@ -543,7 +872,7 @@ class GitUtil:
             "merge_commit_message": comment,
             "squash": False
         }
-        response = requests.put(url, headers=self.headers, json=data)
+        response = self.session.put(url, headers=self.headers, json=data)
         if response.status_code != 200:
             raise Exception("execute merge request failed! url: " + url + " reason: " + response.reason)
 
@@ -555,7 +884,7 @@ class GitUtil:
             "title": title,
             "description": description
         }
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.session.post(url, headers=self.headers, json=data)
         if response.status_code != 201:
             raise Exception("create merge request failed! url: " + url + " reason: " + response.reason)
 
@@ -565,32 +894,25 @@ class GitUtil:
         cmd = ["git", "push", "-f"]
         self.__RunGitCmd(cmd, cwd=local_path)
 
-    def ContainsEntity(self, project_id, target_entity, source_entity):
-        source_last_commit_info = self.GetLastCommitInfoOfBranch(project_id, source_entity)
-        source_last_commit_id = source_last_commit_info["commit_id"]
-        target_last_commit_id = self.GetLastCommitIdOfBranch(project_id, target_entity)
-        print(f"source_last_commit_id: {source_last_commit_id}, target_last_commit_id: {target_last_commit_id}")
-        url = f"{self.url}/{project_id}/repository/commits"
-        params = {
-            'ref_name': target_entity,
-            'since': source_last_commit_info['date']
-        }
-        per_page = 100
-        page = 1
-        while True:
-            response = requests.get(f"{url}?per_page={per_page}&page={page}", headers=self.headers, params=params)
-            #print(response.json())
-            #GitUtil.__PrintJson(response.json())
-            if response.status_code != requests.codes.ok:
-                raise Exception("check contains entity failed! url: " + url + " reason: " + response.reason)
-            commits = response.json()
-            for commit in commits:
-                if commit["id"] == source_last_commit_id:
-                    return True
-            if len(commits) < per_page:
-                break
-            page = page + 1
-        return False
+    def GetMergeBase(self, project_id, refs):
+        url = f"{self.url}/{project_id}/repository/merge_base"
+        response = self.session.get(url, headers=self.headers, params={"refs[]": refs})
+        if response.status_code == 400 or response.status_code == 404:  # no common ancestor or ref not found
+            return None
+        if response.status_code != 200:
+            raise Exception("get merge base failed! url: " + url + " reason: " + response.reason)
+        return response.json()["id"]
+
+    def ContainsEntity(self, project_id, target_entity, source_entity, source_commit_id=None):
+        """
+        Checks if the head of the source is an ancestor of the target, by the merge base of both.
+
+        :param source_commit_id: The head commit id of the source if already known.
+        """
+        if source_commit_id is None:
+            source_commit_id = self.GetLastCommitIdOfBranch(project_id, source_entity)
+        merge_base = self.GetMergeBase(project_id, [target_entity, source_commit_id])
+        return merge_base == source_commit_id
 
     def AddWebHook(self, project_id, branch_name, webhook_url, secret_token):
         url = f"{self.url}/{project_id}/hooks"
@@ -600,13 +922,13 @@ class GitUtil:
             "push_events_branch_filter": branch_name,
             "token": secret_token,
         }
-        response = requests.post(url, headers=self.headers, json=data)
+        response = self.session.post(url, headers=self.headers, json=data)
         if response.status_code != 201:
             raise Exception("add web hook failed! url: " + url + "reason: " + response.reason)
 
     def GetWebHook(self, project_id, webhook_url):
         url = f"{self.url}/{project_id}/hooks"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         if response.status_code != 200:
             raise Exception("get web hook failed! url: " + url + "reason: " + response.reason)
         hooks = response.json()
@@ -621,7 +943,7 @@ class GitUtil:
             return
         webhook_id = hook["id"]
         url = f"{self.url}/{project_id}/hooks/{webhook_id}"
-        response = requests.delete(url, headers=self.headers)
+        response = self.session.delete(url, headers=self.headers)
         if response.status_code != 204:
             raise Exception("delete web hook failed! url: " + url + "reason: " + response.reason)
 
@@ -661,19 +983,4 @@ class GitUtil:
         print(json.dumps(json_str, indent=4, ensure_ascii=False))
 
     def __RunGitCmd(self, cmd, **kwargs):
-        tmp_args = {}
-        tmp_args["stderr"] = subprocess.STDOUT
-        if "disable_stderr" in kwargs and kwargs["disable_stderr"]:
-            tmp_args["stderr"] = subprocess.DEVNULL
-        if "cwd" in kwargs:
-            tmp_args["cwd"] = kwargs["cwd"]
-        err_info = None
-        try:
-            output = subprocess.check_output(cmd, **tmp_args).decode("utf-8")
-            return output
-        except subprocess.CalledProcessError as e:
-            err_info = e.output.decode("utf-8")
-            if self.access_token is not None:
-                err_info = err_info.replace(self.access_token, "******")
-        if err_info is not None:
-            raise Exception(err_info)
+        return self.cmd_runner.Run(cmd, cwd=kwargs.get("cwd"), disable_stderr=kwargs.get("disable_stderr", False))
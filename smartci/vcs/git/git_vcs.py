@@ -1,28 +1,70 @@
 # -*- coding:utf-8 -*-
 
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
+from smartci.vcs.git.git_graphql import GitGraphQL
 from smartci.vcs.git.git_repo import GitRepo
 from smartci.vcs.git.git_util import GitUtil
 
 
 class Git:
-    def __init__(self, address, username, access_token) -> None:
+    DEFAULT_CONCURRENCY = 8
+
+    def __init__(self, address, username, access_token, options=None) -> None:
         super().__init__()
-        self.util = GitUtil(address, username, access_token)
+        if options is None:
+            options = {}
+        self.util = GitUtil(address, username, access_token, options)
         self.type = "git"
         self.address = address
+        self.scope = options.get("scope")  # filters of project discovery
+        self.concurrency = options.get("concurrency", Git.DEFAULT_CONCURRENCY)  # max concurrent requests to the server
+        self.graphql = GitGraphQL(self.util) if options.get("graphql", False) else None
 
     def GetAddress(self):
         return self.address
 
     def GetRepos(self):
-        projects = self.util.ListProjects()
-        repos = []
-        for project in projects:
-            repo = GitRepo(self, project)
-            repos.append(repo)
-        return repos
+        return list(self.IterRepos())
+
+    def IterRepos(self):
+        for project in self.util.IterProjects(self.scope):
+            yield GitRepo(self, project)
+
+    def IsSupportBatchLoad(self):
+        return self.graphql is not None
+
+    def GetBatchLoadSize(self):
+        return GitGraphQL.BATCH_SIZE
+
+    def BatchLoadRepos(self, repos, file_path, branch_name=None):
+        """
+        Loads a file of the trunk and the head of a branch for many repositories with GraphQL.
+
+        :return: A list in the order of repos, each item is {"file": {"content": str, "blob_id": str} or None,
+            "default_branch": str, "branch_sha": str or None}, or None if the repository can not be read.
+        """
+        batches = [repos[i:i + GitGraphQL.BATCH_SIZE] for i in range(0, len(repos), GitGraphQL.BATCH_SIZE)]
+
+        def load(batch):
+            return self.graphql.LoadProjects([repo.GetProjectID() for repo in batch], file_path, branch_name)
+
+        result = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch, infos in zip(batches, executor.map(load, batches)):
+                for repo in batch:
+                    result.append(infos.get(repo.GetProjectID()))
+        return result
+
+    def GetRepoFromRecord(self, record):
+        """
+        Builds the repository from its catalog record without any request, or returns None if the record lacks the
+        fields of the project, e.g. saved by an older version.
+        """
+        project = GitRepo.MakeProjectFromRecord(record)
+        if project is None:
+            return None
+        return GitRepo(self, project)
 
     def GetRepoByUrl(self, web_url):
         if not web_url.startswith(self.address):
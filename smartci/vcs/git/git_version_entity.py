@@ -1,14 +1,22 @@
 # -*- coding:utf-8 -*-
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 class GitVersionEntity:
-    def __init__(self, vcs, repo, name) -> None:
+    __slots__ = ("vcs", "repo", "name", "type", "info", "info_time")
+
+    def __init__(self, vcs, repo, name, type=None, info=None) -> None:
         self.vcs = vcs  # Git
         self.repo = repo
         self.name = name
-        self.type = repo.GetVersionEntityType(name)
+        self.type = type  # "trunk", "branch" or "tag", resolved on first use if unknown
+        if self.type is None and repo.IsTrunkName(name):
+            self.type = "trunk"
+        # branch or tag info returned by gitlab api, including the head commit, loaded on first use if unknown
+        self.info = info
+        self.info_time = time.time() if info is not None else None
 
     def GetName(self):
         if self.type == "trunk":
@@ -16,28 +24,69 @@ class GitVersionEntity:
         return self.name
 
     def GetType(self):
+        if self.type is None:
+            self.type = self.repo.GetVersionEntityType(self.name)
         return self.type
 
     def GetPrimitiveName(self):
         return self.name
 
+    def Refresh(self):
+        """
+        Re-reads the branch or tag info from the server.
+        """
+        if self.GetType() == "tag":
+            info = self.vcs.util.GetTag(self.repo.GetProjectID(), self.name)
+        else:
+            info = self.vcs.util.GetBranch(self.repo.GetProjectID(), self.name)
+        if info is None:
+            raise Exception(f"{self.GetType()} {self.name} not found in {self.repo.GetUrl()}")
+        self.info = info
+        self.info_time = time.time()
+
+    def GetInfoAge(self):
+        """
+        Returns the seconds since the branch or tag info was read, or None if it has not been read.
+        """
+        if self.info_time is None:
+            return None
+        return time.time() - self.info_time
+
+    def _Invalidate(self):
+        self.info = None
+        self.info_time = None
+
+    def __GetInfo(self):
+        if self.info is None:
+            self.Refresh()
+        return self.info
+
     def GetUrl(self):
-        if self.type == "branch":
-            return self.vcs.util.GetBranchUrl(self.repo.GetProjectID(), self.name)
-        elif self.type == "tag":
+        if self.GetType() == "branch":
+            return self.__GetInfo()["web_url"]
+        elif self.GetType() == "tag":
+            info = self.__GetInfo()
+            if "web_url" in info:
+                return info["web_url"]
             return self.vcs.util.GetTagUrl(self.repo.GetProjectID(), self.name)
 
     def GetFileContent(self, file_path):
         return self.vcs.util.GetFileContent(self.repo.GetProjectID(), self.name, file_path)
 
+    def GetFileInfo(self, file_path):
+        return self.vcs.util.GetFileInfo(self.repo.GetProjectID(), self.name, file_path)
+
+    def GetFileVersion(self, file_path):
+        return self.vcs.util.GetFileBlobId(self.repo.GetProjectID(), self.name, file_path)
+
     def PathExists(self, path):
         return self.vcs.util.PathExists(self.repo.GetProjectID(), self.name, path)
 
     def FileExists(self, file_path):
         return self.vcs.util.FileExists(self.repo.GetProjectID(), self.name, file_path)
 
-    def CheckOut(self, local_path):
-        self.vcs.util.CheckOut(local_path, self.repo.GetHttpCloneUrl(), self.name)
+    def CheckOut(self, local_path, options=None):
+        self.vcs.util.CheckOut(local_path, self.repo.GetHttpCloneUrl(), self.name, options)
 
     def CheckOutDirectory(self, local_path, rel_path):
         self.vcs.util.CheckOutDirectory(local_path, self.repo.GetHttpCloneUrl(), self.name, rel_path)
@@ -50,18 +99,21 @@ class GitVersionEntity:
 
     def Commit(self, local_path, comment):
         self.vcs.util.Commit(local_path, comment)
+        self._Invalidate()
 
     def AddFile(self, local_path, file_rel_path, content, comment):
         self.vcs.util.AddFile(self.repo.GetProjectID(), self.name, file_rel_path, content, comment)
+        self._Invalidate()
 
     def RemoveFile(self, file_rel_path, comment):
         self.vcs.util.RemoveFile(self.repo.GetProjectID(), self.name, file_rel_path, comment)
+        self._Invalidate()
 
     def GetLastCommitId(self):
-        return self.vcs.util.GetLastCommitIdOfBranch(self.repo.GetProjectID(), self.name)
+        return self.GetLastCommitInfo()["commit_id"]
 
     def GetLastCommitInfo(self):
-        return self.vcs.util.GetLastCommitInfoOfBranch(self.repo.GetProjectID(), self.name)
+        return self.vcs.util.ToCommitInfo(self.__GetInfo()["commit"])
 
     def GetCommitIdOfLocalPath(self, local_path):
         return self.vcs.util.GetCommitIdOfLocalPath(local_path)
@@ -91,6 +143,17 @@ class GitVersionEntity:
             result.append(repo)
         return result
 
+    def GetRefs(self):
+        # the references as written in .gitmodules, without looking up the referenced repositories
+        submodules = self.vcs.util.GetSubModules(self.repo.GetProjectID(), self.name)
+        result = []
+        for mount_rel_path, submodule in submodules.items():
+            url = submodule['url']
+            if url.endswith(".git"):
+                url = url[:-len(".git")]
+            result.append({"mount_rel_path": mount_rel_path, "repo_url": url, "name": submodule.get('branch')})
+        return result
+
     def GetRefVersionEntities(self, loal_path):
         submodules = self.vcs.util.GetSubModules(self.repo.GetProjectID(), self.name, loal_path)
         result = []
@@ -103,23 +166,37 @@ class GitVersionEntity:
         return result
 
     def AddRef(self, work_dir, ref_entity, mount_rel_path, placeholder2):
-        self.CheckOut(work_dir)
-        self.vcs.util.AddSubModule(work_dir, self.repo.GetProjectID(), self.name,
-                                   ref_entity.repo.GetHttpCloneUrl(), ref_entity.GetPrimitiveName(), mount_rel_path)
+        self.vcs.util.AddSubModule(work_dir, self.repo.GetProjectID(), self.name, self.repo.GetHttpCloneUrl(),
+                                   ref_entity.repo.GetHttpCloneUrl(), ref_entity.GetPrimitiveName(),
+                                   ref_entity.GetLastCommitId(), mount_rel_path)
+        self._Invalidate()
 
     def RemoveRefByMountRelPath(self, work_dir, mount_rel_path):
-        self.CheckOut(work_dir)
-        self.vcs.util.RemoveSubModuleByMountRelPath(work_dir, self.repo.GetProjectID(), self.name, mount_rel_path)
+        self.vcs.util.RemoveSubModuleByMountRelPath(work_dir, self.repo.GetProjectID(), self.name,
+                                                    self.repo.GetHttpCloneUrl(), mount_rel_path)
+        self._Invalidate()
 
     def UpdateRefEntity(self, local_path, ref_entity):
-        ref_repo_url = ref_entity.repo.GetHttpCloneUrl()
-        self.vcs.util.UpdateSubModule(self.repo.GetProjectID(), self.name, ref_repo_url, ref_entity.name)
+        return self.UpdateRefEntities(local_path, [ref_entity])
+
+    def UpdateRefEntities(self, local_path, ref_entities):
+        ref_branches = {ref_entity.repo.GetHttpCloneUrl(): ref_entity.name for ref_entity in ref_entities}
+        changed = self.vcs.util.UpdateSubModules(self.repo.GetProjectID(), self.name, ref_branches)
+        if changed:
+            self._Invalidate()
+        return changed
 
     def SetProtected(self, allowed_merge, allowed_push):
         self.vcs.util.SetBranchProtected(self.repo.GetProjectID(), self.name, allowed_merge, allowed_push)
+        self._Invalidate()
 
     def GetProtectedInfo(self):
-        return self.vcs.util.GetBranchProtectedInfo(self.repo.GetProjectID(), self.name)
+        if self.GetType() == "tag":
+            return self.vcs.util.GetBranchProtectedInfo(self.repo.GetProjectID(), self.name)
+        info = self.__GetInfo()
+        if not info["protected"]:
+            return None
+        return {"allowed_merge": info["developers_can_merge"], "allowed_push": info["developers_can_push"]}
 
     def GetMergeRequestStatus(self, target_branch, local_path, min_reviewers=1):
         mr_info = self.vcs.util.GetMergeRequest(self.repo.GetProjectID(), self.GetPrimitiveName(), target_branch.GetPrimitiveName())
@@ -190,6 +267,7 @@ class GitVersionEntity:
     def AcceptMergeRequest(self, target_branch, comment, remove_branch_after_merge, local_path=None):
         self.vcs.util.AcceptMergeRequest(self.repo.GetProjectID(), self.GetPrimitiveName(), target_branch.GetPrimitiveName(),
                                          comment, remove_branch_after_merge)
+        target_branch._Invalidate()
 
     def MergeTo(self, target_branch, comment, local_path=None):
         """
@@ -228,10 +306,30 @@ class GitVersionEntity:
     def Rollback(self, commit_id, comment, local_path):
         self.CheckOut(local_path)
         self.vcs.util.Rollback(local_path, commit_id)
+        self._Invalidate()
 
     def ContainsEntity(self, entity):
         return self.vcs.util.ContainsEntity(self.repo.GetProjectID(), self.GetPrimitiveName(), entity.GetPrimitiveName())
 
+    def GetMergedEntities(self, entities):
+        merged_names = None
+        if self.GetType() == "trunk":
+            # the branch listing tells whether each branch is merged into the default branch
+            merged_names = set()
+            for branch in self.vcs.util.ListBranches(self.repo.GetProjectID(), ".*"):
+                if branch["merged"]:
+                    merged_names.add(branch["name"])
+
+        def contains(entity):
+            if merged_names is not None and entity.GetType() == "branch":
+                return entity.GetPrimitiveName() in merged_names
+            return self.vcs.util.ContainsEntity(self.repo.GetProjectID(), self.GetPrimitiveName(),
+                                                entity.GetPrimitiveName(), entity.GetLastCommitId())
+
+        with ThreadPoolExecutor(max_workers=self.vcs.concurrency) as executor:
+            flags = list(executor.map(contains, entities))
+        return [entity for entity, merged in zip(entities, flags) if merged]
+
     def AddWebHook(self, url, secret_token):
         self.vcs.util.AddWebHook(self.repo.GetProjectID(), self.GetPrimitiveName(), url, secret_token)
 
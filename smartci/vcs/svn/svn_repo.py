@@ -1,10 +1,13 @@
 # -*- coding:utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
 
 from smartci.vcs.svn.svn_version_entity import SvnVersionEntity
 import re
 
 
 class SvnRepo:
+    __slots__ = ("vcs", "rel_path")
+
     def __init__(self, vcs, rel_path) -> None:
         self.vcs = vcs
         self.rel_path = rel_path
@@ -12,6 +15,10 @@ class SvnRepo:
     def GetUrl(self):
         return self.vcs.util.GetAbsolutePath(self.rel_path)
 
+    def GetRecordInfo(self):
+        # the relative path saved as the repo id is enough to restore the repository
+        return {}
+
     def CreateBranch(self, branch_name, comment):
         print(f"Create branch {branch_name} for {self.rel_path}")
         trunk_path = self.rel_path + "/trunk"
@@ -47,6 +54,26 @@ class SvnRepo:
         if self.vcs.util.PathExists(path):
             self.vcs.util.Remove(path, comment)
 
+    def GetMergedBranches(self, branch_name_pattern, include_unchanged=False):
+        branches = self.GetTrunk().GetMergedEntities(self.GetBranches(branch_name_pattern))
+        if include_unchanged:
+            return branches
+        with ThreadPoolExecutor(max_workers=self.vcs.concurrency) as executor:
+            flags = list(executor.map(lambda branch: self.vcs.util.HasOwnCommits(branch.rel_path), branches))
+        return [branch for branch, changed in zip(branches, flags) if changed]
+
+    def DeleteBranches(self, branches, comment):
+        if len(branches) > 0:
+            # one revision for all the branches
+            self.vcs.util.RemoveAll([branch.rel_path for branch in branches], comment)
+        return branches
+
+    def GetRepoId(self):
+        return self.rel_path
+
+    def GetTrunkName(self):
+        return "trunk"
+
     def GetBranchPath(self):
         return self.rel_path + "/branches"
 
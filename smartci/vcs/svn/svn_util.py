@@ -4,12 +4,16 @@ import subprocess
 
 import xml.etree.ElementTree as ET
 
+from smartci.util.cmd_runner import CmdError, CmdRunner
+
 
 class SvnUtil:
-    def __init__(self, address, username, password):
+    def __init__(self, address, username, password, options=None):
         self.address = address
         self.username = username
         self.password = password
+        self.options = options if options is not None else {}
+        self.cmd_runner = CmdRunner([self.password], self.options.get("cmd_timeout"))
 
     def GetAbsolutePath(self, rel_path):
         return self.address + "/" + rel_path
@@ -18,6 +22,23 @@ class SvnUtil:
         cmd = ["svn", "cat", self.address + "/" + file_path]
         return self.__RunSvnCmd(cmd)
 
+    def GetFileInfo(self, file_path):
+        revision = self.GetLastChangedRevision(file_path)
+        if revision is None:
+            return None
+        cmd = ["svn", "cat", self.address + "/" + file_path + "@" + revision]
+        return {"content": self.__RunSvnCmd(cmd), "blob_id": revision}
+
+    def GetLastChangedRevision(self, file_path):
+        cmd = ["svn", "info", "--show-item", "last-changed-revision", self.address + "/" + file_path]
+        try:
+            return self.__RunSvnCmd(cmd).strip()
+        except Exception as e:
+            # E160013: path not found, E200009: some targets don't exist, W170000: path not found by svn info
+            if str(e).find("E160013") != -1 or str(e).find("E200009") != -1 or str(e).find("W170000") != -1:
+                return None
+            raise e
+
     def ListEntryOfDir(self, rel_path):
         entrys = []
         cmd = ["svn", "list", self.address + "/" + rel_path]
@@ -60,7 +81,9 @@ class SvnUtil:
         return info
 
     def GetLastRevision(self, rel_path):
-        return self.GetLastRevisionInfo(rel_path)["commit_id"]
+        # without the commit message, which takes another "svn log"
+        cmd = ["svn", "info", self.address + "/" + rel_path, "--xml"]
+        return self._GetRevisionInfoFromXml(self.__RunSvnCmd(cmd))["commit_id"]
 
     def GetLastRevisionInfo(self, rel_path):
         cmd = ["svn", "info", self.address + "/" + rel_path, "--xml"]
@@ -156,6 +179,11 @@ class SvnUtil:
         cmd = ["svn", "delete", self.address + "/" + file_rel_path, "-m", f'"{comment}"']
         self.__RunSvnCmd(cmd)
 
+    def RemoveAll(self, file_rel_paths, comment):
+        cmd = ["svn", "delete"] + [self.address + "/" + file_rel_path for file_rel_path in file_rel_paths]
+        cmd += ["-m", f'"{comment}"']
+        self.__RunSvnCmd(cmd)
+
 
     def GetExternalsPath(self, rel_path):
         externals = []
@@ -175,7 +203,7 @@ class SvnUtil:
                 output = self.__RunSvnCmd(cmd)
             re = self.__ParseExternalsXml(output, rel_path, local_path)
             return re
-        except subprocess.CalledProcessError as e:
+        except CmdError:
             return {}
 
     def SaveExternals(self, local_path, rel_path, path_to_save_ref, externals):
@@ -225,15 +253,30 @@ class SvnUtil:
                 i += 1
 
     def UpdateExternal(self, local_path, rel_path, external_repo_rel_path, external_entity_rel_path):
+        return self.UpdateExternals(local_path, rel_path, {external_repo_rel_path: external_entity_rel_path})
+
+    def UpdateExternals(self, local_path, rel_path, external_paths):
+        # external_paths: {external_repo_rel_path: external_entity_rel_path}, saved once per anchor
         re = self.GetExternals(rel_path)
+        changed = False
         for path_to_save_ref, externals in re.items():
-            changed = False
+            anchor_changed = False
             for external in externals:
-                if external["abs"].find(external_repo_rel_path) == 0 and external["abs"] != external_entity_rel_path:
-                    external["abs"] = external_entity_rel_path
-                    changed = True
-            if changed:
+                for external_repo_rel_path, external_entity_rel_path in external_paths.items():
+                    if external["abs"].startswith(external_repo_rel_path + "/") \
+                            and external["abs"] != external_entity_rel_path:
+                        external["abs"] = external_entity_rel_path
+                        anchor_changed = True
+            if anchor_changed:
                 self.SaveExternals(local_path, rel_path, path_to_save_ref, externals)
+                changed = True
+        return changed
+
+    def HasOwnCommits(self, rel_path):
+        # the oldest revision of the log stopped on copy is the copy creating the branch
+        cmd = ["svn", "log", "-q", "--stop-on-copy", "-l", "2", "--xml", self.address + "/" + rel_path]
+        root = ET.fromstring(self.__RunSvnCmd(cmd))
+        return len(root.findall('logentry')) > 1
 
     def GetBranchDiffRevision(self, branch1_rel_path, branch2_rel_path):
         cmd = ["svn", "mergeinfo", "--show-revs", "eligible", self.address + "/" + branch1_rel_path, self.address + "/" + branch2_rel_path]
@@ -367,20 +410,5 @@ class SvnUtil:
 
     def __RunSvnCmd(self, cmd, **kwargs):
         if self.username is not None and self.password is not None:
-            cmd += ["--username", self.username, "--password", self.password, "--no-auth-cache"]
-        tmp_args = {}
-        tmp_args["stderr"] = subprocess.STDOUT
-        if "disable_stderr" in kwargs and kwargs["disable_stderr"]:
-            tmp_args["stderr"] = subprocess.DEVNULL
-        if "cwd" in kwargs:
-            tmp_args["cwd"] = kwargs["cwd"]
-        err_info = None
-        try:
-            output = subprocess.check_output(cmd, **tmp_args).decode("utf-8")
-            return output
-        except subprocess.CalledProcessError as e:
-            err_info = e.output.decode("utf-8")
-            if self.password is not None:
-                err_info = err_info.replace(self.password, "******")
-        if err_info is not None:
-            raise Exception(err_info)
+            cmd = cmd + ["--username", self.username, "--password", self.password, "--no-auth-cache"]
+        return self.cmd_runner.Run(cmd, cwd=kwargs.get("cwd"), disable_stderr=kwargs.get("disable_stderr", False))
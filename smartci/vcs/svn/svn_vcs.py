@@ -6,26 +6,31 @@ from smartci.vcs.svn.svn_version_entity import SvnVersionEntity
 
 
 class Svn:
-    def __init__(self, address, username, password, root_repos) -> None:
+    DEFAULT_CONCURRENCY = 8
+
+    def __init__(self, address, username, password, root_repos, options=None) -> None:
         super().__init__()
-        self.util = SvnUtil(address, username, password)
+        if options is None:
+            options = {}
+        self.util = SvnUtil(address, username, password, options)
         self.root_repos = root_repos  # svn仓库的根目录列表
         self.type = "svn"
         self.address = address
+        self.concurrency = options.get("concurrency", Svn.DEFAULT_CONCURRENCY)  # 并发访问服务器的最大数量
 
     def GetAddress(self):
         return self.address
 
+    def IsSupportBatchLoad(self):
+        return False
+
     def GetRepos(self):
-        repos_path = []
+        return list(self.IterRepos())
+
+    def IterRepos(self):
         for root_repo in self.root_repos:
-            self.__RecursiveGetRepos(root_repo, repos_path)
-        #print(repos_path)
-        repos = []
-        for path in repos_path:
-            repo = svn_repo.SvnRepo(self, path)
-            repos.append(repo)
-        return repos
+            for path in self.__RecursiveIterRepos(root_repo):
+                yield svn_repo.SvnRepo(self, path)
 
     def GetRepoByRelPath(self, rel_path):
         repo_rel_path = svn_repo.SvnRepo.GetRepoRelPathFromUrl(rel_path)
@@ -33,6 +38,15 @@ class Svn:
             return svn_repo.SvnRepo(self, repo_rel_path)
         return None
 
+    def GetRepoUrlByRelPath(self, rel_path):
+        return self.util.GetAbsolutePath(svn_repo.SvnRepo.GetRepoRelPathFromUrl(rel_path))
+
+    def GetRepoFromRecord(self, record):
+        """
+        Builds the repository from its catalog record without any request, see Git.GetRepoFromRecord.
+        """
+        return svn_repo.SvnRepo(self, record["repo_id"])
+
     def GetRepoByUrl(self, repo_url):
         if not repo_url.startswith(self.address):
             return None
@@ -53,16 +67,13 @@ class Svn:
         primitive_version_entity = SvnVersionEntity(self, primitive_repo, rel_path)
         return primitive_version_entity
 
-    def __RecursiveGetRepos(self, rel_path, repos):
+    def __RecursiveIterRepos(self, rel_path):
         # 遍历所有文件夹，如含trunk文件夹，则认为是一个repo
-        for entry in self.util.ListEntryOfDir(rel_path):
-            if not entry['is_directory']:
-                continue
+        entries = [entry for entry in self.util.ListEntryOfDir(rel_path) if entry['is_directory']]
+        for entry in entries:
             if entry['name'] == "trunk":
-                repos.append(rel_path)
+                yield rel_path
                 return
 
-        for entry in self.util.ListEntryOfDir(rel_path):
-            if not entry['is_directory']:
-                continue
-            self.__RecursiveGetRepos(rel_path + "/" + entry['name'], repos)
+        for entry in entries:
+            yield from self.__RecursiveIterRepos(rel_path + "/" + entry['name'])
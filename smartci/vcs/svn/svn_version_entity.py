@@ -1,7 +1,10 @@
 import os.path
+from concurrent.futures import ThreadPoolExecutor
 
 
 class SvnVersionEntity:
+    __slots__ = ("vcs", "repo", "rel_path", "name", "type")
+
     def __init__(self, vcs, repo, rel_path) -> None:
         self.vcs = vcs  # Svn
         self.repo = repo
@@ -26,6 +29,12 @@ class SvnVersionEntity:
     def GetPrimitiveName(self):
         return self.name
 
+    def Refresh(self):
+        pass  # nothing cached, svn info is always read from the server
+
+    def GetInfoAge(self):
+        return None
+
     def GetUrl(self):
         return self.vcs.util.GetAbsolutePath(self.rel_path)
 
@@ -35,14 +44,20 @@ class SvnVersionEntity:
     def GetFileContent(self, file_path) :
         return self.vcs.util.GetFileContent(self.rel_path + "/" + file_path)
 
+    def GetFileInfo(self, file_path):
+        return self.vcs.util.GetFileInfo(self.rel_path + "/" + file_path)
+
+    def GetFileVersion(self, file_path):
+        return self.vcs.util.GetLastChangedRevision(self.rel_path + "/" + file_path)
+
     def PathExists(self, path):
         return self.vcs.util.PathExists(self.rel_path + "/" + path)
 
     def FileExists(self, file_path):
         return self.vcs.util.PathExists(self.rel_path + "/" + file_path)
 
-    def CheckOut(self, local_path):
-        self.vcs.util.CheckOut(self.rel_path, local_path)
+    def CheckOut(self, local_path, options=None):
+        self.vcs.util.CheckOut(self.rel_path, local_path)  # the options are for git only
 
     def CheckOutDirectory(self, local_path, rel_path):
         self.vcs.util.CheckOutDirectory(f"{self.rel_path}/{rel_path}", local_path)
@@ -113,6 +128,16 @@ class SvnVersionEntity:
                 result.append({"mount_rel_path": os.path.join(path_to_save_ref, external["mount_rel_path"]), "version_entity": entity})
         return result
 
+    def GetRefs(self):
+        # the references as written in svn:externals, without looking up the referenced repositories
+        result = []
+        for path_to_save_ref, externals in self.vcs.util.GetExternals(self.rel_path).items():
+            for external in externals:
+                result.append({"mount_rel_path": os.path.join(path_to_save_ref, external["mount_rel_path"]),
+                               "repo_url": self.vcs.GetRepoUrlByRelPath(external["abs"]),
+                               "name": external["abs"].split("/")[-1]})
+        return result
+
     def RemoveRefByMountRelPath(self, work_dir, mount_rel_path):
         self.vcs.util.RemoveExternalByMountRelPath(work_dir, self.rel_path, mount_rel_path)
 
@@ -127,9 +152,14 @@ class SvnVersionEntity:
         return result
 
     def UpdateRefEntity(self, local_path, external_branch):
-        print("Refresh Ref to " + external_branch.GetUrl() + " for " + local_path)
-        external_repo = self.vcs.GetRepoByRelPath(external_branch.rel_path)
-        self.vcs.util.UpdateExternal(local_path, self.rel_path, external_repo.rel_path, external_branch.rel_path)
+        return self.UpdateRefEntities(local_path, [external_branch])
+
+    def UpdateRefEntities(self, local_path, external_entities):
+        for external_entity in external_entities:
+            print("Refresh Ref to " + external_entity.GetUrl() + " for " + local_path)
+        external_paths = {external_entity.repo.rel_path: external_entity.rel_path
+                          for external_entity in external_entities}
+        return self.vcs.util.UpdateExternals(local_path, self.rel_path, external_paths)
 
     def SetProtected(self, allowed_merge, allowed_push):
         pass
@@ -146,6 +176,12 @@ class SvnVersionEntity:
     def ContainsEntity(self, entity):
         diffs = self.vcs.util.GetBranchDiffRevision(entity.rel_path, self.rel_path)
         return diffs == ""
+
+    def GetMergedEntities(self, entities):
+        with ThreadPoolExecutor(max_workers=self.vcs.concurrency) as executor:
+            flags = list(executor.map(self.ContainsEntity, entities))
+        return [entity for entity, merged in zip(entities, flags) if merged]
+
     def IsSupportMergeRequest(self):
         return False
 
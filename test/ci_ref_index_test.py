@@ -0,0 +1,127 @@
+# -*- coding:utf-8 -*-
+import time
+
+from fake_vcs import CreateCiVcs, FakeVcs
+
+
+def create_ci_vcs(tmp_path):
+    """
+    "app" references "lib" on its trunk and on the branch "2401_1", "lib" references nothing.
+    """
+    vcs = FakeVcs()
+    lib_ref = [{"mount_rel_path": "lib", "repo_url": "http://git1/test/lib", "name": "master"}]
+    vcs.AddRepo("app", heads={"master": "a1", "2401": "a2", "2401_1": "a3"}, refs={"master": lib_ref, "2401_1": lib_ref})
+    vcs.AddRepo("lib", heads={"master": "l1", "2401": "l2"})
+    return vcs, CreateCiVcs([vcs], tmp_path=tmp_path)
+
+
+def test_incremental_refresh(tmp_path):
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    stats = ci_vcs.RefreshRefIndex()
+    assert (stats["repos"], stats["entities"], stats["updated"]) == (2, 5, 5)
+    assert ci_vcs.GetRefIndex().GetRefs("http://git1/test/app", "2401_1")[0]["mount_rel_path"] == "lib"
+
+    # only the entity whose head has moved is read again, deleted branches are dropped
+    vcs.repos["app"].heads["2401_1"] = "a4"
+    del vcs.repos["app"].heads["2401"]
+    vcs.requests = []
+    stats = ci_vcs.RefreshRefIndex()
+    assert stats["updated"] == 1
+    assert vcs.Count("refs") == 1
+    assert ci_vcs.GetRefIndex().GetHeads("http://git1/test/app") == {"master": "a1", "2401_1": "a4"}
+
+
+def test_refresh_keeps_repos_not_confirmed_deleted(tmp_path):
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    ci_vcs.RefreshRefIndex()
+    index = ci_vcs.GetRefIndex()
+
+    # added since the last RefreshCatalog, it is discovered, indexed and added to the catalog
+    lib_ref = [{"mount_rel_path": "lib", "repo_url": "http://git1/test/lib", "name": "master"}]
+    vcs.AddRepo("web", heads={"master": "w1"}, refs={"master": lib_ref})
+    # the branches of "lib" can not be read, its index is kept
+    vcs.repos["lib"].GetBranches = lambda pattern: 1 / 0
+    stats = ci_vcs.RefreshRefIndex()
+    assert [error["url"] for error in stats["errors"]] == ["http://git1/test/lib"]
+    assert index.GetHeads("http://git1/test/web") == {"master": "w1"}
+    assert ci_vcs.GetCatalog().GetByUrl("http://git1/test/web")["support_ci"]
+    assert index.GetHeads("http://git1/test/lib") == {"master": "l1", "2401": "l2"}
+    assert ci_vcs.GetRefIndexAge() < 60
+
+    # the server can not be listed, nothing is removed
+    vcs.broken = True
+    stats = ci_vcs.RefreshRefIndex()
+    assert stats["errors"][0]["url"] is None
+    assert index.GetHeads("http://git1/test/app") == {"master": "a1", "2401": "a2", "2401_1": "a3"}
+
+    # only the repositories which are no longer listed are removed
+    vcs.broken = False
+    del vcs.repos["web"]
+    ci_vcs.RefreshRefIndex()
+    assert index.GetHeads("http://git1/test/web") == {}
+    assert index.GetHeads("http://git1/test/lib") != {}
+
+
+def test_find_referrers(tmp_path):
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    lib = ci_vcs.GetCiRepoByUrl("http://git1/test/lib")
+    referrers = ci_vcs.FindReferrers(lib, "2401.*")  # indexed on first use, the trunk is excluded
+    assert [referrer.GetPrimitiveName() for referrer in referrers] == ["2401_1"]
+
+    # the referrer no longer references "lib" at its new head
+    vcs.repos["app"].heads["2401_1"] = "a5"
+    vcs.repos["app"].refs["2401_1"] = []
+    assert ci_vcs.FindReferrers(lib, "2401.*") == []
+    assert ci_vcs.GetRefIndex().GetReferrers("http://git1/test/lib", "master")[0]["name"] == "master"
+
+
+def test_refresh_ref_of_branch_created_after_scan(tmp_path, monkeypatch):
+    monkeypatch.setenv("CI_WORKSPACE", str(tmp_path))
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    ci_vcs.RefreshRefIndex()
+
+    # created from the trunk of "app" after the scan, it is not in the index yet
+    app = vcs.repos["app"]
+    app.heads["2401_2"] = "a8"
+    app.refs["2401_2"] = [dict(ref) for ref in app.refs["master"]]
+    lib = ci_vcs.GetCiRepoByUrl("http://git1/test/lib")
+    referrers = ci_vcs.FindReferrers(lib, "2401.*")
+    assert sorted(referrer.GetPrimitiveName() for referrer in referrers) == ["2401_1", "2401_2"]
+
+    lib.GetBranch("2401").RefreshRef()
+    assert app.refs["2401_2"][0]["name"] == "2401"
+    assert ci_vcs.GetRefIndex().GetHead("http://git1/test/app", "2401_2") == "a8+"
+
+
+def test_get_referrers(tmp_path):
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    assert ci_vcs.GetRefIndexAge() is None
+    result = ci_vcs.GetReferrers("http://git1/test/lib", "master")
+    assert [(referrer["repo_url"], referrer["name"]) for referrer in result["referrers"]] == [
+        ("http://git1/test/app", "2401_1"), ("http://git1/test/app", "master")]
+    assert 0 <= result["index_age"] < 60
+
+    # answered by the index while it is not older than max_age
+    vcs.repos["app"].refs["master"] = []
+    vcs.repos["app"].heads["master"] = "a6"
+    assert len(ci_vcs.GetReferrers("http://git1/test/lib")["referrers"]) == 2
+    assert len(ci_vcs.GetReferrers("http://git1/test/lib", max_age=0)["referrers"]) == 1
+
+
+def test_ref_index_refresher(tmp_path):
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    ci_vcs.StartRefIndexRefresher(interval=0.05)
+    try:
+        for _ in range(100):
+            if ci_vcs.GetRefIndexAge() is not None:
+                break
+            time.sleep(0.05)
+        vcs.repos["app"].heads["2401_1"] = "a7"
+        vcs.repos["app"].refs["2401_1"] = []
+        for _ in range(100):
+            if ci_vcs.GetRefIndex().GetHead("http://git1/test/app", "2401_1") == "a7":
+                break
+            time.sleep(0.05)
+    finally:
+        ci_vcs.StopRefIndexRefresher()
+    assert len(ci_vcs.GetRefIndex().GetReferrers("http://git1/test/lib")) == 1
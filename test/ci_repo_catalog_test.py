@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+import os
+import sqlite3
+import threading
+
+from smartci.ci_repo_catalog import CiRepoCatalog
+from smartci.vcs.git.git_repo import GitRepo
+from smartci.vcs.git.git_vcs import Git
+
+
+def make_record(url, repo_id, group="Subsystem", name=None, support_ci=True, backend="git:http://127.0.0.1:8890"):
+    return {
+        "url": url,
+        "backend": backend,
+        "repo_id": repo_id,
+        "trunk": "master",
+        "group": group if support_ci else None,
+        "name": (name or url[url.rfind("/") + 1:]) if support_ci else None,
+        "settings_blob_id": "blob" + str(repo_id) if support_ci else None,
+        "support_ci": support_ci,
+    }
+
+
+def test_lookup(tmp_path):
+    catalog = CiRepoCatalog(os.path.join(tmp_path, "catalog.db"))
+    catalog.SaveAll([
+        make_record("http://127.0.0.1:8890/root/biz", 1),
+        make_record("http://127.0.0.1:8890/root/docs", 2, support_ci=False),
+    ])
+
+    record = catalog.GetByName("Subsystem", "biz")
+    assert record["url"] == "http://127.0.0.1:8890/root/biz"
+    assert record["repo_id"] == "1"
+    assert record["settings_blob_id"] == "blob1"
+    assert catalog.GetByRepoId("git:http://127.0.0.1:8890", 1)["name"] == "biz"
+
+    negative = catalog.GetByUrl("http://127.0.0.1:8890/root/docs")
+    assert negative is not None
+    assert not negative["support_ci"]
+    assert len(catalog.GetAll()) == 1
+    assert len(catalog.GetAll(support_ci=False)) == 2
+
+
+def test_refresh(tmp_path):
+    catalog = CiRepoCatalog(os.path.join(tmp_path, "catalog.db"))
+    svn_record = make_record("svn://localhost/Test/biz", "Test/biz", group="Test", backend="svn:svn://localhost")
+    catalog.SaveAll([make_record("http://127.0.0.1:8890/root/biz", 1),
+                     make_record("http://127.0.0.1:8890/root/omp", 2),
+                     svn_record])
+
+    # a full scan of the git server replaces its records only
+    catalog.SaveAll([make_record("http://127.0.0.1:8890/root/biz", 1)], ["git:http://127.0.0.1:8890"])
+    assert catalog.GetByUrl("http://127.0.0.1:8890/root/omp") is None
+    assert catalog.GetByUrl("svn://localhost/Test/biz") is not None
+
+    # the project has been moved to a new url
+    catalog.Save(make_record("http://127.0.0.1:8890/core/biz", 1))
+    assert catalog.GetByUrl("http://127.0.0.1:8890/root/biz") is None
+    assert catalog.GetByRepoId("git:http://127.0.0.1:8890", 1)["url"] == "http://127.0.0.1:8890/core/biz"
+
+    catalog.Remove("svn://localhost/Test/biz")
+    assert catalog.GetByName("Test", "biz") is None
+
+
+def test_concurrent_write(tmp_path):
+    db_path = os.path.join(tmp_path, "catalog.db")
+
+    def write(index):
+        catalog = CiRepoCatalog(db_path)
+        for i in range(20):
+            repo_id = index * 100 + i
+            catalog.Save(make_record(f"http://127.0.0.1:8890/root/repo{repo_id}", repo_id))
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(CiRepoCatalog(db_path).GetAll()) == 8 * 20
+
+
+def test_restore_git_repo_from_record(tmp_path):
+    git = Git("http://127.0.0.1:8890", "test", "test-token")
+    project = {"id": 7, "name": "Business Service", "web_url": "http://127.0.0.1:8890/root/biz",
+               "http_url_to_repo": "http://mirror.local/root/biz.git", "default_branch": "main"}
+    catalog = CiRepoCatalog(os.path.join(tmp_path, "catalog.db"))
+    catalog.Save(CiRepoCatalog.MakeRecord(GitRepo(git, project)))
+
+    repo = git.GetRepoFromRecord(catalog.GetByUrl("http://127.0.0.1:8890/root/biz"))
+    assert repo.project == project
+
+    # a record saved by an older version is looked up on the server instead
+    assert git.GetRepoFromRecord(dict(catalog.GetByUrl(project["web_url"]), repo_info={})) is None
+
+
+def test_upgrade_older_catalog(tmp_path):
+    db_path = os.path.join(tmp_path, "catalog.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE repo (url TEXT PRIMARY KEY, backend TEXT NOT NULL, repo_id TEXT NOT NULL, trunk TEXT, "
+                 "grp TEXT, name TEXT, settings_blob_id TEXT, support_ci INTEGER NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO repo VALUES ('http://127.0.0.1:8890/root/biz', 'git:http://127.0.0.1:8890', '1', "
+                 "'master', 'Subsystem', 'biz', 'blob1', 1, 0)")
+    conn.commit()
+    conn.close()
+
+    catalog = CiRepoCatalog(db_path)
+    assert catalog.GetByUrl("http://127.0.0.1:8890/root/biz")["repo_info"] == {}
+    catalog.Save(make_record("http://127.0.0.1:8890/root/omp", 2))
+    assert len(catalog.GetAll()) == 2
@@ -0,0 +1,29 @@
+# -*- coding:utf-8 -*-
+from fake_vcs import CreateCiVcs, FakeVcs
+
+
+def create_ci_vcs(tmp_path):
+    vcs = FakeVcs()
+    vcs.AddRepo("biz")
+    return vcs, CreateCiVcs([vcs], tmp_path=tmp_path)
+
+
+def test_no_request_until_needed(tmp_path):
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    ci_repo = ci_vcs.GetCiRepoByUrl("http://git1/test/biz")
+    assert ci_repo.GetUrl() == "http://git1/test/biz"
+    assert vcs.requests == []
+
+    # the settings have not changed, only their version is checked
+    assert ci_repo.GetName() == "biz"
+    assert ci_repo.GetGroup() == "test"
+    assert vcs.requests == ["version"]
+
+
+def test_settings_changed(tmp_path):
+    vcs, ci_vcs = create_ci_vcs(tmp_path)
+    vcs.repos["biz"].blob_id = "blob2"
+    ci_repo = ci_vcs.GetCiRepoByUrl("http://git1/test/biz")
+    assert ci_repo.GetName() == "biz"
+    assert vcs.requests == ["version", "file"]
+    assert ci_vcs.catalog.GetByUrl("http://git1/test/biz")["settings_blob_id"] == "blob2"
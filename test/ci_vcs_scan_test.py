@@ -0,0 +1,64 @@
+# -*- coding:utf-8 -*-
+import time
+
+from fake_vcs import CreateCiVcs, FakeVcs
+
+
+def make_vcs(address, count, concurrency, broken=False):
+    """
+    Repository n supports CI if n is even, and has the branch "feature" if n is a multiple of 3. Reading
+    ".ci/settings.yml" of repository 7 fails.
+    """
+    vcs = FakeVcs(address, concurrency, latency=0.01, broken=broken)
+    for i in range(1, count + 1):
+        vcs.AddRepo(f"repo{i}", heads={"feature": "f0"} if i % 3 == 0 else None,
+                    settings=f"name: repo{i}\ngroup: test\n" if i % 2 == 0 else None,
+                    error="500 Internal Server Error" if i == 7 else None)
+    return vcs
+
+
+def test_scan_all_vcs():
+    vcs1 = make_vcs("http://git1", 40, 4)
+    vcs2 = make_vcs("http://git2", 40, 2)
+    ci_vcs = CreateCiVcs([vcs1, make_vcs("http://git3", 10, 2, broken=True), vcs2])
+
+    repos = ci_vcs.GetAllRepoWithBranch("feature")
+    expected = [f"http://git1/test/repo{i}" for i in range(6, 41, 6)] + \
+               [f"http://git2/test/repo{i}" for i in range(6, 41, 6)]
+    assert [repo.GetUrl() for repo in repos] == expected
+    assert 1 < vcs1.max_running <= 4
+    assert vcs2.max_running <= 2
+
+    errors = sorted(ci_vcs.GetScanErrors(), key=lambda error: error["vcs"])
+    assert [(error["vcs"], error["url"]) for error in errors] == [
+        ("http://git1", "http://git1/test/repo7"),
+        ("http://git2", "http://git2/test/repo7"),
+        ("http://git3", None),
+    ]
+
+
+def test_iter_all_repo():
+    vcs1 = make_vcs("http://git1", 40, 4)
+    vcs2 = make_vcs("http://git2", 500, 2)
+    ci_vcs = CreateCiVcs([vcs1, make_vcs("http://git3", 10, 2, broken=True), vcs2])
+
+    repos = ci_vcs.IterAllRepoWithBranch("feature")
+    first = next(repos)
+    assert vcs2.listed < len(vcs2.repos)  # the first repository is yielded before the listing ends
+
+    urls = sorted([first.GetUrl()] + [repo.GetUrl() for repo in repos])
+    expected = [f"http://git1/test/repo{i}" for i in range(6, 41, 6)] + \
+               [f"http://git2/test/repo{i}" for i in range(6, 501, 6)]
+    assert urls == sorted(expected)
+    assert vcs2.max_running <= 2
+    assert sorted(error["vcs"] for error in ci_vcs.GetScanErrors()) == ["http://git1", "http://git2", "http://git3"]
+
+
+def test_iter_all_repo_stops_early():
+    vcs = make_vcs("http://git1", 500, 2)
+    ci_vcs = CreateCiVcs([vcs])
+    repos = ci_vcs.IterAllRepo()
+    next(repos)
+    repos.close()
+    time.sleep(0.2)
+    assert vcs.listed < len(vcs.repos)  # no more repositories are listed after the consumer stops
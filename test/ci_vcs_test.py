@@ -383,6 +383,29 @@ def test_set_protected():
     ci_repo.DeleteBranch(branch_name)
 
 
+def test_branch_listing_metadata():
+    ci_repo = git_repo_list[0]
+    branch_name = get_unique_name()
+    ci_branch = ci_repo.AddBranch(branch_name)
+    try:
+        util = ci_repo.GetPrimitiveVcs().util
+        ci_listed_branch = ci_repo.GetBranches(branch_name)[0]
+        request_count = util.GetStats()["requests"]
+        info = ci_listed_branch.GetLastCommitInfo()
+        ci_listed_branch.GetUrl()
+        ci_listed_branch.IsAllowedPush()
+        assert util.GetStats()["requests"] == request_count  # served from the listing
+        assert info["commit_id"] == ci_branch.GetLastCommitId()
+        assert ci_listed_branch.GetInfoAge() >= 0
+
+        ci_listed_branch.AddFile(get_unique_name() + ".txt", "hello world", "add test.txt")
+        assert ci_listed_branch.GetLastCommitId() != info["commit_id"]
+        ci_listed_branch.Refresh()
+        assert ci_listed_branch.GetInfoAge() < 60
+    finally:
+        ci_repo.DeleteBranch(branch_name)
+
+
 def delete_branch(ci_repo):
     branch_name = get_unique_name()
     ci_repo.AddBranch(branch_name)
@@ -406,6 +429,15 @@ def get_repo_by_url(ci_repo):
     assert tmp_ci_repo.GetUrl() == ci_repo.GetUrl()
 
 
+def test_get_git_project_by_url():
+    ci_repo = git_repo_list[0]
+    util = ci_repo.GetPrimitiveVcs().util
+    project = util.GetProjectByUrl(ci_repo.primitive_repo.GetHttpCloneUrl())
+    assert project is not None
+    assert project["web_url"] == ci_repo.GetUrl()
+    assert util.GetProjectByUrl(ci_repo.GetUrl() + get_unique_name()) is None
+
+
 
 def test_checkout_git_file():
     ci_repo = git_repo_list[0]
@@ -1000,12 +1032,37 @@ class TestVcs:
             assert ci_branch3.ContainsEntity(ci_branch1)
             assert ci_branch3.ContainsEntity(ci_branch2)
             assert ci_branch3.FileExists(test_file_name1)
+            assert ci_branch3.GetMergedEntities([ci_branch1, ci_branch2]) == [ci_branch1, ci_branch2]
+            assert ci_branch2.GetMergedEntities([ci_branch3, ci_branch1]) == [ci_branch1]
 
         finally:
             ci_repo.DeleteBranch(ci_branch1.GetName())
             ci_repo.DeleteBranch(ci_branch2.GetName())
             ci_repo.DeleteBranch(ci_branch3.GetName())
 
+    def test_delete_merged_branches(self, repo_list):
+        ci_repo = repo_list[0]
+        prefix = get_unique_name()
+        try:
+            ci_branch1 = ci_repo.AddBranch(prefix + "_1")
+            ci_branch2 = ci_repo.AddBranch(prefix + "_2")
+            ci_branch2.AddFile(get_unique_name() + ".txt", "hello world", "add test2.txt")
+
+            # branch1 has no commit of its own, it is only merged with include_unchanged
+            assert ci_repo.GetMergedBranches(prefix + "_.*") == []
+            assert ci_repo.DeleteMergedBranches(prefix + "_.*")["deleted"] == []
+            merged = ci_repo.GetMergedBranches(prefix + "_.*", include_unchanged=True)
+            assert [branch.GetName() for branch in merged] == [ci_branch1.GetName()]
+
+            report = ci_repo.DeleteMergedBranches(prefix + "_.*", include_unchanged=True)
+            assert report["merged"] == [ci_branch1.GetName()]
+            assert report["deleted"] == [ci_branch1.GetName()]
+            assert ci_repo.GetBranch(ci_branch1.GetName()) is None
+            assert ci_repo.GetBranch(ci_branch2.GetName()) is not None
+        finally:
+            ci_repo.DeleteBranch(prefix + "_1")
+            ci_repo.DeleteBranch(prefix + "_2")
+
     def test_add_webhook(self, repo_list):
         ci_repo = repo_list[0]
         try:
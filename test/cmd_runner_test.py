@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from smartci.util.cmd_runner import CmdError, CmdRunner
+
+
+def python_cmd(code):
+    return [sys.executable, "-c", code]
+
+
+def test_run():
+    lines = []
+    runner = CmdRunner(secrets=["secret-token"], on_output=lines.append)
+    output = runner.Run(python_cmd("print('hello'); print('secret-token')"))
+    assert output == "hello\nsecret-token\n"  # the output is returned as is
+    assert lines == ["hello\n", "******\n"]  # but redacted when streamed
+
+
+def test_failure_is_redacted():
+    runner = CmdRunner(secrets=["secret-token"])
+    with pytest.raises(CmdError) as e:
+        runner.Run(python_cmd("import sys; sys.stderr.write('bad secret-token'); sys.exit(3)"))
+    assert str(e.value) == "bad ******"
+    assert e.value.returncode == 3
+
+
+def test_timeout():
+    runner = CmdRunner(timeout=0.5)
+    start = time.time()
+    with pytest.raises(CmdError) as e:
+        runner.Run(python_cmd("import time; time.sleep(10)"))
+    assert time.time() - start < 5
+    assert e.value.returncode is None
+    assert CmdRunner.GetStats()["timeouts"] >= 1
+
+
+def test_concurrency_limit():
+    CmdRunner.SetConcurrency(2)
+    try:
+        async def run_all():
+            runner = CmdRunner()
+            return await asyncio.gather(*[runner.RunAsync(python_cmd("import time; time.sleep(0.5)"))
+                                          for _ in range(4)])
+
+        start = time.time()
+        asyncio.run(run_all())
+        assert time.time() - start >= 1.0  # 4 commands of 0.5s, 2 at a time
+    finally:
+        CmdRunner.SetConcurrency(CmdRunner.DEFAULT_CONCURRENCY)
+
+
+def test_run_inside_event_loop():
+    async def run():
+        return CmdRunner().Run(python_cmd("print('ok')"))
+
+    assert asyncio.run(run()) == "ok\n"
+
+
+def test_cancel_kills_process(tmp_path):
+    pid_path = tmp_path / "pid"
+
+    async def run():
+        task = asyncio.ensure_future(CmdRunner().RunAsync(python_cmd(
+            f"import os, time; open({str(pid_path)!r}, 'w').write(str(os.getpid())); time.sleep(10)")))
+        while not pid_path.exists() or pid_path.read_text() == "":
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.time()
+    asyncio.run(run())
+    assert time.time() - start < 5
+    with pytest.raises(ProcessLookupError):  # killed and reaped
+        os.kill(int(pid_path.read_text()), 0)
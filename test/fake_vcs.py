@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+"""
+An in-memory version control system shared by the tests of CiVcs, no server is required.
+
+Each test adds the repositories it needs with FakeVcs.AddRepo and reads the requests made to the "server" from
+FakeVcs.requests, e.g. ["version", "file"].
+"""
+import os
+import re
+import threading
+import time
+
+from smartci.ci_ref_index import CiRefIndex
+from smartci.ci_repo_catalog import CiRepoCatalog
+from smartci.ci_vcs import CiVcs
+
+
+class FakeEntity:
+    def __init__(self, repo, name):
+        self.repo = repo
+        self.name = name
+
+    def GetName(self):
+        return "trunk" if self.GetType() == "trunk" else self.name
+
+    def GetPrimitiveName(self):
+        return self.name
+
+    def GetType(self):
+        return "trunk" if self.name == self.repo.GetTrunkName() else "branch"
+
+    def GetLastCommitId(self):
+        return self.repo.heads[self.name]
+
+    def GetRefs(self):
+        self.repo.vcs.Request("refs")
+        return self.repo.refs.get(self.name, [])
+
+    def UpdateRefEntities(self, local_path, ref_entities):
+        """
+        Points the references of the entity to the given entities, as committing ".gitmodules" would.
+        """
+        changed = False
+        for ref in self.repo.refs.get(self.name, []):
+            for ref_entity in ref_entities:
+                if ref["repo_url"] == ref_entity.repo.GetUrl() and ref["name"] != ref_entity.name:
+                    ref["name"] = ref_entity.name
+                    changed = True
+        if changed:
+            self.repo.vcs.Request("update")
+            self.repo.heads[self.name] += "+"
+        return changed
+
+    def GetFileInfo(self, file_path):
+        self.repo.vcs.Request("file")
+        if self.repo.error is not None:
+            raise Exception(self.repo.error)
+        if self.repo.settings is None:
+            return None
+        return {"content": self.repo.settings, "blob_id": self.repo.blob_id}
+
+    def GetFileVersion(self, file_path):
+        self.repo.vcs.Request("version")
+        return self.repo.blob_id
+
+
+class FakeRepo:
+    def __init__(self, vcs, name, repo_id=1, heads=None, refs=None, settings=None, blob_id="blob1", error=None):
+        """
+        :param heads: {branch name: head}, the trunk "master" is always there.
+        :param refs: {branch name: [{"mount_rel_path": str, "repo_url": str, "name": str}]}.
+        :param settings: The content of ".ci/settings.yml", None if the repository does not support CI.
+        :param error: The error raised when reading ".ci/settings.yml".
+        """
+        self.vcs = vcs
+        self.name = name
+        self.repo_id = repo_id
+        self.heads = dict({"master": "h0"}, **(heads or {}))
+        self.refs = refs if refs is not None else {}
+        self.settings = settings
+        self.blob_id = blob_id
+        self.error = error
+
+    def GetUrl(self):
+        return f"{self.vcs.GetAddress()}/test/{self.name}"
+
+    def GetRepoId(self):
+        return self.repo_id
+
+    def GetTrunkName(self):
+        return "master"
+
+    def GetRecordInfo(self):
+        return {}
+
+    def GetTrunk(self):
+        return FakeEntity(self, "master")
+
+    def GetBranch(self, branch_name):
+        self.vcs.Request("branch")
+        return FakeEntity(self, branch_name) if branch_name in self.heads else None
+
+    def GetBranches(self, pattern):
+        return [FakeEntity(self, name) for name in self.heads if name != "master" and re.match(pattern, name)]
+
+
+class FakeVcs:
+    type = "git"
+
+    def __init__(self, address="http://git1", concurrency=4, latency=0, broken=False):
+        """
+        :param latency: The seconds each request takes, to observe the requests running at the same time.
+        :param broken: True if the repositories can not be listed.
+        """
+        self.address = address
+        self.concurrency = concurrency
+        self.latency = latency
+        self.broken = broken
+        self.repos = {}  # name -> FakeRepo
+        self.requests = []
+        self.listed = 0
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def AddRepo(self, name, **kwargs):
+        """
+        Adds a repository, see FakeRepo for the arguments. A repository supports CI by default.
+        """
+        kwargs.setdefault("repo_id", len(self.repos) + 1)
+        kwargs.setdefault("settings", f"name: {name}\ngroup: test\n")
+        repo = FakeRepo(self, name, **kwargs)
+        self.repos[name] = repo
+        return repo
+
+    def Request(self, kind):
+        with self.lock:
+            self.requests.append(kind)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            self.running -= 1
+
+    def Count(self, kind):
+        with self.lock:
+            return self.requests.count(kind)
+
+    def GetAddress(self):
+        return self.address
+
+    def IsSupportBatchLoad(self):
+        return False
+
+    def GetRepos(self):
+        return list(self.IterRepos())
+
+    def IterRepos(self):
+        if self.broken:
+            raise Exception("connection refused")
+        for repo in list(self.repos.values()):
+            self.listed += 1
+            yield repo
+
+    def GetRepoFromRecord(self, record):
+        return self.repos.get(record["url"].split("/")[-1])
+
+    def GetRepoByUrl(self, url):
+        self.Request("repo")
+        return self.repos.get(url.split("/")[-1])
+
+
+def CreateCiVcs(vcs_list, tmp_path=None, cache=None):
+    """
+    Creates a CiVcs of the fake version control systems. With tmp_path, the catalog and the reference index are
+    created under it and the catalog records the repositories supporting CI.
+    """
+    ci_vcs = CiVcs(vcs_list, cache)
+    if tmp_path is not None:
+        ci_vcs.catalog = CiRepoCatalog(os.path.join(tmp_path, "catalog.db"))
+        ci_vcs.ref_index = CiRefIndex(os.path.join(tmp_path, "ref_index.db"))
+        for vcs in vcs_list:
+            for repo in vcs.repos.values():
+                if repo.settings is not None:
+                    ci_vcs.catalog.Save({"url": repo.GetUrl(), "backend": f"{vcs.type}:{vcs.GetAddress()}",
+                                         "repo_id": repo.repo_id, "trunk": "master", "group": "test",
+                                         "name": repo.name, "settings_blob_id": repo.blob_id, "support_ci": True})
+    return ci_vcs
@@ -0,0 +1,186 @@
+# -*- coding:utf-8 -*-
+import asyncio
+import base64
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from smartci.ci_async_vcs import AsyncCiVcs
+from smartci.ci_repo_catalog import CiRepoCatalog
+from smartci.vcs.git.git_util import GitUtil
+
+"""
+A local stand-in of the gitlab rest api, no gitlab server is required.
+There are 250 projects, project n has ".ci/settings.yml" if n is even, and has the branch "feature" if n is a
+multiple of 3. Reading the files of project 10 fails, and "test/alias7" resolves to project 7, moved to "test/repo7".
+"""
+
+PROJECT_COUNT = 250
+in_flight = {"current": 0, "max": 0}
+in_flight_lock = threading.Lock()
+
+
+class RestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with in_flight_lock:
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+        try:
+            time.sleep(0.01)
+            self.__Handle()
+        finally:
+            with in_flight_lock:
+                in_flight["current"] -= 1
+
+    def __Handle(self):
+        address = f"http://127.0.0.1:{self.server.server_address[1]}"
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.split("/")[4:]  # after /api/v4/projects
+        if len(parts) == 0:
+            per_page = int(query["per_page"][0])
+            page = int(query["page"][0])
+            ids = range((page - 1) * per_page + 1, min(page * per_page, PROJECT_COUNT) + 1)
+            projects = [{"id": i, "name": f"repo{i}", "default_branch": "master",
+                         "web_url": f"{address}/test/repo{i}",
+                         "http_url_to_repo": f"{address}/test/repo{i}.git"} for i in ids]
+            total_pages = (PROJECT_COUNT + per_page - 1) // per_page
+            return self.__Reply(200, projects, {"X-Total-Pages": str(total_pages)})
+
+        if not parts[0].isdigit():  # project by path, e.g. "test%2Frepo3"
+            project_id = int(re.sub(r"\D", "", unquote(parts[0])))
+            return self.__Reply(200, {"id": project_id, "name": f"repo{project_id}", "default_branch": "master",
+                                      "web_url": f"{address}/test/repo{project_id}",
+                                      "http_url_to_repo": f"{address}/test/repo{project_id}.git"})
+        project_id = int(parts[0])
+        if parts[1:3] == ["repository", "files"]:
+            if project_id == 10:
+                return self.__Reply(500, {"message": "500 Internal Server Error"})
+            if project_id % 2 != 0 or unquote(parts[3]) != ".ci/settings.yml":
+                return self.__Reply(404, {"message": "404 File Not Found"})
+            content = f"name: repo{project_id}\ngroup: test\n".encode("utf-8")
+            return self.__Reply(200, {"content": base64.b64encode(content).decode("ascii"),
+                                      "blob_id": f"blob{project_id}"})
+        if parts[1:3] == ["repository", "branches"]:
+            if project_id % 3 != 0 or unquote(parts[3]) != "feature":
+                return self.__Reply(404, {"message": "404 Branch Not Found"})
+            return self.__Reply(200, {"name": "feature", "merged": False, "protected": False,
+                                      "commit": {"id": f"sha{project_id}", "committer_email": "ci@test.com",
+                                                 "created_at": "2024-01-01T00:00:00Z", "message": "init\n"}})
+        self.__Reply(404, {"message": "404 Not Found"})
+
+    def __Reply(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def address():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def create_ci_vcs(address, tmp_path=None):
+    ci_vcs = AsyncCiVcs.Create(f"""
+vcs:
+  - type: git
+    url: {address}
+    username: test
+    access_token: test-token
+    async_concurrency: 16
+    http2: false
+    http_page_workers: 2
+""")
+    if tmp_path is not None:
+        ci_vcs.catalog = CiRepoCatalog(os.path.join(tmp_path, "catalog.db"))
+    return ci_vcs
+
+
+def test_get_all_repo_with_branch(address):
+    async def run():
+        async with create_ci_vcs(address) as ci_vcs:
+            repos = await ci_vcs.GetAllRepoWithBranch("feature")
+            branch = await repos[0].GetBranch("feature")
+            return repos, await branch.GetLastCommitId(), ci_vcs.vcs_list[0].util.GetStats(), ci_vcs.GetScanErrors()
+
+    in_flight["max"] = 0
+    repos, commit_id, stats, errors = asyncio.run(run())
+    assert [repo.GetName() for repo in repos] == [f"repo{i}" for i in range(1, PROJECT_COUNT + 1) if i % 6 == 0]
+    assert repos[0].GetGroup() == "test"
+    assert repos[0].GetSettingsBlobId() == "blob6"
+    assert commit_id == "sha6"
+    assert 1 < in_flight["max"] <= stats["concurrency"]
+    # the failed repository is reported instead of failing the whole scan
+    assert [error["url"] for error in errors] == [f"{address}/test/repo10"]
+
+
+def test_get_repo(address, tmp_path):
+    async def run(tmp_path):
+        async with create_ci_vcs(address, tmp_path) as ci_vcs:
+            return (await ci_vcs.GetRepo("test", "repo4"),
+                    await ci_vcs.GetRepoByUrl(f"{address}/test/repo8.git"),
+                    await ci_vcs.GetRepoByUrl(f"{address}/test/repo3"),
+                    await ci_vcs.GetRepoByUrl(f"{address}/test/alias7"))
+
+    repo, repo_by_url, unsupported, moved = asyncio.run(run(tmp_path))
+    assert repo.GetUrl() == f"{address}/test/repo4"
+    assert repo_by_url.GetName() == "repo8"
+    assert unsupported is None  # without .ci/settings.yml
+    assert moved is None  # the project found by the path has another url
+
+
+def test_get_repo_from_catalog(address, tmp_path):
+    async def run():
+        async with create_ci_vcs(address, tmp_path) as ci_vcs:
+            await ci_vcs.GetRepo("test", "repo4")  # scans all projects and fills the catalog
+        async with create_ci_vcs(address, tmp_path) as ci_vcs:
+            repo = await ci_vcs.GetRepo("test", "repo6")
+            return repo, ci_vcs.vcs_list[0].util.GetStats()
+
+    repo, stats = asyncio.run(run())
+    assert repo.GetUrl() == f"{address}/test/repo6"
+    assert stats["requests"] == 1  # only the settings of the repository are read again
+
+
+def test_iter_pages_stops_with_consumer(address, monkeypatch):
+    monkeypatch.setattr(GitUtil, "PER_PAGE", 10)
+
+    async def run():
+        async with create_ci_vcs(address) as ci_vcs:
+            util = ci_vcs.vcs_list[0].util
+            pages = util.IterPages(util.url, action="get projects")
+            ids = [project["id"] async for project in take(pages, 15)]
+            await pages.aclose()
+            return ids, util.GetStats()
+
+    ids, stats = asyncio.run(run())
+    assert ids == list(range(1, 16))
+    assert stats["requests"] <= 1 + 2 + 1  # the first page and the window of 2 pages, not all 25 pages
+
+
+async def take(items, count):
+    async for item in items:
+        yield item
+        count -= 1
+        if count == 0:
+            return
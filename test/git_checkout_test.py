@@ -0,0 +1,61 @@
+# -*- coding:utf-8 -*-
+import os
+import subprocess
+
+from smartci.util.cmd_runner import CmdRunner
+from smartci.vcs.git.git_util import GitUtil
+from smartci.vcs.git.git_vcs import Git
+
+
+def test_default_checkout_cmds():
+    util = Git("http://127.0.0.1:8890", "test", "test-token").util
+    clone, recursive, remote = GitUtil.MakeCheckOutCmds("http://127.0.0.1:8890/root/biz.git", "master", "/tmp/biz",
+                                                        util.checkout_options)
+    assert clone == ["git", "clone", "--single-branch", "-b", "master", "--filter=blob:none",
+                     "http://127.0.0.1:8890/root/biz.git", "/tmp/biz"]
+    assert recursive == ["git", "submodule", "update", "--init", "--recursive", "--depth", "1", "--jobs", "4"]
+    assert remote == ["git", "submodule", "update", "--init", "--remote", "--depth", "1", "--jobs", "4"]
+
+
+def test_full_checkout_cmds():
+    util = Git("http://127.0.0.1:8890", "test", "test-token",
+               {"checkout": {"filter": None, "shallow_submodules": False, "jobs": None}}).util
+    options = dict(util.checkout_options, depth=1)
+    clone, recursive, remote = GitUtil.MakeCheckOutCmds("http://127.0.0.1:8890/root/biz.git", "master", "/tmp/biz",
+                                                        options)
+    assert clone[5:7] == ["--depth", "1"]
+    assert recursive == ["git", "submodule", "update", "--init", "--recursive"]
+    assert remote == ["git", "submodule", "update", "--init", "--remote"]
+
+
+def test_add_and_commit_run_through_cmd_runner(tmp_path, monkeypatch):
+    for key, value in {"GIT_AUTHOR_NAME": "ci", "GIT_AUTHOR_EMAIL": "ci@test.com", "GIT_COMMITTER_NAME": "ci",
+                       "GIT_COMMITTER_EMAIL": "ci@test.com"}.items():
+        monkeypatch.setenv(key, value)
+    util = Git("http://127.0.0.1:8890", "test", "test-token").util
+    bare = str(tmp_path / "biz.git")
+    local_path = str(tmp_path / "biz")
+    subprocess.check_output(["git", "init", "-q", "--bare", "-b", "master", bare])
+    subprocess.check_output(["git", "clone", "-q", bare, local_path], stderr=subprocess.STDOUT)
+    with open(os.path.join(local_path, "a.txt"), "w") as f:
+        f.write("a")
+    commands = CmdRunner.GetStats()["commands"]
+    util.AddToControl(local_path, "a.txt")
+    util.Commit(local_path, "add a")
+    assert CmdRunner.GetStats()["commands"] == commands + 3
+    assert subprocess.check_output(["git", "log", "--format=%s", "master"], cwd=bare).decode() == "add a\n"
+
+
+def test_partial_checkout_skips_dissociated_mirror(tmp_path, monkeypatch):
+    def checkout_cmds(dissociate):
+        util = Git("http://127.0.0.1:8890", "test", "test-token", {"mirror_cache": {
+            "path": str(tmp_path / "mirrors"), "dissociate": dissociate}}).util
+        cmds = []
+        monkeypatch.setattr(util, "_GitUtil__RunGitCmd", lambda cmd, cwd=None: cmds.append(cmd))
+        util.CheckOut(str(tmp_path / "biz"), "http://127.0.0.1:8890/root/biz.git", "master")
+        return cmds
+
+    # dissociating would copy the whole history of the mirror into the partial clone
+    assert [cmd[1] for cmd in checkout_cmds(True)] == ["clone", "submodule", "submodule"]
+    clone = [cmd for cmd in checkout_cmds(False) if cmd[1] == "clone"][0]
+    assert "--reference" in clone and "--dissociate" not in clone
@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from smartci.vcs.git.git_graphql import GitGraphQL
+from smartci.vcs.git.git_repo import GitRepo
+from smartci.vcs.git.git_vcs import Git
+
+"""
+A local stand-in of the gitlab GraphQL api, no gitlab server is required.
+Project n has ".ci/settings.yml" if n is even, and has the queried branch if n is a multiple of 3.
+"""
+
+queries = []
+
+
+class GraphQLHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        variables = body["variables"]
+        queries.append(variables)
+        nodes = []
+        for gid in variables["ids"]:
+            project_id = int(gid.split("/")[-1])
+            blobs = []
+            if project_id % 2 == 0:
+                blobs.append({"path": variables["paths"][0], "oid": f"blob{project_id}",
+                              "rawBlob": f"name: repo{project_id}\ngroup: test\n"})
+            repository = {"rootRef": "master", "blobs": {"nodes": blobs}}
+            if variables["withBranch"]:
+                sha = f"sha{project_id}" if project_id % 3 == 0 else None
+                repository["branch"] = {"lastCommit": {"sha": sha} if sha is not None else None}
+            nodes.append({"id": gid, "repository": repository})
+        data = json.dumps({"data": {"projects": {"nodes": nodes}}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def address():
+    server = HTTPServer(("127.0.0.1", 0), GraphQLHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_load_projects(address):
+    vcs = Git(address, "test", "test-token", {"graphql": True})
+    infos = vcs.graphql.LoadProjects([1, 2, 3, 6], ".ci/settings.yml", "feature")
+    assert infos[1]["file"] is None
+    assert infos[2]["file"] == {"content": "name: repo2\ngroup: test\n", "blob_id": "blob2"}
+    assert infos[2]["branch_sha"] is None
+    assert infos[3]["branch_sha"] == "sha3"
+    assert infos[6]["default_branch"] == "master"
+
+
+def test_batch_load_repos(address):
+    vcs = Git(address, "test", "test-token", {"graphql": True})
+    repos = []
+    for project_id in range(1, 251):
+        project = {"id": project_id, "name": f"repo{project_id}", "default_branch": "master",
+                   "web_url": f"{address}/test/repo{project_id}",
+                   "http_url_to_repo": f"{address}/test/repo{project_id}.git"}
+        repos.append(GitRepo(vcs, project))
+
+    queries.clear()
+    infos = vcs.BatchLoadRepos(repos, ".ci/settings.yml")
+    assert len(queries) == 3  # 250 projects in batches of GitGraphQL.BATCH_SIZE
+    assert all(len(query["ids"]) <= GitGraphQL.BATCH_SIZE for query in queries)
+    assert len(infos) == len(repos)
+    assert [info["file"] is not None for info in infos] == [project_id % 2 == 0 for project_id in range(1, 251)]
@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+import os
+import subprocess
+
+from smartci.util.cmd_runner import CmdRunner
+from smartci.util.file_lock import FileLock
+from smartci.vcs.git.git_mirror import GitMirrorCache
+
+ENV = dict(os.environ, GIT_AUTHOR_NAME="ci", GIT_AUTHOR_EMAIL="ci@test.com", GIT_COMMITTER_NAME="ci",
+           GIT_COMMITTER_EMAIL="ci@test.com")
+
+
+def run(cmd, cwd=None):
+    return subprocess.check_output(cmd, cwd=cwd, env=ENV, stderr=subprocess.STDOUT).decode()
+
+
+def run_git_cmd(cmd, cwd=None):
+    return CmdRunner().Run(cmd, cwd=cwd)
+
+
+def make_repo(root, name):
+    work = os.path.join(root, name + ".work")
+    run(["git", "init", "-q", "-b", "master", work])
+    commit(work, "first")
+    bare = os.path.join(root, name + ".git")
+    run(["git", "clone", "-q", "--bare", work, bare])
+    run(["git", "remote", "add", "bare", bare], cwd=work)
+    return work, "file://" + bare
+
+
+def commit(work, message):
+    with open(os.path.join(work, "data.txt"), "a") as f:
+        f.write(message + "\n")
+    run(["git", "add", "-A"], cwd=work)
+    run(["git", "commit", "-q", "-m", message], cwd=work)
+
+
+def test_clone_borrows_objects_of_mirror(tmp_path):
+    work, url = make_repo(str(tmp_path), "biz")
+    cache = GitMirrorCache(str(tmp_path / "mirrors"))
+    local_path = str(tmp_path / "checkout")
+    with cache.Use(url, url, run_git_cmd) as clone_args:
+        assert clone_args == ["--reference", cache.GetMirrorPath(url)]
+        run_git_cmd(["git", "clone", "-q"] + clone_args + [url, local_path])
+    with open(os.path.join(local_path, ".git", "objects", "info", "alternates")) as f:
+        assert f.read().strip() == os.path.join(cache.GetMirrorPath(url), "objects")
+
+    # the next use fetches the new commits into the existing mirror
+    commit(work, "second")
+    run(["git", "push", "-q", "bare", "master"], cwd=work)
+    with cache.Use(url, url, run_git_cmd):
+        pass
+    head = run(["git", "rev-parse", "master"], cwd=work).strip()
+    assert run(["git", "rev-parse", "master"], cwd=cache.GetMirrorPath(url)).strip() == head
+
+
+def test_dissociated_clone(tmp_path):
+    _, url = make_repo(str(tmp_path), "biz")
+    cache = GitMirrorCache(str(tmp_path / "mirrors"), dissociate=True)
+    local_path = str(tmp_path / "checkout")
+    with cache.Use(url, url, run_git_cmd) as clone_args:
+        assert clone_args[-1] == "--dissociate"
+        run_git_cmd(["git", "clone", "-q"] + clone_args + [url, local_path])
+    assert not os.path.exists(os.path.join(local_path, ".git", "objects", "info", "alternates"))
+
+
+def test_evict_least_recently_used(tmp_path):
+    urls = [make_repo(str(tmp_path), name)[1] for name in ["a", "b", "c"]]
+    cache = GitMirrorCache(str(tmp_path / "mirrors"))
+    for i, url in enumerate(urls):
+        with cache.Use(url, url, run_git_cmd):
+            pass
+        os.utime(cache.GetMirrorPath(url) + ".use", (1000 + i, 1000 + i))
+    assert [mirror["path"] for mirror in cache.GetMirrors()] == [cache.GetMirrorPath(url) for url in urls]
+
+    cache.max_size = 0
+    lock = FileLock(cache.GetMirrorPath(urls[0]) + ".use", shared=True)  # "a" in use by another job
+    lock.Acquire()
+    try:
+        removed = cache.Evict()
+    finally:
+        lock.Release()
+    assert removed == [cache.GetMirrorPath(urls[1]), cache.GetMirrorPath(urls[2])]
+    assert os.path.exists(cache.GetMirrorPath(urls[0]))
+
+
+def test_mirror_in_use_is_not_evicted(tmp_path):
+    _, url = make_repo(str(tmp_path), "biz")
+    cache = GitMirrorCache(str(tmp_path / "mirrors"))
+    other_job = GitMirrorCache(str(tmp_path / "mirrors"), max_size_mb=0)
+    local_path = str(tmp_path / "checkout")
+    with cache.Use(url, url, run_git_cmd) as clone_args:
+        assert other_job.Evict() == []  # from the fetch until the clone is done
+        run_git_cmd(["git", "clone", "-q"] + clone_args + [url, local_path])
+    assert other_job.Evict() == [cache.GetMirrorPath(url)]
+
+
+def test_size_skips_files_removed_while_walking(tmp_path, monkeypatch):
+    _, url = make_repo(str(tmp_path), "biz")
+    cache = GitMirrorCache(str(tmp_path / "mirrors"))
+    with cache.Use(url, url, run_git_cmd):
+        pass
+    getsize = os.path.getsize
+
+    def removed_by_gc(path):
+        if path.endswith("HEAD"):
+            raise FileNotFoundError(path)
+        return getsize(path)
+
+    monkeypatch.setattr(os.path, "getsize", removed_by_gc)
+    assert cache.GetMirrors()[0]["size"] > 0
@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+import pytest
+
+from smartci.vcs.git.git_repo import GitRepo
+from smartci.vcs.git.git_vcs import Git
+
+PROJECT = {"id": 1, "name": "biz", "web_url": "http://127.0.0.1:8890/root/biz",
+           "http_url_to_repo": "http://127.0.0.1:8890/root/biz.git", "default_branch": "master"}
+
+
+def make_repo(monkeypatch):
+    git = Git("http://127.0.0.1:8890", "test", "test-token")
+    monkeypatch.setattr(git.util, "GetBranch", lambda project_id, branch_name: {"name": branch_name})
+    return GitRepo(git, PROJECT)
+
+
+def test_get_default_branch_as_trunk(monkeypatch):
+    trunk = make_repo(monkeypatch).GetBranch("master")
+    assert trunk.GetType() == "trunk"
+    assert trunk.GetName() == "trunk"
+    assert trunk.GetPrimitiveName() == "master"
+
+
+def test_get_branch(monkeypatch):
+    branch = make_repo(monkeypatch).GetBranch("feature")
+    assert branch.GetType() == "branch"
+    assert branch.GetName() == "feature"
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.reason = "Not Found" if status_code == 404 else "No Content"
+
+
+def test_delete_branch_not_found(monkeypatch):
+    git = Git("http://127.0.0.1:8890", "test", "test-token")
+    deleted = []
+    monkeypatch.setattr(git.util.session, "delete", lambda url, headers: deleted.append(url) or Response(404))
+    monkeypatch.setattr(git.util, "GetBranch", lambda project_id, branch_name: None)
+    git.util.DeleteBranch(1, "feature/a")  # already deleted
+    assert deleted == ["http://127.0.0.1:8890/api/v4/projects/1/repository/branches/feature%2Fa"]
+
+    # the branch is still there, e.g. without the permission to delete it
+    monkeypatch.setattr(git.util, "GetBranch", lambda project_id, branch_name: {"name": branch_name})
+    with pytest.raises(Exception, match="delete branch failed"):
+        git.util.DeleteBranch(1, "feature/a")
+
+
+def test_merged_branches_exclude_unchanged(monkeypatch):
+    git = Git("http://127.0.0.1:8890", "test", "test-token")
+
+    def commit(commit_id):
+        return {"id": commit_id, "committer_email": "ci@test.com", "created_at": "2024-01-01T00:00:00Z",
+                "message": ""}
+
+    branches = [{"name": "2401_1", "merged": True, "protected": False, "commit": commit("c1")},
+                {"name": "2401_2", "merged": True, "protected": False, "commit": commit("c0")},  # just created
+                {"name": "2401_3", "merged": False, "protected": False, "commit": commit("c3")}]
+    monkeypatch.setattr(git.util, "ListBranches", lambda project_id, regex: branches)
+    monkeypatch.setattr(git.util, "GetBranch", lambda project_id, branch_name: {"name": branch_name,
+                                                                                 "commit": commit("c0")})
+    repo = GitRepo(git, PROJECT)
+    assert [branch.GetPrimitiveName() for branch in repo.GetMergedBranches("2401_.*")] == ["2401_1"]
+    merged = repo.GetMergedBranches("2401_.*", include_unchanged=True)
+    assert [branch.GetPrimitiveName() for branch in merged] == ["2401_1", "2401_2"]
@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+import json
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from smartci.vcs.git.git_vcs import Git
+
+"""
+A local stand-in of the gitlab rest api serving ".gitmodules" and recording the commits, no gitlab server is required.
+"""
+
+GITMODULES = """[submodule "lib/omp"]
+path = lib/omp
+url = http://localhost/root/omp.git
+branch = master
+
+[submodule "lib/cppf"]
+path = lib/cppf
+url = http://localhost/root/cppf.git
+branch = master
+
+"""
+commits = []
+
+
+class RestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if ".gitmodules/raw" not in self.path:
+            return self.__Reply(404, b"")
+        self.__Reply(200, GITMODULES.encode("utf-8"))
+
+    def do_POST(self):
+        commits.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        self.__Reply(201, json.dumps({"id": "sha1"}).encode("utf-8"))
+
+    def __Reply(self, status, data):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def util():
+    server = HTTPServer(("127.0.0.1", 0), RestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield Git(f"http://127.0.0.1:{server.server_address[1]}", "test", "test-token").util
+    server.shutdown()
+
+
+def test_update_submodules_in_one_commit(util):
+    commits.clear()
+    changed = util.UpdateSubModules(1, "feature", {"http://localhost/root/omp.git": "feature",
+                                                   "http://localhost/root/cppf.git": "feature"})
+    assert changed
+    assert len(commits) == 1
+    assert commits[0]["branch"] == "feature"
+    assert [action["file_path"] for action in commits[0]["actions"]] == [".gitmodules"]
+    assert commits[0]["actions"][0]["content"].count("branch = feature") == 2
+
+
+def test_skip_up_to_date_submodules(util):
+    commits.clear()
+    assert not util.UpdateSubModule(1, "feature", "http://localhost/root/omp.git", "master")
+    assert not util.UpdateSubModule(1, "feature", "http://localhost/root/other.git", "feature")
+    assert commits == []
+
+
+def test_remove_submodule_without_clone(util, tmp_path):
+    commits.clear()
+    util.RemoveSubModuleByMountRelPath(str(tmp_path), 1, "feature", "http://localhost/root/biz.git", "lib/omp")
+    assert len(commits) == 1
+    assert [action["action"] for action in commits[0]["actions"]] == ["update", "delete"]
+    assert "lib/omp" not in commits[0]["actions"][0]["content"]
+    assert list(tmp_path.iterdir()) == []  # nothing cloned
+
+
+def test_add_submodule_reads_gitmodules_of_clone(util, tmp_path, monkeypatch):
+    # the credentials inserted into the clone url are dropped for file://
+    for key, value in {"GIT_AUTHOR_NAME": "ci", "GIT_AUTHOR_EMAIL": "ci@test.com", "GIT_COMMITTER_NAME": "ci",
+                       "GIT_COMMITTER_EMAIL": "ci@test.com", "GIT_CONFIG_COUNT": "1",
+                       "GIT_CONFIG_KEY_0": "url.file:///.insteadOf",
+                       "GIT_CONFIG_VALUE_0": "file://test:test-token@/"}.items():
+        monkeypatch.setenv(key, value)
+    work = str(tmp_path / "biz.work")
+    bare = str(tmp_path / "biz.git")
+    subprocess.check_output(["git", "init", "-q", "-b", "feature", work])
+    # pushed after the rest api was read, e.g. by another job
+    with open(f"{work}/.gitmodules", "w") as f:
+        f.write('[submodule "lib/new"]\npath = lib/new\nurl = http://localhost/root/new.git\nbranch = master\n')
+    subprocess.check_output(["git", "add", ".gitmodules"], cwd=work)
+    subprocess.check_output(["git", "commit", "-q", "-m", "add lib/new"], cwd=work)
+    subprocess.check_output(["git", "clone", "-q", "--bare", work, bare], stderr=subprocess.STDOUT)
+    head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=work).decode().strip()
+
+    util.AddSubModule(str(tmp_path / "tmp"), 1, "feature", "file://" + bare, "http://localhost/root/omp2.git",
+                      "master", head, "lib/omp2")
+    content = subprocess.check_output(["git", "show", "feature:.gitmodules"], cwd=bare).decode()
+    assert '[submodule "lib/new"]' in content and '[submodule "lib/omp2"]' in content
+    assert "lib/cppf" not in content  # the content of the rest api is not used
+    assert subprocess.check_output(["git", "ls-tree", "feature", "lib/omp2"], cwd=bare).decode().startswith("160000")
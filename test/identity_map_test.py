@@ -0,0 +1,82 @@
+# -*- coding:utf-8 -*-
+import threading
+import time
+
+from smartci.util.identity_map import IdentityMap
+
+from fake_vcs import CreateCiVcs, FakeEntity, FakeRepo, FakeVcs
+
+
+def test_lru_eviction():
+    identity_map = IdentityMap(max_size=2, ttl=None)
+    identity_map.Put("a", 1)
+    identity_map.Put("b", 2)
+    assert identity_map.Get("a") == 1  # "b" becomes the least recently used
+    identity_map.Put("c", 3)
+    assert identity_map.Get("b") is None
+    assert identity_map.Get("a") == 1
+    assert identity_map.Get("c") == 3
+    assert len(identity_map) == 2
+
+
+def test_ttl():
+    identity_map = IdentityMap(ttl=0.1)
+    identity_map.Put("a", 1)
+    assert identity_map.Get("a") == 1
+    time.sleep(0.15)
+    assert identity_map.Get("a") is None
+    assert len(identity_map) == 0
+
+
+def test_get_or_create_concurrently():
+    identity_map = IdentityMap()
+    created = []
+
+    def create():
+        time.sleep(0.05)
+        obj = object()
+        created.append(obj)
+        return obj
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(identity_map.GetOrCreate("a", create)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4
+    assert all(result is results[0] for result in results)
+
+
+def test_disabled():
+    identity_map = IdentityMap(max_size=0)
+    assert identity_map.GetOrCreate("a", lambda: 1) == 1
+    assert identity_map.Get("a") is None
+
+
+def test_ci_vcs_identity_map():
+    vcs = FakeVcs()
+    ci_vcs = CreateCiVcs([vcs], cache={"max_size": 10, "ttl": 60})
+
+    def biz():  # a new primitive repository each time, as returned by a listing
+        return FakeRepo(vcs, "biz", settings="group: test\n")
+
+    ci_repo = ci_vcs.CreateCiRepo(biz())
+    assert ci_vcs.CreateCiRepo(biz()) is ci_repo
+    assert ci_vcs.GetCiRepoByUrl("http://git1/test/biz") is ci_repo
+    assert vcs.requests == []  # ".ci/settings.yml" is read on first use
+    assert ci_repo.GetGroup() == "test"
+    assert ci_vcs.GetCiRepoByUrl("http://git1/test/biz").GetName() == "biz"
+    assert vcs.Count("file") == 1
+
+    branch = ci_vcs.CreateCiVersionEntity(ci_repo, FakeEntity(ci_repo.primitive_repo, "feature"))
+    assert ci_vcs.CreateCiVersionEntity(ci_repo, FakeEntity(ci_repo.primitive_repo, "feature")) is branch
+    assert ci_vcs.CreateCiVersionEntity(ci_repo, FakeEntity(ci_repo.primitive_repo, "master")) is not branch
+    fresh = FakeEntity(ci_repo.primitive_repo, "feature")  # e.g. read again after a push
+    assert ci_vcs.CreateCiVersionEntity(ci_repo, fresh) is branch
+    assert branch.GetPrimitiveEntity() is fresh
+
+    ci_vcs.ClearIdentityMap()
+    assert ci_vcs.CreateCiRepo(biz()).GetName() == "biz"
+    assert vcs.Count("file") == 2
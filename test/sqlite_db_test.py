@@ -0,0 +1,28 @@
+# -*- coding:utf-8 -*-
+import os
+
+import pytest
+
+from smartci.util.sqlite_db import SqliteDb
+
+SCHEMA = ["CREATE TABLE IF NOT EXISTS item (name TEXT PRIMARY KEY)"]
+
+
+def test_transaction_rolled_back_on_error(tmp_path):
+    db = SqliteDb(os.path.join(tmp_path, "test.db"), "test.db", SCHEMA)
+    with db.Transaction() as conn:
+        conn.execute("INSERT INTO item (name) VALUES (?)", ("a",))
+    with pytest.raises(ValueError):
+        with db.Transaction() as conn:
+            conn.execute("INSERT INTO item (name) VALUES (?)", ("b",))
+            raise ValueError()
+    assert [row["name"] for row in db.Query("SELECT name FROM item")] == ["a"]
+    assert db.Query("PRAGMA journal_mode")[0][0] == "wal"
+
+
+def test_default_path_under_ci_workspace(tmp_path, monkeypatch):
+    monkeypatch.setenv("CI_WORKSPACE", str(tmp_path))
+    assert SqliteDb(None, "test.db", SCHEMA).db_path == os.path.join(tmp_path, "test.db")
+    monkeypatch.delenv("CI_WORKSPACE")
+    with pytest.raises(Exception):
+        SqliteDb(None, "test.db", SCHEMA)